@@ -1,9 +1,13 @@
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import loans, repayments, users, auth
+from .routers import loans, repayments, users, auth, export
 from .services import auth_service
+from .services.idempotency import IDEMPOTENT_REPLAYED_HEADER
+from .services.pagination import NEXT_CURSOR_HEADER
+from .services.serialization import MoneyJSONResponse
 
-app = FastAPI(title="LoanSyncro API")
+# Decimals reach the response body as exact numbers instead of being rounded through float
+app = FastAPI(title="LoanSyncro API", default_response_class=MoneyJSONResponse)
 
 # Configure CORS
 app.add_middleware(
@@ -12,6 +16,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, IDEMPOTENT_REPLAYED_HEADER, "ETag"],
 )
 
 # Include routers
@@ -29,6 +34,16 @@ app.include_router(
     prefix="/repayments",
     dependencies=[Depends(auth_service.get_current_user)]
 )
+app.include_router(
+    export.router,
+    tags=["Export"],
+    prefix="/export",
+    dependencies=[Depends(auth_service.get_current_user)]
+)
+
+@app.on_event("startup")
+def prefetch_jwks():
+    auth_service.start_jwks_refresh()
 
 @app.get("/", tags=["Root"])
 def read_root():
@@ -0,0 +1,11 @@
+from pydantic import BaseModel
+from typing import List
+
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+class ImportResult(BaseModel):
+    imported: int
+    failed: int
+    errors: List[ImportRowError] = []  # First rows that failed validation, in file order
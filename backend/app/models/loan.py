@@ -1,15 +1,27 @@
 from pydantic import BaseModel
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
+from decimal import Decimal
+from ..services.money import Money
+from ..services.serialization import MONEY_JSON_ENCODERS, PYDANTIC_V2, money_serializer
+
+if PYDANTIC_V2:
+    from pydantic import ConfigDict
 
 class LoanBase(BaseModel):
     title: str
-    amount: float
-    interest_rate: float
+    amount: Money
+    interest_rate: Decimal
     term_months: int
     start_date: datetime
     description: Optional[str] = None
 
+    if PYDANTIC_V2:
+        serialize_money = money_serializer('amount')
+    else:
+        class Config:
+            json_encoders = MONEY_JSON_ENCODERS
+
 class LoanCreate(LoanBase):
     pass
 
@@ -17,9 +29,31 @@ class Loan(LoanBase):
     id: str
     user_id: str
     created_at: datetime
-    total_amount: float  # Principal + Interest
-    monthly_payment: float
+    total_amount: Money  # Principal + Interest
+    monthly_payment: Money
     status: str = "active"  # active, paid, defaulted
+    total_repaid: Money = Decimal('0')  # Running total, maintained on every repayment
+    repayment_count: int = 0
+    last_payment_date: Optional[datetime] = None
+    next_due_date: Optional[date] = None  # Unset once every installment is covered
+
+    if PYDANTIC_V2:
+        model_config = ConfigDict(from_attributes=True)
+        serialize_money = money_serializer('amount', 'total_amount', 'monthly_payment', 'total_repaid')
+    else:
+        class Config:
+            orm_mode = True
+
+class ScheduleEntry(BaseModel):
+    period: int
+    due_date: date
+    payment: Money
+    principal: Money
+    interest: Money
+    balance: Money  # Remaining after this payment
 
-    class Config:
-        orm_mode = True
\ No newline at end of file
+    if PYDANTIC_V2:
+        serialize_money = money_serializer('payment', 'principal', 'interest', 'balance')
+    else:
+        class Config:
+            json_encoders = MONEY_JSON_ENCODERS
@@ -1,13 +1,24 @@
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
+from ..services.money import Money
+from ..services.serialization import MONEY_JSON_ENCODERS, PYDANTIC_V2, money_serializer
+
+if PYDANTIC_V2:
+    from pydantic import ConfigDict
 
 class RepaymentBase(BaseModel):
     loan_id: str
-    amount: float
+    amount: Money
     payment_date: datetime
     notes: Optional[str] = None
 
+    if PYDANTIC_V2:
+        serialize_money = money_serializer('amount')
+    else:
+        class Config:
+            json_encoders = MONEY_JSON_ENCODERS
+
 class RepaymentCreate(RepaymentBase):
     pass
 
@@ -16,12 +27,21 @@ class Repayment(RepaymentBase):
     user_id: str
     created_at: datetime
 
-    class Config:
-        orm_mode = True
+    if PYDANTIC_V2:
+        model_config = ConfigDict(from_attributes=True)
+    else:
+        class Config:
+            orm_mode = True
 
 class Summary(BaseModel):
     total_loans: int
-    total_borrowed: float
-    total_repaid: float
-    outstanding_amount: float
-    next_payment_due: Optional[datetime] = None
\ No newline at end of file
+    total_borrowed: Money
+    total_repaid: Money
+    outstanding_amount: Money
+    next_payment_due: Optional[datetime] = None
+
+    if PYDANTIC_V2:
+        serialize_money = money_serializer('total_borrowed', 'total_repaid', 'outstanding_amount')
+    else:
+        class Config:
+            json_encoders = MONEY_JSON_ENCODERS
@@ -1,6 +1,10 @@
 from pydantic import BaseModel, EmailStr
 from typing import Optional
 from datetime import datetime
+from ..services.serialization import PYDANTIC_V2
+
+if PYDANTIC_V2:
+    from pydantic import ConfigDict
 
 class UserBase(BaseModel):
     email: EmailStr
@@ -17,8 +21,11 @@ class User(UserBase):
     full_name: str
     created_at: datetime
 
-    class Config:
-        orm_mode = True
+    if PYDANTIC_V2:
+        model_config = ConfigDict(from_attributes=True)
+    else:
+        class Config:
+            orm_mode = True
 
 class Token(BaseModel):
     access_token: str
@@ -0,0 +1,24 @@
+from .errors import dynamodb_errors
+
+class DynamoDBBatchWriter:
+    """batch_writer() wrapper with the repositories' put(item) / delete(key) interface and error types"""
+
+    def __init__(self, table):
+        self._writer = table.batch_writer()
+
+    @dynamodb_errors
+    def __enter__(self):
+        self._writer.__enter__()
+        return self
+
+    @dynamodb_errors
+    def __exit__(self, *exc_info):
+        return self._writer.__exit__(*exc_info)
+
+    @dynamodb_errors
+    def put(self, item: dict) -> None:
+        self._writer.put_item(Item=item)
+
+    @dynamodb_errors
+    def delete(self, key: dict) -> None:
+        self._writer.delete_item(Key=key)
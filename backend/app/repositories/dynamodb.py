@@ -0,0 +1,72 @@
+import os
+from decimal import Decimal
+from typing import Dict, Iterable, Optional
+
+import boto3
+
+from .errors import dynamodb_errors
+from .expressions import owner_condition, update_expression, version_condition
+from .idempotency import IdempotencyRepository
+from .loans import LoanRepository, versioned
+from .repayments import RepaymentRepository
+from .summaries import SummaryRepository
+from .users import UserRepository
+
+class DynamoDBStorage:
+    """Repositories over the DynamoDB tables named by the DYNAMODB_*_TABLE variables"""
+
+    def __init__(self, dynamodb=None):
+        dynamodb = dynamodb or boto3.resource('dynamodb', region_name=os.getenv('AWS_REGION', 'us-east-1'))
+        self.users = UserRepository(dynamodb.Table(os.getenv('DYNAMODB_USERS_TABLE', 'loansyncro-users-dev')))
+        self.loans = LoanRepository(dynamodb.Table(os.getenv('DYNAMODB_LOANS_TABLE', 'loansyncro-loans-dev')))
+        self.repayments = RepaymentRepository(
+            dynamodb.Table(os.getenv('DYNAMODB_REPAYMENTS_TABLE', 'loansyncro-repayments-dev'))
+        )
+        self.summaries = SummaryRepository(
+            dynamodb.Table(os.getenv('DYNAMODB_SUMMARIES_TABLE', 'loansyncro-summaries-dev'))
+        )
+        self.idempotency = IdempotencyRepository(
+            dynamodb.Table(os.getenv('DYNAMODB_IDEMPOTENCY_TABLE', 'loansyncro-idempotency-dev'))
+        )
+
+    @dynamodb_errors
+    def record_repayment(self, repayment: dict, set_fields: Optional[Dict] = None,
+                         add_fields: Optional[Dict] = None, remove_fields: Iterable[str] = (),
+                         summary_deltas: Optional[Dict[str, Decimal]] = None,
+                         expected_version: Optional[int] = None) -> None:
+        """
+        Put a repayment, update its loan (which must belong to the repayment's user and,
+        with expected_version, still have that version) bumping its version, and add to
+        the user's summary in one TransactWriteItems call.
+        """
+        loans_table = self.loans.table
+        loans_table.meta.client.transact_write_items(
+            TransactItems=[
+                {
+                    'Put': {
+                        'TableName': self.repayments.table.name,
+                        'Item': repayment,
+                        'ConditionExpression': 'attribute_not_exists(id)'
+                    }
+                },
+                {
+                    'Update': {
+                        'TableName': loans_table.name,
+                        'Key': {'id': repayment['loan_id']},
+                        **version_condition(
+                            owner_condition(
+                                update_expression(set_fields, versioned(add_fields), remove_fields),
+                                repayment['user_id']
+                            ),
+                            expected_version
+                        )
+                    }
+                },
+                {
+                    'Update': {
+                        'TableName': self.summaries.table.name,
+                        **SummaryRepository.delta_update(repayment['user_id'], summary_deltas or {})
+                    }
+                }
+            ]
+        )
@@ -0,0 +1,24 @@
+import functools
+
+from botocore.exceptions import ClientError
+
+class StorageError(Exception):
+    """A data store call failed"""
+
+class ConditionFailedError(StorageError):
+    """A conditional write did not apply: the item is missing, owned by someone else, or changed"""
+
+# DynamoDB error codes meaning a write's condition (or a transaction's) did not hold
+CONDITION_FAILED_CODES = ('ConditionalCheckFailedException', 'TransactionCanceledException')
+
+def dynamodb_errors(fn):
+    """Re-raise boto3 ClientErrors from a repository method as StorageError / ConditionFailedError"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] in CONDITION_FAILED_CODES:
+                raise ConditionFailedError(str(e)) from e
+            raise StorageError(str(e)) from e
+    return wrapper
@@ -0,0 +1,94 @@
+from typing import Dict, Iterable, Optional
+
+def update_expression(set_fields: Optional[Dict] = None, add_fields: Optional[Dict] = None,
+                      remove_fields: Iterable[str] = ()) -> dict:
+    """
+    UpdateExpression, names and values for update_item / a transaction Update.
+    Every attribute goes through a placeholder, so reserved words like status need no care.
+    """
+    clauses, names, values = [], {}, {}
+    for action, fields in (('SET', set_fields or {}), ('ADD', add_fields or {})):
+        parts = []
+        for name, value in fields.items():
+            index = len(names)
+            names[f'#a{index}'] = name
+            values[f':v{index}'] = value
+            parts.append(f'#a{index} = :v{index}' if action == 'SET' else f'#a{index} :v{index}')
+        if parts:
+            clauses.append(f'{action} ' + ', '.join(parts))
+
+    removals = []
+    for name in remove_fields:
+        index = len(names)
+        names[f'#a{index}'] = name
+        removals.append(f'#a{index}')
+    if removals:
+        clauses.append('REMOVE ' + ', '.join(removals))
+
+    kwargs = {'UpdateExpression': ' '.join(clauses), 'ExpressionAttributeNames': names}
+    if values:
+        kwargs['ExpressionAttributeValues'] = values
+    return kwargs
+
+def _and_condition(kwargs: dict, clause: str, names: Dict[str, str], values: Dict) -> dict:
+    """AND a clause onto any ConditionExpression already in update/delete arguments"""
+    existing = kwargs.get('ConditionExpression')
+    kwargs['ConditionExpression'] = f'({existing}) AND ({clause})' if existing else clause
+    kwargs['ExpressionAttributeNames'] = {**kwargs.get('ExpressionAttributeNames', {}), **names}
+    if values:
+        kwargs['ExpressionAttributeValues'] = {**kwargs.get('ExpressionAttributeValues', {}), **values}
+    return kwargs
+
+def owner_condition(kwargs: dict, user_id: Optional[str]) -> dict:
+    """Add a user_id ownership condition (which also fails for a missing item) to update/delete arguments"""
+    if user_id is not None:
+        _and_condition(kwargs, '#owner = :owner', {'#owner': 'user_id'}, {':owner': user_id})
+    return kwargs
+
+def _counter_condition(kwargs: dict, name: str, expected: Optional[int]) -> dict:
+    if expected is None:
+        return kwargs
+    clause = f'#{name} = :{name}'
+    if expected == 0:
+        clause = f'attribute_not_exists(#{name}) OR {clause}'
+    return _and_condition(kwargs, clause, {f'#{name}': name}, {f':{name}': expected})
+
+def version_condition(kwargs: dict, expected_version: Optional[int]) -> dict:
+    """
+    Add a condition that the item's version is still the one read (0: an item written
+    before versions existed, which has none) to update arguments.
+    """
+    return _counter_condition(kwargs, 'version', expected_version)
+
+def revision_condition(kwargs: dict, expected_revision: Optional[int]) -> dict:
+    """
+    Add a condition that a summary's revision is still the one read (0: it had none,
+    or did not exist) to update arguments.
+    """
+    return _counter_condition(kwargs, 'revision', expected_revision)
+
+def expected_condition(kwargs: dict, expected: Dict) -> dict:
+    """
+    Add a condition that the item exists and each expected attribute still holds its
+    value (None: is absent) to update arguments, for writes computed from an earlier read.
+    """
+    clauses = ['attribute_exists(#key)']
+    names = {**kwargs.get('ExpressionAttributeNames', {}), '#key': 'id'}
+    values = dict(kwargs.get('ExpressionAttributeValues', {}))
+    for index, (name, value) in enumerate(expected.items()):
+        names[f'#e{index}'] = name
+        if value is None:
+            clauses.append(f'attribute_not_exists(#e{index})')
+        else:
+            values[f':e{index}'] = value
+            clauses.append(f'#e{index} = :e{index}')
+    kwargs['ConditionExpression'] = ' AND '.join(clauses)
+    kwargs['ExpressionAttributeNames'] = names
+    if values:
+        kwargs['ExpressionAttributeValues'] = values
+    return kwargs
+
+def projection(attributes: Iterable[str]) -> dict:
+    """ProjectionExpression and names reading only the given attributes"""
+    names = {f'#p{index}': name for index, name in enumerate(attributes)}
+    return {'ProjectionExpression': ', '.join(names), 'ExpressionAttributeNames': names}
@@ -0,0 +1,99 @@
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from botocore.exceptions import ClientError
+
+from .errors import ConditionFailedError, dynamodb_errors
+from .expressions import update_expression
+
+PENDING = 'pending'
+COMPLETED = 'completed'
+
+def holds_key(record: dict, now: int) -> bool:
+    """Whether a stored record still owns its key: completed and unexpired, or pending within its lease"""
+    if int(record['expires_at']) < now:
+        return False
+    return record['state'] == COMPLETED or int(record['locked_until']) >= now
+
+class IdempotencyRepositoryBase(ABC):
+    """
+    Records of requests made with an Idempotency-Key, shared by every storage backend.
+    A record is first stored pending, while its request runs, then completed with the
+    response to replay; expires_at (epoch seconds) ends it either way. Each claim carries
+    its own token, so a request whose lease ran out and whose key was claimed again
+    cannot complete or release the newer claim.
+    """
+
+    @abstractmethod
+    def claim(self, record: dict, now: int) -> Optional[dict]:
+        """
+        Store a pending record unless a record that still holds its key exists.
+        Returns None once claimed, otherwise that existing record.
+        """
+
+    @abstractmethod
+    def complete(self, key: str, token: str, status_code: int, body: str, expires_at: int) -> None:
+        """
+        Store the response of a claimed request for later replays. Raises
+        ConditionFailedError when the claim with this token is no longer pending (lease lost).
+        """
+
+    @abstractmethod
+    def release(self, key: str, token: str) -> None:
+        """
+        Drop a claim whose request failed, so a retry runs it again. Raises
+        ConditionFailedError when the claim with this token is no longer pending (lease lost).
+        """
+
+class IdempotencyRepository(IdempotencyRepositoryBase):
+    """Data access for the idempotency table, whose TTL deletes records after expires_at"""
+
+    def __init__(self, table):
+        self.table = table
+
+    @dynamodb_errors
+    def claim(self, record: dict, now: int) -> Optional[dict]:
+        # TTL deletion lags by up to a couple of days, so expired records are overwritten
+        # too; the loop covers a record that expires between the put and the read
+        for _ in range(2):
+            try:
+                self.table.put_item(
+                    Item=record,
+                    ConditionExpression=(
+                        'attribute_not_exists(#key) OR #expires_at < :now '
+                        'OR (#state = :pending AND #locked_until < :now)'
+                    ),
+                    ExpressionAttributeNames={
+                        '#key': 'key', '#expires_at': 'expires_at', '#state': 'state', '#locked_until': 'locked_until'
+                    },
+                    ExpressionAttributeValues={':now': now, ':pending': PENDING}
+                )
+                return None
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+            existing = self.table.get_item(Key={'key': record['key']}, ConsistentRead=True).get('Item')
+            if existing is not None and holds_key(existing, now):
+                return existing
+        raise ConditionFailedError(f"Idempotency key {record['key']} is being claimed concurrently")
+
+    @staticmethod
+    def _claim_condition(kwargs: dict, token: str) -> dict:
+        """Make update/delete arguments conditional on the claim with token still being pending"""
+        kwargs['ConditionExpression'] = '#state = :pending AND #token = :token'
+        kwargs.setdefault('ExpressionAttributeNames', {}).update({'#state': 'state', '#token': 'token'})
+        kwargs.setdefault('ExpressionAttributeValues', {}).update({':pending': PENDING, ':token': token})
+        return kwargs
+
+    @dynamodb_errors
+    def complete(self, key: str, token: str, status_code: int, body: str, expires_at: int) -> None:
+        self.table.update_item(
+            Key={'key': key},
+            **self._claim_condition(update_expression(set_fields={
+                'state': COMPLETED, 'status_code': status_code, 'body': body, 'expires_at': expires_at
+            }), token)
+        )
+
+    @dynamodb_errors
+    def release(self, key: str, token: str) -> None:
+        self.table.delete_item(Key={'key': key}, **self._claim_condition({}, token))
@@ -0,0 +1,293 @@
+import random
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+from .batch_writer import DynamoDBBatchWriter
+from .errors import dynamodb_errors
+from .expressions import expected_condition, owner_condition, projection, update_expression, version_condition
+
+USER_ID_INDEX = 'user-id-index'
+# Both due-date indexes are sparse: only loans with an installment outstanding carry
+# next_due_date and due_bucket, so paid-off loans drop out instead of being filtered on read.
+# due_bucket is a constant partition key, letting one range query span every user.
+DUE_BUCKET = 'due'
+DUE_DATE_INDEX = 'due-bucket-next-due-date-index'
+USER_DUE_DATE_INDEX = 'user-id-next-due-date-index'
+
+def loan_version(loan: dict) -> int:
+    """
+    A loan's version: 1 when created and bumped by every update, so a write derived
+    from a read can require that nothing changed in between. 0 for loans created
+    before versions existed.
+    """
+    return int(loan.get('version', 0))
+
+def versioned(add_fields: Optional[Dict]) -> dict:
+    """ADD fields of a loan update, plus the version bump every loan update carries"""
+    return {**(add_fields or {}), 'version': 1}
+
+# TransactWriteItems takes at most 100 actions
+TRANSACT_BATCH_SIZE = 100
+# Rounds in which updates cancelled for another reason than a failed condition (a transaction
+# conflict, throttling) are retried before they are left for the next run
+TRANSACT_ATTEMPTS = 3
+# Pause before the second round, doubled (with full jitter) for every later one
+TRANSACT_RETRY_BASE_SECONDS = 0.05
+
+class LoanRepositoryBase(ABC):
+    """Loan access shared by every storage backend; subclasses supply the single-call operations"""
+
+    @abstractmethod
+    def get(self, loan_id: str, consistent_read: bool = False) -> Optional[dict]:
+        """A loan item; consistent_read also sees writes made just before, at twice the read cost"""
+
+    @abstractmethod
+    def put(self, item: dict) -> None:
+        """Store a new loan item, or overwrite one with the same id"""
+
+    @abstractmethod
+    def batch_writer(self):
+        """Context manager whose put(item) buffers writes into bulk requests"""
+
+    @abstractmethod
+    def update(self, loan_id: str, user_id: Optional[str] = None, set_fields: Optional[Dict] = None,
+               add_fields: Optional[Dict] = None, remove_fields: Iterable[str] = (),
+               expected_version: Optional[int] = None) -> dict:
+        """
+        Set, add to (numbers) and remove attributes of a loan, bump its version and return
+        it as updated. With user_id, raises ConditionFailedError unless the loan exists and
+        belongs to that user; with expected_version, also unless it still has that version.
+        """
+
+    @abstractmethod
+    def update_many(self, updates: List[dict]) -> List[str]:
+        """
+        Apply updates computed from an earlier read, in bulk. Each update is a dict with
+        loan_id, expected ({attribute: value read, None if absent}), set_fields and
+        remove_fields; it only applies (bumping the version) if the loan still exists with
+        the expected values.
+        Returns the ids of the loans left unchanged because they had changed since (or,
+        on DynamoDB, kept conflicting with concurrent writes); a later run picks them up.
+        """
+
+    @abstractmethod
+    def delete(self, loan_id: str, user_id: Optional[str] = None) -> dict:
+        """
+        Delete a loan in one conditional write, which fails with ConditionFailedError if
+        it is missing or (given user_id) belongs to someone else. Returns the deleted item.
+        """
+
+    @abstractmethod
+    def scan_page(self, segment: int = 0, total_segments: int = 1, attributes: Optional[Iterable[str]] = None,
+                  limit: Optional[int] = None,
+                  exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        """
+        Get one page of one segment of the whole table, optionally only some attributes,
+        and the key to continue from. Segments split the table into disjoint parts that
+        can be read in parallel.
+        """
+
+    @abstractmethod
+    def query_user_page(self, user_id: str, limit: Optional[int] = None,
+                        exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        """Get one page of a user's loans and the key to continue from"""
+
+    @abstractmethod
+    def query_due_page(self, due_from: str, due_to: str, limit: Optional[int] = None,
+                       exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        """Get one page of loans, across all users, whose next installment is due between two ISO dates (inclusive)"""
+
+    @abstractmethod
+    def next_due_date(self, user_id: str) -> Optional[str]:
+        """Earliest next_due_date across a user's loans"""
+
+    def iter_user_loans(self, user_id: str, exclusive_start_key: Optional[dict] = None) -> Iterator[dict]:
+        """Yield every loan of a user, one page at a time, optionally resuming after a key"""
+        start_key = exclusive_start_key
+        while True:
+            items, start_key = self.query_user_page(user_id, exclusive_start_key=start_key)
+            yield from items
+            if not start_key:
+                return
+
+    def list_user_loans(self, user_id: str) -> List[dict]:
+        """Get every loan of a user"""
+        return list(self.iter_user_loans(user_id))
+
+    def iter_segment(self, segment: int = 0, total_segments: int = 1,
+                     attributes: Optional[Iterable[str]] = None) -> Iterator[dict]:
+        """Yield every loan of one scan segment, one page at a time"""
+        start_key = None
+        while True:
+            items, start_key = self.scan_page(segment, total_segments, attributes, exclusive_start_key=start_key)
+            yield from items
+            if not start_key:
+                return
+
+    def iter_due_loans(self, due_from: str, due_to: str) -> Iterator[dict]:
+        """Yield every loan due between two ISO dates, soonest first"""
+        start_key = None
+        while True:
+            items, start_key = self.query_due_page(due_from, due_to, exclusive_start_key=start_key)
+            yield from items
+            if not start_key:
+                return
+
+class LoanRepository(LoanRepositoryBase):
+    """Data access for the loans table"""
+
+    def __init__(self, table):
+        self.table = table
+
+    @dynamodb_errors
+    def get(self, loan_id: str, consistent_read: bool = False) -> Optional[dict]:
+        return self.table.get_item(Key={'id': loan_id}, ConsistentRead=consistent_read).get('Item')
+
+    @dynamodb_errors
+    def put(self, item: dict) -> None:
+        self.table.put_item(Item=item)
+
+    def batch_writer(self):
+        # Sends BatchWriteItem requests of 25 items and retries unprocessed ones
+        return DynamoDBBatchWriter(self.table)
+
+    @dynamodb_errors
+    def update(self, loan_id: str, user_id: Optional[str] = None, set_fields: Optional[Dict] = None,
+               add_fields: Optional[Dict] = None, remove_fields: Iterable[str] = (),
+               expected_version: Optional[int] = None) -> dict:
+        kwargs = version_condition(
+            owner_condition(update_expression(set_fields, versioned(add_fields), remove_fields), user_id),
+            expected_version
+        )
+        return self.table.update_item(Key={'id': loan_id}, ReturnValues='ALL_NEW', **kwargs)['Attributes']
+
+    @dynamodb_errors
+    def update_many(self, updates: List[dict]) -> List[str]:
+        # Conditional writes cannot go through BatchWriteItem, so they are sent as
+        # transactions of up to 100 updates; a failed condition cancels the whole
+        # transaction, and the rest of it is resent without the stale loans
+        stale = []
+        for start in range(0, len(updates), TRANSACT_BATCH_SIZE):
+            stale += self._transact_updates(updates[start:start + TRANSACT_BATCH_SIZE])
+        return stale
+
+    def _transact_updates(self, updates: List[dict]) -> List[str]:
+        # Updates that lost to a concurrent write are retried after a pause in rounds of
+        # their own, so they neither hold back the rest nor abort a batch run
+        unchanged = []
+        for attempt in range(TRANSACT_ATTEMPTS):
+            if attempt:
+                time.sleep(random.uniform(0, TRANSACT_RETRY_BASE_SECONDS * 2 ** attempt))
+            stale, updates = self._transact_round(updates)
+            unchanged += stale
+            if not updates:
+                return unchanged
+        print(f"Left {len(updates)} loan updates for the next run after {TRANSACT_ATTEMPTS} rounds of conflicts: "
+              f"{', '.join(update['loan_id'] for update in updates)}")
+        return unchanged + [update['loan_id'] for update in updates]
+
+    def _transact_round(self, updates: List[dict]) -> Tuple[List[str], List[dict]]:
+        """
+        Write updates in one transaction, resent without the ones it was cancelled for.
+        Returns the ids of loans whose condition failed and the updates to retry later.
+        """
+        stale, deferred = [], []
+        while updates:
+            try:
+                self.table.meta.client.transact_write_items(TransactItems=[
+                    {
+                        'Update': {
+                            'TableName': self.table.name,
+                            'Key': {'id': update['loan_id']},
+                            **expected_condition(
+                                update_expression(
+                                    update.get('set_fields'), versioned(None), update.get('remove_fields', ())
+                                ),
+                                update['expected']
+                            )
+                        }
+                    }
+                    for update in updates
+                ])
+                break
+            except ClientError as e:
+                reasons = e.response.get('CancellationReasons') or []
+                if e.response['Error']['Code'] != 'TransactionCanceledException' or len(reasons) != len(updates):
+                    raise
+                codes = [reason.get('Code') or 'None' for reason in reasons]
+                if all(code == 'None' for code in codes):
+                    raise
+                stale += [update['loan_id'] for update, code in zip(updates, codes) if code == 'ConditionalCheckFailed']
+                deferred += [update for update, code in zip(updates, codes) if code not in ('None', 'ConditionalCheckFailed')]
+                updates = [update for update, code in zip(updates, codes) if code == 'None']
+        return stale, deferred
+
+    @dynamodb_errors
+    def delete(self, loan_id: str, user_id: Optional[str] = None) -> dict:
+        # owner_condition also fails for a missing loan; without a user, attribute_exists does
+        kwargs = owner_condition({}, user_id) if user_id is not None else {
+            'ConditionExpression': 'attribute_exists(#key)', 'ExpressionAttributeNames': {'#key': 'id'}
+        }
+        return self.table.delete_item(Key={'id': loan_id}, ReturnValues='ALL_OLD', **kwargs)['Attributes']
+
+    @dynamodb_errors
+    def scan_page(self, segment: int = 0, total_segments: int = 1, attributes: Optional[Iterable[str]] = None,
+                  limit: Optional[int] = None,
+                  exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        kwargs = {'Segment': segment, 'TotalSegments': total_segments}
+        if attributes:
+            kwargs.update(projection(attributes))
+        if limit:
+            kwargs['Limit'] = limit
+        if exclusive_start_key:
+            kwargs['ExclusiveStartKey'] = exclusive_start_key
+
+        response = self.table.scan(**kwargs)
+        return response.get('Items', []), response.get('LastEvaluatedKey')
+
+    @dynamodb_errors
+    def query_user_page(self, user_id: str, limit: Optional[int] = None,
+                        exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        kwargs = {
+            'IndexName': USER_ID_INDEX,
+            'KeyConditionExpression': 'user_id = :user_id',
+            'ExpressionAttributeValues': {':user_id': user_id},
+        }
+        if limit:
+            kwargs['Limit'] = limit
+        if exclusive_start_key:
+            kwargs['ExclusiveStartKey'] = exclusive_start_key
+
+        response = self.table.query(**kwargs)
+        return response.get('Items', []), response.get('LastEvaluatedKey')
+
+    @dynamodb_errors
+    def query_due_page(self, due_from: str, due_to: str, limit: Optional[int] = None,
+                       exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        kwargs = {
+            'IndexName': DUE_DATE_INDEX,
+            'KeyConditionExpression': 'due_bucket = :due_bucket AND next_due_date BETWEEN :due_from AND :due_to',
+            'ExpressionAttributeValues': {':due_bucket': DUE_BUCKET, ':due_from': due_from, ':due_to': due_to},
+        }
+        if limit:
+            kwargs['Limit'] = limit
+        if exclusive_start_key:
+            kwargs['ExclusiveStartKey'] = exclusive_start_key
+
+        response = self.table.query(**kwargs)
+        return response.get('Items', []), response.get('LastEvaluatedKey')
+
+    @dynamodb_errors
+    def next_due_date(self, user_id: str) -> Optional[str]:
+        """Earliest next_due_date across a user's loans, read as the first item of their sparse index"""
+        response = self.table.query(
+            IndexName=USER_DUE_DATE_INDEX,
+            KeyConditionExpression='user_id = :user_id',
+            ExpressionAttributeValues={':user_id': user_id},
+            Limit=1
+        )
+        items = response.get('Items', [])
+        return items[0]['next_due_date'] if items else None
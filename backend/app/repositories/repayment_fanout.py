@@ -0,0 +1,51 @@
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List
+
+# Per-loan repayment queries run on a bounded pool so a user with hundreds of
+# loans costs roughly ceil(loans / workers) round trips instead of one per loan.
+FANOUT_MAX_WORKERS = int(os.getenv('REPAYMENTS_FANOUT_MAX_WORKERS', '16'))
+
+_executor = ThreadPoolExecutor(max_workers=FANOUT_MAX_WORKERS, thread_name_prefix='repayments-fanout')
+
+def _payment_date(repayment: dict) -> str:
+    return repayment.get('payment_date', '')
+
+def query_loan_repayments(client, table_name: str, index_name: str, loan_id: str) -> List[dict]:
+    """Get the repayments of a single loan, most recent first, from an index sorted by payment date"""
+    repayments = []
+    query_kwargs = {
+        'TableName': table_name,
+        'IndexName': index_name,
+        'KeyConditionExpression': 'loan_id = :loan_id',
+        'ExpressionAttributeValues': {':loan_id': loan_id},
+        'ScanIndexForward': False
+    }
+    while True:
+        response = client.query(**query_kwargs)
+        repayments.extend(response.get('Items', []))
+        if not response.get('LastEvaluatedKey'):
+            return repayments
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def fetch_repayments_for_loans(table, index_name: str, loan_ids: Iterable[str]) -> List[dict]:
+    """
+    Get the repayments of every given loan in table, most recent first.
+    Per-loan queries run concurrently on the table's client and the already sorted
+    per-loan lists are combined with a k-way merge rather than re-sorting the whole result.
+    """
+    loan_ids = list(loan_ids)
+    if not loan_ids:
+        return []
+    # boto3 resources are not thread safe but clients are, so the workers share the table's
+    # client, which (built by the resource) still takes and returns plain Python values
+    client, table_name = table.meta.client, table.name
+    if len(loan_ids) == 1:
+        return query_loan_repayments(client, table_name, index_name, loan_ids[0])
+
+    # map() preserves input order and re-raises the first ClientError to the caller
+    per_loan = list(_executor.map(
+        lambda loan_id: query_loan_repayments(client, table_name, index_name, loan_id), loan_ids
+    ))
+    return list(heapq.merge(*per_loan, key=_payment_date, reverse=True))
@@ -0,0 +1,182 @@
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from .batch_writer import DynamoDBBatchWriter
+from .errors import dynamodb_errors
+from .expressions import projection
+from .repayment_fanout import fetch_repayments_for_loans
+
+USER_PAYMENT_DATE_INDEX = 'user-id-payment-date-index'
+LOAN_PAYMENT_DATE_INDEX = 'loan-id-payment-date-index'
+
+class RepaymentRepositoryBase(ABC):
+    """Repayment access shared by every storage backend; subclasses supply the single-call operations"""
+
+    @abstractmethod
+    def batch_writer(self):
+        """Context manager whose put(item) buffers writes into bulk requests"""
+
+    @abstractmethod
+    def query_user_page(self, user_id: str, limit: Optional[int] = None,
+                        exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        """Get one page of a user's repayments, most recent first, and the key to continue from"""
+
+    @abstractmethod
+    def query_loan_page(self, loan_id: str, limit: Optional[int] = None,
+                        exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        """Get one page of a loan's repayments, most recent first, and the key to continue from"""
+
+    @abstractmethod
+    def fetch_for_loans(self, loan_ids: Iterable[str]) -> List[dict]:
+        """Get the repayments of every given loan, most recent first, without the user index, in one read"""
+
+    @abstractmethod
+    def delete_loan_repayments(self, loan_id: str) -> int:
+        """Delete every repayment of a loan in batches; returns how many were deleted"""
+
+    @abstractmethod
+    def scan_page(self, segment: int = 0, total_segments: int = 1, attributes: Optional[Iterable[str]] = None,
+                  limit: Optional[int] = None,
+                  exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        """
+        Get one page of one segment of the whole table, optionally only some attributes,
+        and the key to continue from. Segments split the table into disjoint parts that
+        can be read in parallel.
+        """
+
+    def iter_segment(self, segment: int = 0, total_segments: int = 1,
+                     attributes: Optional[Iterable[str]] = None) -> Iterator[dict]:
+        """Yield every repayment of one scan segment, one page at a time"""
+        start_key = None
+        while True:
+            items, start_key = self.scan_page(segment, total_segments, attributes, exclusive_start_key=start_key)
+            yield from items
+            if not start_key:
+                return
+
+    def iter_user_repayments(self, user_id: str, exclusive_start_key: Optional[dict] = None) -> Iterator[dict]:
+        """Yield every repayment of a user, most recent first, one page at a time, optionally resuming after a key"""
+        start_key = exclusive_start_key
+        while True:
+            items, start_key = self.query_user_page(user_id, exclusive_start_key=start_key)
+            yield from items
+            if not start_key:
+                return
+
+    def iter_loan_repayments(self, loan_id: str) -> Iterator[dict]:
+        """Yield every repayment of a loan, most recent first, one page at a time"""
+        start_key = None
+        while True:
+            items, start_key = self.query_loan_page(loan_id, exclusive_start_key=start_key)
+            yield from items
+            if not start_key:
+                return
+
+    def query_loans_page(self, loan_ids: List[str], limit: Optional[int] = None,
+                         exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        """
+        Get one page of the repayments of several loans without the user index, and the key
+        to continue from. Loans are read one after another, each most recent first, so a
+        page never reads more than its own items; the key names the loan to resume with.
+        """
+        position, loan_start_key = 0, None
+        if exclusive_start_key:
+            position = loan_ids.index(exclusive_start_key['loan_id'])
+            loan_start_key = exclusive_start_key.get('start_key')
+
+        items = []
+        for index in range(position, len(loan_ids)):
+            loan_id = loan_ids[index]
+            while True:
+                page, loan_start_key = self.query_loan_page(
+                    loan_id, limit=limit and limit - len(items), exclusive_start_key=loan_start_key
+                )
+                items.extend(page)
+                if not loan_start_key:
+                    break
+                if limit and len(items) >= limit:
+                    return items, {'loan_id': loan_id, 'start_key': loan_start_key}
+            if limit and len(items) >= limit and index + 1 < len(loan_ids):
+                return items, {'loan_id': loan_ids[index + 1]}
+        return items, None
+
+    def list_user_repayments(self, user_id: str) -> List[dict]:
+        """Get every repayment of a user, most recent first"""
+        return list(self.iter_user_repayments(user_id))
+
+class RepaymentRepository(RepaymentRepositoryBase):
+    """Data access for the repayments table"""
+
+    def __init__(self, table):
+        self.table = table
+
+    def batch_writer(self):
+        # Sends BatchWriteItem requests of 25 items and retries unprocessed ones
+        return DynamoDBBatchWriter(self.table)
+
+    @dynamodb_errors
+    def _query_page(self, index_name: str, key_name: str, key_value: str, limit: Optional[int],
+                    exclusive_start_key: Optional[dict]) -> Tuple[List[dict], Optional[dict]]:
+        kwargs = {
+            'IndexName': index_name,
+            'KeyConditionExpression': f'{key_name} = :key',
+            'ExpressionAttributeValues': {':key': key_value},
+            'ScanIndexForward': False,
+        }
+        if limit:
+            kwargs['Limit'] = limit
+        if exclusive_start_key:
+            kwargs['ExclusiveStartKey'] = exclusive_start_key
+
+        response = self.table.query(**kwargs)
+        return response.get('Items', []), response.get('LastEvaluatedKey')
+
+    def query_user_page(self, user_id: str, limit: Optional[int] = None,
+                        exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        return self._query_page(USER_PAYMENT_DATE_INDEX, 'user_id', user_id, limit, exclusive_start_key)
+
+    def query_loan_page(self, loan_id: str, limit: Optional[int] = None,
+                        exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        return self._query_page(LOAN_PAYMENT_DATE_INDEX, 'loan_id', loan_id, limit, exclusive_start_key)
+
+    @dynamodb_errors
+    def scan_page(self, segment: int = 0, total_segments: int = 1, attributes: Optional[Iterable[str]] = None,
+                  limit: Optional[int] = None,
+                  exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        kwargs = {'Segment': segment, 'TotalSegments': total_segments}
+        if attributes:
+            kwargs.update(projection(attributes))
+        if limit:
+            kwargs['Limit'] = limit
+        if exclusive_start_key:
+            kwargs['ExclusiveStartKey'] = exclusive_start_key
+
+        response = self.table.scan(**kwargs)
+        return response.get('Items', []), response.get('LastEvaluatedKey')
+
+    @dynamodb_errors
+    def fetch_for_loans(self, loan_ids: Iterable[str]) -> List[dict]:
+        # Concurrent per-loan queries on this table's client, k-way merged
+        return fetch_repayments_for_loans(self.table, LOAN_PAYMENT_DATE_INDEX, loan_ids)
+
+    @dynamodb_errors
+    def delete_loan_repayments(self, loan_id: str) -> int:
+        # Only the keys are read; deletes go out as BatchWriteItem requests of 25
+        deleted, start_key = 0, None
+        with self.batch_writer() as batch:
+            while True:
+                kwargs = {
+                    'IndexName': LOAN_PAYMENT_DATE_INDEX,
+                    'KeyConditionExpression': 'loan_id = :key',
+                    'ExpressionAttributeValues': {':key': loan_id},
+                    **projection(['id'])
+                }
+                if start_key:
+                    kwargs['ExclusiveStartKey'] = start_key
+                response = self.table.query(**kwargs)
+                for item in response.get('Items', []):
+                    batch.delete({'id': item['id']})
+                    deleted += 1
+                start_key = response.get('LastEvaluatedKey')
+                if not start_key:
+                    return deleted
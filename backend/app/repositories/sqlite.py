@@ -0,0 +1,475 @@
+import functools
+import sqlite3
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import simplejson
+
+from .errors import ConditionFailedError, StorageError
+from .idempotency import COMPLETED, PENDING, IdempotencyRepositoryBase, holds_key
+from .loans import DUE_BUCKET, LoanRepositoryBase, loan_version, versioned
+from .repayments import RepaymentRepositoryBase
+from .summaries import SummaryRepositoryBase
+from .users import UserRepositoryBase
+
+# Items are stored whole as JSON next to the columns their indexes need. Partial
+# indexes mirror the sparse DynamoDB GSIs: a loan is only in the due-date indexes
+# while it carries next_due_date, and repayments without user_id stay out of the user index.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    item TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS loans (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    due_bucket TEXT,
+    next_due_date TEXT,
+    item TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS loans_user_id ON loans (user_id, id);
+CREATE INDEX IF NOT EXISTS loans_due_bucket_next_due_date
+    ON loans (due_bucket, next_due_date, id) WHERE due_bucket IS NOT NULL;
+CREATE INDEX IF NOT EXISTS loans_user_id_next_due_date
+    ON loans (user_id, next_due_date) WHERE next_due_date IS NOT NULL;
+CREATE TABLE IF NOT EXISTS repayments (
+    id TEXT PRIMARY KEY,
+    user_id TEXT,
+    loan_id TEXT NOT NULL,
+    payment_date TEXT NOT NULL,
+    item TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS repayments_user_id_payment_date
+    ON repayments (user_id, payment_date, id) WHERE user_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS repayments_loan_id_payment_date ON repayments (loan_id, payment_date, id);
+CREATE TABLE IF NOT EXISTS summaries (
+    user_id TEXT PRIMARY KEY,
+    item TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS idempotency (
+    key TEXT PRIMARY KEY,
+    item TEXT NOT NULL
+);
+"""
+
+# Page size when a query has no limit, so iterators stream instead of loading a whole table
+DEFAULT_QUERY_PAGE_SIZE = 1000
+
+# Rows per INSERT batch in batch_writer
+BATCH_WRITE_SIZE = 500
+
+def dump_item(item: dict) -> str:
+    return simplejson.dumps(item, use_decimal=True, separators=(',', ':'))
+
+def load_item(text: str) -> dict:
+    # Every number comes back as a Decimal, as boto3 returns them
+    return simplejson.loads(text, use_decimal=True, parse_int=Decimal)
+
+def sqlite_errors(fn):
+    """Re-raise sqlite3 errors from a repository method as StorageError"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+    return wrapper
+
+def apply_update(item: dict, set_fields: Optional[Dict] = None, add_fields: Optional[Dict] = None,
+                 remove_fields: Iterable[str] = ()) -> dict:
+    """Apply SET / ADD / REMOVE to an item the way update_item does"""
+    item.update(set_fields or {})
+    for name, value in (add_fields or {}).items():
+        item[name] = Decimal(item.get(name, 0)) + Decimal(value)
+    for name in remove_fields:
+        item.pop(name, None)
+    return item
+
+def _page(rows: List[tuple], limit: Optional[int],
+          last_key: Callable[[dict], dict]) -> Tuple[List[dict], Optional[dict]]:
+    """Items of a page queried with LIMIT size + 1, and the key to continue from if there is more"""
+    size = limit or DEFAULT_QUERY_PAGE_SIZE
+    items = [load_item(row[0]) for row in rows[:size]]
+    return items, last_key(items[-1]) if len(rows) > size else None
+
+def _scan_page(database: 'SqliteDatabase', table: str, segment: int, total_segments: int,
+               attributes: Optional[Iterable[str]], limit: Optional[int],
+               exclusive_start_key: Optional[dict]) -> Tuple[List[dict], Optional[dict]]:
+    """scan_page over one of our tables: rowid modulo picks the segment, pages follow the primary key"""
+    sql, params = f'SELECT id, item FROM {table} WHERE rowid % ? = ?', [total_segments, segment]
+    if exclusive_start_key:
+        sql += ' AND id > ?'
+        params.append(exclusive_start_key['id'])
+    size = limit or DEFAULT_QUERY_PAGE_SIZE
+    params.append(size + 1)
+    rows = database.fetch_all(sql + ' ORDER BY id LIMIT ?', params)
+    items = []
+    for _, text in rows[:size]:
+        item = load_item(text)
+        if attributes:
+            item = {name: item[name] for name in attributes if name in item}
+        items.append(item)
+    return items, {'id': rows[size - 1][0]} if len(rows) > size else None
+
+class SqliteDatabase:
+    """One shared connection; a lock serializes access, which also makes every transaction atomic"""
+
+    def __init__(self, path: str = ':memory:'):
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.RLock()
+        if path != ':memory:':
+            self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+            self.connection.execute('COMMIT')
+
+    def fetch_all(self, sql: str, params: Iterable = ()) -> List[tuple]:
+        with self.lock:
+            return self.connection.execute(sql, tuple(params)).fetchall()
+
+    def fetch_item(self, sql: str, params: Iterable = ()) -> Optional[dict]:
+        rows = self.fetch_all(sql, params)
+        return load_item(rows[0][0]) if rows else None
+
+class SqliteBatchWriter:
+    """Buffers put(item) calls and inserts them BATCH_WRITE_SIZE rows per transaction"""
+
+    def __init__(self, database: SqliteDatabase, insert_sql: str, row: Callable[[dict], tuple]):
+        self.database = database
+        self.insert_sql = insert_sql
+        self.row = row
+        self.pending: List[tuple] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def put(self, item: dict) -> None:
+        self.pending.append(self.row(item))
+        if len(self.pending) >= BATCH_WRITE_SIZE:
+            self.flush()
+
+    @sqlite_errors
+    def flush(self) -> None:
+        if self.pending:
+            with self.database.transaction() as connection:
+                connection.executemany(self.insert_sql, self.pending)
+            self.pending = []
+
+class SqliteUserRepository(UserRepositoryBase):
+    def __init__(self, database: SqliteDatabase):
+        self.database = database
+
+    @sqlite_errors
+    def get(self, user_id: str) -> Optional[dict]:
+        return self.database.fetch_item('SELECT item FROM users WHERE id = ?', (user_id,))
+
+    @sqlite_errors
+    def put(self, item: dict) -> None:
+        with self.database.transaction() as connection:
+            connection.execute('INSERT OR REPLACE INTO users (id, item) VALUES (?, ?)', (item['id'], dump_item(item)))
+
+    @sqlite_errors
+    def scan_page(self, segment: int = 0, total_segments: int = 1, attributes: Optional[Iterable[str]] = None,
+                  limit: Optional[int] = None,
+                  exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        return _scan_page(self.database, 'users', segment, total_segments, attributes, limit, exclusive_start_key)
+
+# An upsert rather than INSERT OR REPLACE keeps the row's rowid, so updates do not move
+# a loan into another scan segment while the segments are being read
+LOAN_INSERT = (
+    'INSERT INTO loans (id, user_id, due_bucket, next_due_date, item) VALUES (?, ?, ?, ?, ?) '
+    'ON CONFLICT (id) DO UPDATE SET user_id = excluded.user_id, due_bucket = excluded.due_bucket, '
+    'next_due_date = excluded.next_due_date, item = excluded.item'
+)
+
+def _loan_row(item: dict) -> tuple:
+    return item['id'], item['user_id'], item.get('due_bucket'), item.get('next_due_date'), dump_item(item)
+
+class SqliteLoanRepository(LoanRepositoryBase):
+    def __init__(self, database: SqliteDatabase):
+        self.database = database
+
+    @sqlite_errors
+    def get(self, loan_id: str, consistent_read: bool = False) -> Optional[dict]:
+        # Every SQLite read is consistent
+        return self.database.fetch_item('SELECT item FROM loans WHERE id = ?', (loan_id,))
+
+    @sqlite_errors
+    def put(self, item: dict) -> None:
+        with self.database.transaction() as connection:
+            connection.execute(LOAN_INSERT, _loan_row(item))
+
+    def batch_writer(self):
+        return SqliteBatchWriter(self.database, LOAN_INSERT, _loan_row)
+
+    def update_in(self, connection, loan_id: str, user_id: Optional[str] = None,
+                  set_fields: Optional[Dict] = None, add_fields: Optional[Dict] = None,
+                  remove_fields: Iterable[str] = (), expected_version: Optional[int] = None) -> dict:
+        """update() inside an open transaction"""
+        row = connection.execute('SELECT item FROM loans WHERE id = ?', (loan_id,)).fetchone()
+        # Unlike update_item this never creates a loan; every caller updates an existing one
+        item = load_item(row[0]) if row else None
+        if item is None or (user_id is not None and item['user_id'] != user_id):
+            raise ConditionFailedError(f"Loan {loan_id} does not exist or belongs to another user")
+        if expected_version is not None and loan_version(item) != expected_version:
+            raise ConditionFailedError(f"Loan {loan_id} changed since it was read")
+        apply_update(item, set_fields, versioned(add_fields), remove_fields)
+        connection.execute(LOAN_INSERT, _loan_row(item))
+        return item
+
+    @sqlite_errors
+    def update(self, loan_id: str, user_id: Optional[str] = None, set_fields: Optional[Dict] = None,
+               add_fields: Optional[Dict] = None, remove_fields: Iterable[str] = (),
+               expected_version: Optional[int] = None) -> dict:
+        with self.database.transaction() as connection:
+            return self.update_in(
+                connection, loan_id, user_id, set_fields, add_fields, remove_fields, expected_version
+            )
+
+    @sqlite_errors
+    def update_many(self, updates: List[dict]) -> List[str]:
+        stale = []
+        for start in range(0, len(updates), BATCH_WRITE_SIZE):
+            with self.database.transaction() as connection:
+                for update in updates[start:start + BATCH_WRITE_SIZE]:
+                    row = connection.execute('SELECT item FROM loans WHERE id = ?', (update['loan_id'],)).fetchone()
+                    item = load_item(row[0]) if row else None
+                    if item is None or any(item.get(name) != value for name, value in update['expected'].items()):
+                        stale.append(update['loan_id'])
+                        continue
+                    apply_update(item, update.get('set_fields'), versioned(None), update.get('remove_fields', ()))
+                    connection.execute(LOAN_INSERT, _loan_row(item))
+        return stale
+
+    @sqlite_errors
+    def delete(self, loan_id: str, user_id: Optional[str] = None) -> dict:
+        with self.database.transaction() as connection:
+            row = connection.execute('SELECT item FROM loans WHERE id = ?', (loan_id,)).fetchone()
+            item = load_item(row[0]) if row else None
+            if item is None or (user_id is not None and item['user_id'] != user_id):
+                raise ConditionFailedError(f"Loan {loan_id} does not exist or belongs to another user")
+            connection.execute('DELETE FROM loans WHERE id = ?', (loan_id,))
+            return item
+
+    @sqlite_errors
+    def scan_page(self, segment: int = 0, total_segments: int = 1, attributes: Optional[Iterable[str]] = None,
+                  limit: Optional[int] = None,
+                  exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        return _scan_page(self.database, 'loans', segment, total_segments, attributes, limit, exclusive_start_key)
+
+    @sqlite_errors
+    def query_user_page(self, user_id: str, limit: Optional[int] = None,
+                        exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        sql, params = 'SELECT item FROM loans WHERE user_id = ?', [user_id]
+        if exclusive_start_key:
+            sql += ' AND id > ?'
+            params.append(exclusive_start_key['id'])
+        params.append((limit or DEFAULT_QUERY_PAGE_SIZE) + 1)
+        rows = self.database.fetch_all(sql + ' ORDER BY id LIMIT ?', params)
+        return _page(rows, limit, lambda item: {'id': item['id'], 'user_id': item['user_id']})
+
+    @sqlite_errors
+    def query_due_page(self, due_from: str, due_to: str, limit: Optional[int] = None,
+                       exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        sql = 'SELECT item FROM loans WHERE due_bucket = ? AND next_due_date BETWEEN ? AND ?'
+        params = [DUE_BUCKET, due_from, due_to]
+        if exclusive_start_key:
+            sql += ' AND (next_due_date > ? OR (next_due_date = ? AND id > ?))'
+            start_date = exclusive_start_key['next_due_date']
+            params += [start_date, start_date, exclusive_start_key['id']]
+        params.append((limit or DEFAULT_QUERY_PAGE_SIZE) + 1)
+        rows = self.database.fetch_all(sql + ' ORDER BY next_due_date, id LIMIT ?', params)
+        return _page(rows, limit, lambda item: {
+            'id': item['id'], 'due_bucket': item['due_bucket'], 'next_due_date': item['next_due_date']
+        })
+
+    @sqlite_errors
+    def next_due_date(self, user_id: str) -> Optional[str]:
+        rows = self.database.fetch_all(
+            'SELECT next_due_date FROM loans WHERE user_id = ? AND next_due_date IS NOT NULL '
+            'ORDER BY next_due_date LIMIT 1',
+            (user_id,)
+        )
+        return rows[0][0] if rows else None
+
+REPAYMENT_INSERT = 'INSERT INTO repayments (id, user_id, loan_id, payment_date, item) VALUES (?, ?, ?, ?, ?)'
+# Bulk puts overwrite like BatchWriteItem; record_repayment's plain INSERT refuses a duplicate id
+REPAYMENT_UPSERT = REPAYMENT_INSERT.replace('INSERT', 'INSERT OR REPLACE', 1)
+
+def _repayment_row(item: dict) -> tuple:
+    return item['id'], item.get('user_id'), item['loan_id'], item['payment_date'], dump_item(item)
+
+class SqliteRepaymentRepository(RepaymentRepositoryBase):
+    def __init__(self, database: SqliteDatabase):
+        self.database = database
+
+    def batch_writer(self):
+        return SqliteBatchWriter(self.database, REPAYMENT_UPSERT, _repayment_row)
+
+    def _query_page(self, key_name: str, key_value: str, limit: Optional[int],
+                    exclusive_start_key: Optional[dict]) -> Tuple[List[dict], Optional[dict]]:
+        # key_name is one of our two indexed columns, never user input
+        sql, params = f'SELECT item FROM repayments WHERE {key_name} = ?', [key_value]
+        if exclusive_start_key:
+            sql += ' AND (payment_date < ? OR (payment_date = ? AND id < ?))'
+            start_date = exclusive_start_key['payment_date']
+            params += [start_date, start_date, exclusive_start_key['id']]
+        params.append((limit or DEFAULT_QUERY_PAGE_SIZE) + 1)
+        rows = self.database.fetch_all(sql + ' ORDER BY payment_date DESC, id DESC LIMIT ?', params)
+        return _page(rows, limit, lambda item: {
+            'id': item['id'], key_name: item[key_name], 'payment_date': item['payment_date']
+        })
+
+    @sqlite_errors
+    def query_user_page(self, user_id: str, limit: Optional[int] = None,
+                        exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        return self._query_page('user_id', user_id, limit, exclusive_start_key)
+
+    @sqlite_errors
+    def query_loan_page(self, loan_id: str, limit: Optional[int] = None,
+                        exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        return self._query_page('loan_id', loan_id, limit, exclusive_start_key)
+
+    @sqlite_errors
+    def scan_page(self, segment: int = 0, total_segments: int = 1, attributes: Optional[Iterable[str]] = None,
+                  limit: Optional[int] = None,
+                  exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        return _scan_page(self.database, 'repayments', segment, total_segments, attributes, limit, exclusive_start_key)
+
+    @sqlite_errors
+    def fetch_for_loans(self, loan_ids: Iterable[str]) -> List[dict]:
+        loan_ids = list(loan_ids)
+        repayments = []
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(loan_ids), 500):
+            chunk = loan_ids[start:start + 500]
+            rows = self.database.fetch_all(
+                f"SELECT item FROM repayments WHERE loan_id IN ({', '.join('?' * len(chunk))})", chunk
+            )
+            repayments.extend(load_item(row[0]) for row in rows)
+        repayments.sort(key=lambda repayment: (repayment['payment_date'], repayment['id']), reverse=True)
+        return repayments
+
+    @sqlite_errors
+    def delete_loan_repayments(self, loan_id: str) -> int:
+        # One statement over the loan_id index; SQLite has no request size to batch around
+        with self.database.transaction() as connection:
+            return connection.execute('DELETE FROM repayments WHERE loan_id = ?', (loan_id,)).rowcount
+
+class SqliteSummaryRepository(SummaryRepositoryBase):
+    def __init__(self, database: SqliteDatabase):
+        self.database = database
+
+    @sqlite_errors
+    def get(self, user_id: str) -> Optional[dict]:
+        return self.database.fetch_item('SELECT item FROM summaries WHERE user_id = ?', (user_id,))
+
+    def update_in(self, connection, user_id: str, set_fields: Optional[Dict] = None,
+                  add_fields: Optional[Dict] = None) -> None:
+        """Apply a summary update inside an open transaction"""
+        row = connection.execute('SELECT item FROM summaries WHERE user_id = ?', (user_id,)).fetchone()
+        item = load_item(row[0]) if row else {'user_id': user_id}
+        apply_update(item, set_fields, {**(add_fields or {}), 'revision': 1})
+        connection.execute(
+            'INSERT OR REPLACE INTO summaries (user_id, item) VALUES (?, ?)', (user_id, dump_item(item))
+        )
+
+    @sqlite_errors
+    def add(self, user_id: str, deltas: Dict[str, Decimal]) -> None:
+        with self.database.transaction() as connection:
+            self.update_in(connection, user_id, add_fields=deltas)
+
+    @sqlite_errors
+    def replace(self, user_id: str, summary: dict, expected_revision: Optional[int] = None) -> None:
+        with self.database.transaction() as connection:
+            if expected_revision is not None:
+                row = connection.execute('SELECT item FROM summaries WHERE user_id = ?', (user_id,)).fetchone()
+                if int(load_item(row[0]).get('revision', 0) if row else 0) != expected_revision:
+                    raise ConditionFailedError(f"Summary of user {user_id} changed since it was read")
+            self.update_in(connection, user_id, set_fields=summary)
+
+class SqliteIdempotencyRepository(IdempotencyRepositoryBase):
+    # Expired records are overwritten by the next claim of their key rather than swept
+    def __init__(self, database: SqliteDatabase):
+        self.database = database
+
+    @sqlite_errors
+    def claim(self, record: dict, now: int) -> Optional[dict]:
+        with self.database.transaction() as connection:
+            row = connection.execute('SELECT item FROM idempotency WHERE key = ?', (record['key'],)).fetchone()
+            existing = load_item(row[0]) if row else None
+            if existing is not None and holds_key(existing, now):
+                return existing
+            connection.execute(
+                'INSERT OR REPLACE INTO idempotency (key, item) VALUES (?, ?)', (record['key'], dump_item(record))
+            )
+        return None
+
+    @staticmethod
+    def _held_claim(connection, key: str, token: str) -> dict:
+        row = connection.execute('SELECT item FROM idempotency WHERE key = ?', (key,)).fetchone()
+        item = load_item(row[0]) if row else None
+        if item is None or item.get('state') != PENDING or item.get('token') != token:
+            raise ConditionFailedError(f"Idempotency key {key} is no longer held by this claim")
+        return item
+
+    @sqlite_errors
+    def complete(self, key: str, token: str, status_code: int, body: str, expires_at: int) -> None:
+        with self.database.transaction() as connection:
+            item = apply_update(self._held_claim(connection, key, token), {
+                'state': COMPLETED, 'status_code': status_code, 'body': body, 'expires_at': expires_at
+            })
+            connection.execute('INSERT OR REPLACE INTO idempotency (key, item) VALUES (?, ?)', (key, dump_item(item)))
+
+    @sqlite_errors
+    def release(self, key: str, token: str) -> None:
+        with self.database.transaction() as connection:
+            self._held_claim(connection, key, token)
+            connection.execute('DELETE FROM idempotency WHERE key = ?', (key,))
+
+class SqliteStorage:
+    """
+    Repositories over an embedded SQLite database (':memory:' by default), with the
+    same indexes and ordering as the DynamoDB tables. For local load tests, profiling
+    and single-node deployments.
+    """
+
+    def __init__(self, path: str = ':memory:'):
+        self.database = SqliteDatabase(path)
+        self.users = SqliteUserRepository(self.database)
+        self.loans = SqliteLoanRepository(self.database)
+        self.repayments = SqliteRepaymentRepository(self.database)
+        self.summaries = SqliteSummaryRepository(self.database)
+        self.idempotency = SqliteIdempotencyRepository(self.database)
+
+    @sqlite_errors
+    def record_repayment(self, repayment: dict, set_fields: Optional[Dict] = None,
+                         add_fields: Optional[Dict] = None, remove_fields: Iterable[str] = (),
+                         summary_deltas: Optional[Dict[str, Decimal]] = None,
+                         expected_version: Optional[int] = None) -> None:
+        """Put a repayment, update its loan and add to the user's summary in one transaction"""
+        try:
+            with self.database.transaction() as connection:
+                connection.execute(REPAYMENT_INSERT, _repayment_row(repayment))
+                self.loans.update_in(
+                    connection, repayment['loan_id'], repayment['user_id'], set_fields, add_fields, remove_fields,
+                    expected_version
+                )
+                self.summaries.update_in(connection, repayment['user_id'], add_fields=summary_deltas)
+        except sqlite3.IntegrityError as e:
+            raise ConditionFailedError(f"Repayment {repayment['id']} already exists") from e
@@ -0,0 +1,21 @@
+import functools
+import os
+
+# Which implementation backs the repositories: "dynamodb" (default) or "sqlite",
+# an embedded database at SQLITE_DATABASE (":memory:" unless set)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'dynamodb').lower()
+SQLITE_DATABASE = os.getenv('SQLITE_DATABASE', ':memory:')
+
+@functools.lru_cache(maxsize=None)
+def get_storage():
+    """
+    The process-wide storage: an object with users, loans, repayments, summaries and
+    idempotency repositories plus record_repayment() for the repayment transaction.
+    """
+    if STORAGE_BACKEND == 'sqlite':
+        from .sqlite import SqliteStorage
+        return SqliteStorage(SQLITE_DATABASE)
+    if STORAGE_BACKEND == 'dynamodb':
+        from .dynamodb import DynamoDBStorage
+        return DynamoDBStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}; expected 'dynamodb' or 'sqlite'")
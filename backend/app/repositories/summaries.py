@@ -0,0 +1,51 @@
+from abc import ABC, abstractmethod
+from decimal import Decimal
+from typing import Dict, Optional
+
+from .errors import dynamodb_errors
+from .expressions import revision_condition, update_expression
+
+class SummaryRepositoryBase(ABC):
+    """Per-user portfolio summary access shared by every storage backend"""
+
+    @abstractmethod
+    def get(self, user_id: str) -> Optional[dict]:
+        """A user's summary item, or None before the first write or rebuild"""
+
+    @abstractmethod
+    def add(self, user_id: str, deltas: Dict[str, Decimal]) -> None:
+        """Atomically add deltas to a user's summary (creating it if needed) and bump its revision"""
+
+    @abstractmethod
+    def replace(self, user_id: str, summary: dict, expected_revision: Optional[int] = None) -> None:
+        """
+        Overwrite a user's summary fields with recomputed values and bump its revision.
+        With expected_revision, raises ConditionFailedError unless the summary still has
+        that revision (0: it has none yet), so a write made since it was read is kept.
+        """
+
+class SummaryRepository(SummaryRepositoryBase):
+    """Data access for the summaries table"""
+
+    def __init__(self, table):
+        self.table = table
+
+    @staticmethod
+    def delta_update(user_id: str, deltas: Dict[str, Decimal]) -> dict:
+        """update_item arguments that ADD deltas and bump the revision; also used inside transactions"""
+        return {'Key': {'user_id': user_id}, **update_expression(add_fields={**deltas, 'revision': 1})}
+
+    @dynamodb_errors
+    def get(self, user_id: str) -> Optional[dict]:
+        return self.table.get_item(Key={'user_id': user_id}).get('Item')
+
+    @dynamodb_errors
+    def add(self, user_id: str, deltas: Dict[str, Decimal]) -> None:
+        self.table.update_item(**self.delta_update(user_id, deltas))
+
+    @dynamodb_errors
+    def replace(self, user_id: str, summary: dict, expected_revision: Optional[int] = None) -> None:
+        self.table.update_item(
+            Key={'user_id': user_id},
+            **revision_condition(update_expression(set_fields=summary, add_fields={'revision': 1}), expected_revision)
+        )
@@ -0,0 +1,64 @@
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from .errors import dynamodb_errors
+from .expressions import projection
+
+class UserRepositoryBase(ABC):
+    """User profile access shared by every storage backend"""
+
+    @abstractmethod
+    def get(self, user_id: str) -> Optional[dict]:
+        """A user's profile item, or None if there is no such user"""
+
+    @abstractmethod
+    def put(self, item: dict) -> None:
+        """Store a user's profile item, overwriting any with the same id"""
+
+    @abstractmethod
+    def scan_page(self, segment: int = 0, total_segments: int = 1, attributes: Optional[Iterable[str]] = None,
+                  limit: Optional[int] = None,
+                  exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        """
+        Get one page of one segment of the whole table, optionally only some attributes,
+        and the key to continue from.
+        """
+
+    def iter_segment(self, segment: int = 0, total_segments: int = 1,
+                     attributes: Optional[Iterable[str]] = None) -> Iterator[dict]:
+        """Yield every user of one scan segment, one page at a time"""
+        start_key = None
+        while True:
+            items, start_key = self.scan_page(segment, total_segments, attributes, exclusive_start_key=start_key)
+            yield from items
+            if not start_key:
+                return
+
+class UserRepository(UserRepositoryBase):
+    """Data access for the users table"""
+
+    def __init__(self, table):
+        self.table = table
+
+    @dynamodb_errors
+    def get(self, user_id: str) -> Optional[dict]:
+        return self.table.get_item(Key={'id': user_id}).get('Item')
+
+    @dynamodb_errors
+    def put(self, item: dict) -> None:
+        self.table.put_item(Item=item)
+
+    @dynamodb_errors
+    def scan_page(self, segment: int = 0, total_segments: int = 1, attributes: Optional[Iterable[str]] = None,
+                  limit: Optional[int] = None,
+                  exclusive_start_key: Optional[dict] = None) -> Tuple[List[dict], Optional[dict]]:
+        kwargs = {'Segment': segment, 'TotalSegments': total_segments}
+        if attributes:
+            kwargs.update(projection(attributes))
+        if limit:
+            kwargs['Limit'] = limit
+        if exclusive_start_key:
+            kwargs['ExclusiveStartKey'] = exclusive_start_key
+
+        response = self.table.scan(**kwargs)
+        return response.get('Items', []), response.get('LastEvaluatedKey')
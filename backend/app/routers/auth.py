@@ -1,10 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from ..services import auth_service
 router = APIRouter()
 
 # You can add a simple health check or info endpoint if desired
 @router.get("/health", response_model=dict)
 async def health_check():
-    return {"status": "ok", "message": "Auth service is operational."}
+    return {
+        "status": "ok",
+        "message": "Auth service is operational.",
+        "token_cache": auth_service.verified_token_cache.stats(),
+        "user_profile_cache": auth_service.user_profile_cache.stats()
+    }
 
 @router.get("/")
 async def auth_root():
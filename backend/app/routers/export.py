@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+from itertools import chain
+from ..models.loan import Loan
+from ..models.repayment import Repayment
+from ..services import auth_service
+from ..services.db_executor import run_db
+from ..services.export import EXPORT_FORMATS, iter_export
+from ..repositories.errors import StorageError
+from ..repositories.storage import get_storage
+
+router = APIRouter()
+
+# Repositories of the configured storage backend (STORAGE_BACKEND)
+storage = get_storage()
+loan_repository = storage.loans
+repayment_repository = storage.repayments
+
+# dataset -> (model giving the columns, first-page query, iterator resuming from a key)
+DATASETS = {
+    'loans': (Loan, loan_repository.query_user_page, loan_repository.iter_user_loans),
+    'repayments': (Repayment, repayment_repository.query_user_page, repayment_repository.iter_user_repayments),
+}
+
+@router.get("/")
+async def export_data(
+    dataset: str = Query("loans", pattern="^(loans|repayments)$"),
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    current_user = Depends(auth_service.get_current_user)
+):
+    """
+    Stream every loan or repayment of the current user as CSV or JSON lines.
+    Rows are encoded as each storage page arrives, so memory use does not grow
+    with the size of the history. Columns follow the Loan / Repayment models.
+    """
+    model, query_first_page, iter_rest = DATASETS[dataset]
+    try:
+        # The first page is read up front so a failing query still gets a proper 500;
+        # once streaming starts the status line has already been sent
+        items, last_key = await run_db(query_first_page, current_user.id)
+    except StorageError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to export {dataset}: {str(e)}"
+        )
+
+    rows = chain(items, iter_rest(current_user.id, exclusive_start_key=last_key) if last_key else ())
+    filename = f"{dataset}-{datetime.utcnow().strftime('%Y%m%d')}.{format}"
+    # A sync generator is iterated in the threadpool, so later page reads do not block the event loop
+    return StreamingResponse(
+        iter_export(rows, model, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -1,174 +1,288 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
-import uuid
-from datetime import datetime
-import boto3
-from botocore.exceptions import ClientError
-import os
-from ..models.loan import Loan, LoanCreate
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, UploadFile, status
+from typing import List, Optional
+from ..models.loan import Loan, LoanCreate, ScheduleEntry
+from ..models.bulk_import import ImportResult
 from ..services import auth_service
+from ..services.bulk_import import import_loans, iter_upload_rows
+from ..services.amortization import generate_schedule, monthly_payment as calculate_monthly_payment
+from ..services.loan_totals import loan_status, new_loan_item, next_due_attributes, next_due_changes, write_loan_version
+from ..services.money import to_decimal
+from ..services.db_executor import run_db
+from ..services.etags import etag_headers, etag_matches, loan_etag, loan_page_etag, not_modified
+from ..services.idempotency import MAX_IDEMPOTENCY_KEY_LENGTH, begin_idempotent_request
+from ..services.summary_service import apply_summary_delta
+from ..services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, set_next_cursor
+from ..services.serialization import ItemProjector
+from ..repositories.errors import ConditionFailedError, StorageError
+from ..repositories.loans import loan_version
+from ..repositories.storage import get_storage
 
 router = APIRouter()
 
-# DynamoDB setup
-dynamodb = boto3.resource('dynamodb', region_name=os.getenv('AWS_REGION', 'us-east-1'))
-loans_table = dynamodb.Table(os.getenv('DYNAMODB_LOANS_TABLE', 'loansyncro-loans-dev'))
+# Repositories of the configured storage backend (STORAGE_BACKEND)
+storage = get_storage()
+loan_repository = storage.loans
+repayment_repository = storage.repayments
+summary_repository = storage.summaries
+idempotency_repository = storage.idempotency
+loan_projector = ItemProjector(Loan)
+schedule_projector = ItemProjector(ScheduleEntry)
 
 @router.post("/", response_model=Loan, status_code=status.HTTP_201_CREATED)
-async def create_loan(loan: LoanCreate, current_user = Depends(auth_service.get_current_user)):
-    loan_id = str(uuid.uuid4())
-    
-    # Calculate total amount and monthly payment
-    principal = loan.amount
-    rate = loan.interest_rate / 100 / 12  # Monthly interest rate
-    term = loan.term_months
-    
-    # Formula for monthly payment: P * r * (1 + r)^n / ((1 + r)^n - 1)
-    if rate > 0:
-        monthly_payment = principal * rate * (1 + rate)**term / ((1 + rate)**term - 1)
-    else:
-        monthly_payment = principal / term  # No interest case
-    
-    total_amount = monthly_payment * term
-    
-    loan_data = {
-        "id": loan_id,
-        "user_id": current_user["id"],
-        "title": loan.title,
-        "amount": float(loan.amount),
-        "interest_rate": float(loan.interest_rate),
-        "term_months": int(loan.term_months),
-        "start_date": loan.start_date.isoformat(),
-        "description": loan.description or "",
-        "created_at": datetime.utcnow().isoformat(),
-        "total_amount": float(total_amount),
-        "monthly_payment": float(monthly_payment),
-        "status": "active"
-    }
+async def create_loan(
+    loan: LoanCreate,
+    current_user = Depends(auth_service.get_current_user),
+    idempotency_key: Optional[str] = Header(None, max_length=MAX_IDEMPOTENCY_KEY_LENGTH)
+):
+    """
+    Create a loan. With an Idempotency-Key header, a retry of the same request gets
+    the original response back instead of creating a second loan.
+    """
+    claim, replay = await run_db(
+        begin_idempotent_request, idempotency_repository, current_user.id, "POST /loans", idempotency_key, loan
+    )
+    if replay is not None:
+        return replay
+    try:
+        loan_data = await _create_loan(loan, current_user)
+    except Exception:
+        if claim is not None:
+            await run_db(claim.release)
+        raise
+    if claim is None:
+        return loan_projector.item_response(loan_data, status.HTTP_201_CREATED)
+    return await run_db(claim.finish, status.HTTP_201_CREATED, loan_projector.project(loan_data))
+
+async def _create_loan(loan: LoanCreate, current_user) -> dict:
+    # Derives the monthly payment, total amount and first due date
+    loan_data = new_loan_item(loan, current_user.id)
     
     try:
-        loans_table.put_item(Item=loan_data)
+        await run_db(loan_repository.put, loan_data)
+        await run_db(
+            apply_summary_delta, summary_repository, current_user.id,
+            total_loans=1, total_borrowed=loan.amount, total_amount=loan_data['total_amount']
+        )
         return loan_data
-    except ClientError as e:
+    except StorageError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create loan: {str(e)}"
         )
 
+@router.post("/import", response_model=ImportResult)
+async def import_loans_file(file: UploadFile = File(...), current_user = Depends(auth_service.get_current_user)):
+    """Create loans from a CSV (with a header row) or JSON-lines upload; invalid rows are reported, not fatal"""
+    rows = iter_upload_rows(file.file, file.filename or "", file.content_type or "")
+    try:
+        return await run_db(import_loans, storage, current_user.id, rows)
+    except StorageError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to import loans: {str(e)}"
+        )
+
 @router.get("/", response_model=List[Loan])
-async def get_loans(current_user = Depends(auth_service.get_current_user)):
+async def get_loans(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user = Depends(auth_service.get_current_user),
+    if_none_match: Optional[str] = Header(None)
+):
+    """A page of the user's loans; with If-None-Match, an unchanged page is a 304 that skips serializing it"""
+    start_key = decode_cursor(cursor, user_id=current_user.id)
     try:
-        response = loans_table.query(
-            IndexName='user-id-index',
-            KeyConditionExpression='user_id = :user_id',
-            ExpressionAttributeValues={':user_id': current_user["id"]}
+        loans, last_key = await run_db(
+            loan_repository.query_user_page, current_user.id, limit=limit, exclusive_start_key=start_key
         )
-        return response.get('Items', [])
-    except ClientError as e:
+        etag = loan_page_etag(loans, last_key)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        # Our own items need no re-validation; the projector shapes them like List[Loan]
+        page = loan_projector.response(loans, headers=etag_headers(etag))
+        set_next_cursor(page, last_key)
+        return page
+    except StorageError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to fetch loans: {str(e)}"
         )
 
 @router.get("/{loan_id}", response_model=Loan)
-async def get_loan(loan_id: str, current_user = Depends(auth_service.get_current_user)):
+async def get_loan(
+    loan_id: str,
+    current_user = Depends(auth_service.get_current_user),
+    if_none_match: Optional[str] = Header(None)
+):
     try:
-        response = loans_table.get_item(Key={'id': loan_id})
-        loan = response.get('Item')
+        loan = await run_db(loan_repository.get, loan_id)
         
         if not loan:
             raise HTTPException(status_code=404, detail="Loan not found")
         
-        if loan["user_id"] != current_user["id"]:
+        if loan["user_id"] != current_user.id:
             raise HTTPException(status_code=403, detail="Not authorized to access this loan")
         
-        return loan
-    except ClientError as e:
+        etag = loan_etag(loan)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        return loan_projector.item_response(loan, headers=etag_headers(etag))
+    except StorageError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to fetch loan: {str(e)}"
         )
 
+@router.get("/{loan_id}/schedule", response_model=List[ScheduleEntry])
+async def get_loan_schedule(loan_id: str, current_user = Depends(auth_service.get_current_user)):
+    try:
+        loan = await run_db(loan_repository.get, loan_id)
+        
+        if not loan:
+            raise HTTPException(status_code=404, detail="Loan not found")
+        
+        if loan["user_id"] != current_user.id:
+            raise HTTPException(status_code=403, detail="Not authorized to access this loan")
+        
+        return schedule_projector.response(
+            generate_schedule(
+                loan['amount'], loan['interest_rate'], loan['term_months'], loan['start_date'],
+                loan.get('monthly_payment')
+            )
+        )
+    except StorageError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch loan schedule: {str(e)}"
+        )
+
 @router.put("/{loan_id}", response_model=Loan)
 async def update_loan(loan_id: str, loan_update: LoanCreate, current_user = Depends(auth_service.get_current_user)):
+    """
+    Replace a loan's terms. Status and next due date follow from the amount repaid, so
+    the loan is read once and the write is conditional on its owner and the version
+    read (redone from a fresh read if a repayment got in first); the write returns the
+    updated loan, so it is not read again.
+    """
     try:
-        # First check if loan exists and belongs to user
-        response = loans_table.get_item(Key={'id': loan_id})
-        existing_loan = response.get('Item')
+        existing_loan = await run_db(loan_repository.get, loan_id)
         
         if not existing_loan:
             raise HTTPException(status_code=404, detail="Loan not found")
         
-        if existing_loan["user_id"] != current_user["id"]:
+        if existing_loan["user_id"] != current_user.id:
             raise HTTPException(status_code=403, detail="Not authorized to update this loan")
         
         # Recalculate total amount and monthly payment with new values
-        principal = loan_update.amount
-        rate = loan_update.interest_rate / 100 / 12  # Monthly interest rate
-        term = loan_update.term_months
-        
-        if rate > 0:
-            monthly_payment = principal * rate * (1 + rate)**term / ((1 + rate)**term - 1)
-        else:
-            monthly_payment = principal / term
+        monthly_payment = calculate_monthly_payment(
+            loan_update.amount, loan_update.interest_rate, loan_update.term_months
+        )
+        total_amount = monthly_payment * loan_update.term_months
         
-        total_amount = monthly_payment * term
+        def write(loan: dict):
+            # A new total can pay a loan off (or re-open it); the running total makes that a lookup
+            # New terms move the next installment, so re-derive the due date from the amount repaid
+            due_attributes = next_due_attributes({
+                'start_date': loan_update.start_date.isoformat(),
+                'term_months': loan_update.term_months,
+                'monthly_payment': monthly_payment,
+                'total_amount': total_amount,
+            }, loan.get('total_repaid', 0))
+            due_set, due_remove = next_due_changes(due_attributes)
+            new_status = loan_status(
+                loan.get('total_repaid', 0), total_amount, loan.get('status', 'active'),
+                due_attributes.get('next_due_date')
+            )
+            
+            return loan, loan_repository.update(
+                loan_id, current_user.id,
+                set_fields={
+                    'title': loan_update.title,
+                    'amount': loan_update.amount,
+                    'interest_rate': loan_update.interest_rate,
+                    'term_months': int(loan_update.term_months),
+                    'start_date': loan_update.start_date.isoformat(),
+                    'description': loan_update.description or "",
+                    'total_amount': total_amount,
+                    'monthly_payment': monthly_payment,
+                    'status': new_status,
+                    **due_set
+                },
+                remove_fields=due_remove,
+                expected_version=loan_version(loan)
+            )
         
-        # Update loan data
-        update_expression = """
-            SET title = :title,
-                amount = :amount,
-                interest_rate = :interest_rate,
-                term_months = :term_months,
-                start_date = :start_date,
-                description = :description,
-                total_amount = :total_amount,
-                monthly_payment = :monthly_payment
-        """
+        try:
+            previous_loan, updated_loan = await run_db(
+                write_loan_version, loan_repository, existing_loan, current_user.id, write
+            )
+        except ConditionFailedError:
+            raise await _write_failed(loan_id, current_user.id, "update")
         
-        loans_table.update_item(
-            Key={'id': loan_id},
-            UpdateExpression=update_expression,
-            ExpressionAttributeValues={
-                ':title': loan_update.title,
-                ':amount': float(loan_update.amount),
-                ':interest_rate': float(loan_update.interest_rate),
-                ':term_months': int(loan_update.term_months),
-                ':start_date': loan_update.start_date.isoformat(),
-                ':description': loan_update.description or "",
-                ':total_amount': float(total_amount),
-                ':monthly_payment': float(monthly_payment)
-            }
+        await run_db(
+            apply_summary_delta, summary_repository, current_user.id,
+            total_borrowed=loan_update.amount - to_decimal(previous_loan.get('amount')),
+            total_amount=total_amount - to_decimal(previous_loan.get('total_amount'))
         )
         
-        # Return updated loan
-        response = loans_table.get_item(Key={'id': loan_id})
-        return response.get('Item')
+        return loan_projector.item_response(updated_loan)
         
-    except ClientError as e:
+    except StorageError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to update loan: {str(e)}"
         )
 
 @router.delete("/{loan_id}")
-async def delete_loan(loan_id: str, current_user = Depends(auth_service.get_current_user)):
+async def delete_loan(
+    loan_id: str,
+    cascade: bool = Query(False, description="Also delete the loan's repayments"),
+    current_user = Depends(auth_service.get_current_user)
+):
+    """
+    Delete a loan with one write that is conditional on its owner and returns what it
+    deleted. Its repayments stop counting towards the summary either way; with
+    cascade=true they are deleted too, in batches, instead of being left behind.
+    """
     try:
-        # First check if loan exists and belongs to user
-        response = loans_table.get_item(Key={'id': loan_id})
-        loan = response.get('Item')
-        
-        if not loan:
-            raise HTTPException(status_code=404, detail="Loan not found")
-        
-        if loan["user_id"] != current_user["id"]:
-            raise HTTPException(status_code=403, detail="Not authorized to delete this loan")
+        try:
+            loan = await run_db(loan_repository.delete, loan_id, current_user.id)
+        except ConditionFailedError:
+            raise await _write_failed(loan_id, current_user.id, "delete")
         
-        loans_table.delete_item(Key={'id': loan_id})
-        return {"message": "Loan deleted successfully"}
-        
-    except ClientError as e:
+        await run_db(
+            apply_summary_delta, summary_repository, current_user.id,
+            total_loans=-1,
+            total_borrowed=-to_decimal(loan.get('amount')),
+            total_amount=-to_decimal(loan.get('total_amount')),
+            total_repaid=-to_decimal(loan.get('total_repaid'))
+        )
+    except StorageError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to delete loan: {str(e)}"
         )
+    
+    if not cascade:
+        return {"message": "Loan deleted successfully"}
+    try:
+        repayments_deleted = await run_db(repayment_repository.delete_loan_repayments, loan_id)
+    except StorageError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Loan deleted, but failed to delete its repayments: {str(e)}"
+        )
+    return {"message": "Loan deleted successfully", "repayments_deleted": repayments_deleted}
+
+async def _write_failed(loan_id: str, user_id: str, action: str) -> HTTPException:
+    """
+    The error for a conditional loan write that did not apply. Only now is the loan
+    read, to tell a missing loan (404) from someone else's (403); a loan that is
+    still ours kept changing under the write (409).
+    """
+    loan = await run_db(loan_repository.get, loan_id, consistent_read=True)
+    if not loan:
+        return HTTPException(status_code=404, detail="Loan not found")
+    if loan["user_id"] != user_id:
+        return HTTPException(status_code=403, detail=f"Not authorized to {action} this loan")
+    return HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Loan kept changing while trying to {action} it")
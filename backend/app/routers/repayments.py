@@ -1,204 +1,207 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, UploadFile, status
+from typing import List, Optional
 import uuid
 from datetime import datetime
-import boto3
-from botocore.exceptions import ClientError
 import os
 from ..models.repayment import Repayment, RepaymentCreate, Summary
+from ..models.bulk_import import ImportResult
 from ..services import auth_service
+from ..services.bulk_import import import_repayments, iter_upload_rows
+from ..services.loan_totals import record_repayment
+from ..services.db_executor import run_db
+from ..services.etags import etag_headers, etag_matches, not_modified
+from ..services.idempotency import MAX_IDEMPOTENCY_KEY_LENGTH, begin_idempotent_request
+from ..services.summary_service import get_summary as get_user_summary
+from ..services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, set_next_cursor
+from ..services.serialization import ItemProjector
+from ..repositories.errors import ConditionFailedError, StorageError
+from ..repositories.storage import get_storage
 
 router = APIRouter()
 
-# DynamoDB setup
-dynamodb = boto3.resource('dynamodb', region_name=os.getenv('AWS_REGION', 'us-east-1'))
-repayments_table = dynamodb.Table(os.getenv('DYNAMODB_REPAYMENTS_TABLE', 'loansyncro-repayments-dev'))
-loans_table = dynamodb.Table(os.getenv('DYNAMODB_LOANS_TABLE', 'loansyncro-loans-dev'))
+# Repositories of the configured storage backend (STORAGE_BACKEND)
+storage = get_storage()
+loan_repository = storage.loans
+repayment_repository = storage.repayments
+summary_repository = storage.summaries
+idempotency_repository = storage.idempotency
+repayment_projector = ItemProjector(Repayment)
+summary_projector = ItemProjector(Summary)
 
-def update_loan_status(loan_id: str):
-    """Update loan status based on total repayments"""
-    try:
-        # Get loan details
-        loan_response = loans_table.get_item(Key={'id': loan_id})
-        loan = loan_response.get('Item')
-        
-        if not loan:
-            return
-        
-        # Calculate total repayments for this loan
-        repayments_response = repayments_table.query(
-            IndexName='loan-id-index',
-            KeyConditionExpression='loan_id = :loan_id',
-            ExpressionAttributeValues={':loan_id': loan_id}
-        )
-        
-        total_repaid = sum(
-            float(repayment.get('amount', 0)) 
-            for repayment in repayments_response.get('Items', [])
-        )
-        
-        # Update loan status based on repayment progress
-        new_status = loan.get('status', 'active')
-        if total_repaid >= float(loan.get('total_amount', 0)):
-            new_status = 'paid'
-        elif total_repaid > 0:
-            new_status = 'active'
-        
-        # Update loan status if changed
-        if new_status != loan.get('status'):
-            loans_table.update_item(
-                Key={'id': loan_id},
-                UpdateExpression='SET #status = :status',
-                ExpressionAttributeNames={'#status': 'status'},
-                ExpressionAttributeValues={':status': new_status}
-            )
-            
-    except ClientError as e:
-        print(f"Error updating loan status: {e}")
+# Set to "false" to fall back to the per-loan fan-out while user-id-payment-date-index
+# is being created or backfilled (see scripts/backfill_repayment_user_index.py)
+USE_USER_REPAYMENT_INDEX = os.getenv('USE_USER_REPAYMENT_INDEX', 'true').lower() == 'true'
 
 @router.post("/", response_model=Repayment, status_code=status.HTTP_201_CREATED)
-async def create_repayment(repayment: RepaymentCreate, current_user = Depends(auth_service.get_current_user)):
+async def create_repayment(
+    repayment: RepaymentCreate,
+    current_user = Depends(auth_service.get_current_user),
+    idempotency_key: Optional[str] = Header(None, max_length=MAX_IDEMPOTENCY_KEY_LENGTH)
+):
+    """
+    Record a repayment. With an Idempotency-Key header, a retry of the same request
+    gets the original response back instead of recording the repayment twice.
+    """
+    claim, replay = await run_db(
+        begin_idempotent_request, idempotency_repository, current_user.id, "POST /repayments",
+        idempotency_key, repayment
+    )
+    if replay is not None:
+        return replay
+    try:
+        repayment_data = await _create_repayment(repayment, current_user)
+    except Exception:
+        if claim is not None:
+            await run_db(claim.release)
+        raise
+    if claim is None:
+        return repayment_projector.item_response(repayment_data, status.HTTP_201_CREATED)
+    return await run_db(claim.finish, status.HTTP_201_CREATED, repayment_projector.project(repayment_data))
+
+async def _create_repayment(repayment: RepaymentCreate, current_user) -> dict:
     # Verify loan exists and belongs to user
     try:
-        loan_response = loans_table.get_item(Key={'id': repayment.loan_id})
-        loan = loan_response.get('Item')
+        loan = await run_db(loan_repository.get, repayment.loan_id)
         
         if not loan:
             raise HTTPException(status_code=404, detail="Loan not found")
         
-        if loan["user_id"] != current_user["id"]:
+        if loan["user_id"] != current_user.id:
             raise HTTPException(status_code=403, detail="Not authorized to access this loan")
         
         repayment_id = str(uuid.uuid4())
         repayment_data = {
             "id": repayment_id,
             "loan_id": repayment.loan_id,
-            "user_id": current_user["id"],
-            "amount": float(repayment.amount),
+            "user_id": current_user.id,
+            "amount": repayment.amount,
             "payment_date": repayment.payment_date.isoformat(),
             "notes": repayment.notes or "",
             "created_at": datetime.utcnow().isoformat()
         }
         
-        repayments_table.put_item(Item=repayment_data)
-        
-        # Update loan status after adding repayment
-        update_loan_status(repayment.loan_id)
+        # Write the repayment and bump the loan's running totals and status atomically
+        await run_db(record_repayment, storage, repayment_data, loan)
         
         return repayment_data
         
-    except ClientError as e:
+    except ConditionFailedError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Loan was removed, reassigned or kept changing while recording the repayment"
+        )
+    except StorageError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create repayment: {str(e)}"
         )
 
-@router.get("/", response_model=List[Repayment])
-async def get_all_repayments(current_user = Depends(auth_service.get_current_user)):
-    """Get all repayments for the current user"""
+@router.post("/import", response_model=ImportResult)
+async def import_repayments_file(file: UploadFile = File(...), current_user = Depends(auth_service.get_current_user)):
+    """
+    Record repayments from a CSV (with a header row) or JSON-lines upload. Ownership is
+    checked once per loan and loan totals are updated once per loan after all rows.
+    """
+    rows = iter_upload_rows(file.file, file.filename or "", file.content_type or "")
     try:
-        # Get all loans for the user first
-        loans_response = loans_table.query(
-            IndexName='user-id-index',
-            KeyConditionExpression='user_id = :user_id',
-            ExpressionAttributeValues={':user_id': current_user["id"]}
+        return await run_db(import_repayments, storage, current_user.id, rows)
+    except StorageError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to import repayments: {str(e)}"
         )
-        
-        user_loan_ids = [loan['id'] for loan in loans_response.get('Items', [])]
-        
-        # Get all repayments for the user's loans
-        all_repayments = []
-        for loan_id in user_loan_ids:
-            repayments_response = repayments_table.query(
-                IndexName='loan-id-index',
-                KeyConditionExpression='loan_id = :loan_id',
-                ExpressionAttributeValues={':loan_id': loan_id}
+
+@router.get("/", response_model=List[Repayment])
+async def get_all_repayments(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user = Depends(auth_service.get_current_user)
+):
+    """Get a page of repayments for the current user, most recent first"""
+    start_key = decode_cursor(cursor, user_id=current_user.id)
+    try:
+        if USE_USER_REPAYMENT_INDEX:
+            repayments, last_key = await run_db(
+                repayment_repository.query_user_page, current_user.id, limit=limit, exclusive_start_key=start_key
             )
-            all_repayments.extend(repayments_response.get('Items', []))
-        
-        # Sort by payment date (most recent first)
-        all_repayments.sort(key=lambda x: x.get('payment_date', ''), reverse=True)
-        
-        return all_repayments
-        
-    except ClientError as e:
+        else:
+            repayments, last_key = await _query_loans_page(current_user.id, limit, start_key)
+        # Our own items need no re-validation; the projector shapes them like List[Repayment]
+        page = repayment_projector.response(repayments)
+        set_next_cursor(page, last_key)
+        return page
+        
+    except StorageError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to fetch repayments: {str(e)}"
         )
 
+async def _query_loans_page(user_id: str, limit: int, start_key: Optional[dict]):
+    """
+    Page through a user's repayments loan by loan, for while the user index is unavailable.
+    Pages are most recent first within each loan rather than across all of them.
+    """
+    user_loans = await run_db(loan_repository.list_user_loans, user_id)
+    loan_ids = sorted(loan['id'] for loan in user_loans)
+    if start_key is not None:
+        # The cursor names the loan to resume with and, mid-loan, that loan's own start key
+        loan_id, resume = start_key.get('loan_id'), start_key.get('start_key')
+        resumes_loan = resume is None or isinstance(resume, dict) and resume.get('loan_id') == loan_id
+        if loan_id not in loan_ids or not resumes_loan:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination cursor")
+    repayments, last_key = await run_db(
+        repayment_repository.query_loans_page, loan_ids, limit=limit, exclusive_start_key=start_key
+    )
+    return repayments, last_key and {'user_id': user_id, **last_key}
+
 @router.get("/loan/{loan_id}", response_model=List[Repayment])
-async def get_loan_repayments(loan_id: str, current_user = Depends(auth_service.get_current_user)):
+async def get_loan_repayments(
+    loan_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user = Depends(auth_service.get_current_user)
+):
+    start_key = decode_cursor(cursor, loan_id=loan_id)
     try:
         # Verify loan exists and belongs to user
-        loan_response = loans_table.get_item(Key={'id': loan_id})
-        loan = loan_response.get('Item')
+        loan = await run_db(loan_repository.get, loan_id)
         
         if not loan:
             raise HTTPException(status_code=404, detail="Loan not found")
         
-        if loan["user_id"] != current_user["id"]:
+        if loan["user_id"] != current_user.id:
             raise HTTPException(status_code=403, detail="Not authorized to access this loan")
         
-        repayments_response = repayments_table.query(
-            IndexName='loan-id-index',
-            KeyConditionExpression='loan_id = :loan_id',
-            ExpressionAttributeValues={':loan_id': loan_id}
+        # loan-id-payment-date-index returns the page already sorted most recent first
+        loan_repayments, last_key = await run_db(
+            repayment_repository.query_loan_page, loan_id, limit=limit, exclusive_start_key=start_key
         )
+        page = repayment_projector.response(loan_repayments)
+        set_next_cursor(page, last_key)
+        return page
         
-        loan_repayments = repayments_response.get('Items', [])
-        
-        # Sort by payment date (most recent first)
-        loan_repayments.sort(key=lambda x: x.get('payment_date', ''), reverse=True)
-        
-        return loan_repayments
-        
-    except ClientError as e:
+    except StorageError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to fetch loan repayments: {str(e)}"
         )
 
 @router.get("/summary", response_model=Summary)
-async def get_summary(current_user = Depends(auth_service.get_current_user)):
+async def get_summary(
+    current_user = Depends(auth_service.get_current_user),
+    if_none_match: Optional[str] = Header(None)
+):
     try:
-        # Get all loans for the user
-        loans_response = loans_table.query(
-            IndexName='user-id-index',
-            KeyConditionExpression='user_id = :user_id',
-            ExpressionAttributeValues={':user_id': current_user["id"]}
+        # Maintained incrementally on every loan and repayment write, so this is one get_item
+        summary, etag = await run_db(
+            get_user_summary, summary_repository, loan_repository, repayment_repository, current_user.id
         )
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        return summary_projector.item_response(summary, headers=etag_headers(etag))
         
-        user_loans = loans_response.get('Items', [])
-        
-        # Get all repayments for the user's loans
-        all_repayments = []
-        for loan in user_loans:
-            repayments_response = repayments_table.query(
-                IndexName='loan-id-index',
-                KeyConditionExpression='loan_id = :loan_id',
-                ExpressionAttributeValues={':loan_id': loan['id']}
-            )
-            all_repayments.extend(repayments_response.get('Items', []))
-        
-        # Calculate summary values
-        total_loans = len(user_loans)
-        total_borrowed = sum(float(loan.get('amount', 0)) for loan in user_loans)
-        total_repaid = sum(float(repayment.get('amount', 0)) for repayment in all_repayments)
-        outstanding_amount = sum(float(loan.get('total_amount', 0)) for loan in user_loans) - total_repaid
-        
-        # Find the next payment due (simplified - in real app you'd calculate based on payment schedules)
-        next_payment_due = None
-        
-        return {
-            "total_loans": total_loans,
-            "total_borrowed": total_borrowed,
-            "total_repaid": total_repaid,
-            "outstanding_amount": max(0, outstanding_amount),
-            "next_payment_due": next_payment_due
-        }
-        
-    except ClientError as e:
+    except StorageError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to fetch summary: {str(e)}"
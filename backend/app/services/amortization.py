@@ -0,0 +1,159 @@
+import calendar
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .money import CENT, round_money, to_decimal
+
+def monthly_payment(principal, annual_rate, term_months: int) -> Decimal:
+    """
+    Level monthly payment for a fixed-rate loan, P * r * (1 + r)^n / ((1 + r)^n - 1),
+    in Decimal and rounded to the cent so payment * term is an exact total
+    """
+    principal = to_decimal(principal)
+    rate = to_decimal(annual_rate) / 1200
+    term_months = int(term_months)
+    if rate > 0:
+        growth = (1 + rate) ** term_months
+        return round_money(principal * rate * growth / (growth - 1))
+    return round_money(principal / term_months)  # No interest case
+
+def installment_due_date(start_date, period: int) -> date:
+    """Due date of installment `period` (1-based); matches the due dates in schedule_arrays"""
+    start = date.fromisoformat(str(start_date)[:10])
+    months = start.month - 1 + period
+    year, month = start.year + months // 12, months % 12 + 1
+    return date(year, month, min(start.day, calendar.monthrange(year, month)[1]))
+
+def next_due_date(start_date, term_months: int, monthly_payment, total_repaid) -> Optional[date]:
+    """
+    Due date of the first installment that total_repaid does not cover yet, or None
+    once every installment is covered. Each installment gets a cent of slack, so
+    payments rounded to the cent do not leave installments open.
+    """
+    payment = to_decimal(monthly_payment) - CENT
+    if payment <= 0:
+        return None
+    covered = int(to_decimal(total_repaid) // payment)
+    if covered >= int(term_months):
+        return None
+    return installment_due_date(start_date, covered + 1)
+
+def schedule_arrays(principals: Sequence, annual_rates: Sequence, terms: Sequence[int],
+                    start_dates: Sequence[Union[date, datetime, str]],
+                    payments: Optional[Sequence] = None) -> dict:
+    """
+    Amortization schedules for a batch of loans, computed without per-period loops.
+    Every array is (loans x longest term); period k of loan i sits in column k - 1 and
+    columns past a loan's own term are masked out (zeros, NaT due dates, mask False).
+    The balance after k payments has a closed form, so each column is independent:
+        B_k = P (1 + r)^k - M ((1 + r)^k - 1) / r       (B_k = P - M k when r = 0)
+    M is each loan's entry in payments (the stored monthly_payment), or monthly_payment()
+    where that is missing, so a schedule never disagrees with its loan by a cent. Each
+    B_k is rounded to the cent; a period's principal is B_(k-1) - B_k and its interest
+    M minus that, so every row is exact to the cent. The last installment settles
+    whatever balance is left.
+    """
+    principal = np.asarray(principals, dtype=float)
+    rate = np.asarray(annual_rates, dtype=float) / 100 / 12
+    term = np.asarray(terms, dtype=np.int64)
+    start = np.array([str(d)[:10] for d in start_dates], dtype='datetime64[D]')
+
+    periods = np.arange(1, int(term.max(initial=0)) + 1)
+    mask = periods[None, :] <= term[:, None]
+
+    # The installment comes from the Decimal formula, one call per loan rather than per
+    # period; float math here could land a cent away from the stored monthly_payment
+    if payments is None:
+        payments = [None] * len(term)
+    payment = np.array([
+        float(monthly_payment(p, r, t) if m is None else m) if t > 0 else 0.0
+        for p, r, t, m in zip(principals, annual_rates, terms, payments)
+    ], dtype=float)
+
+    # np.where evaluates both branches, so the divisor is made safe for the branch not taken
+    has_interest = (rate > 0) & (term > 0)
+    safe_rate = np.where(has_interest, rate, 1.0)
+
+    r, p, m = rate[:, None], principal[:, None].round(2), payment[:, None]
+    growth = (1 + r)**periods[None, :]
+    balance = np.where(
+        has_interest[:, None],
+        p * growth - m * (growth - 1) / safe_rate[:, None],
+        p - m * periods[None, :]
+    )
+    # Balances are rounded to the cent first and every other column is derived from
+    # them, so each row adds up exactly and the principal column sums to the amount
+    last = periods[None, :] >= term[:, None]
+    balance = np.where(last, 0.0, np.maximum(balance, 0.0)).round(2)
+    opening_balance = np.concatenate([p, balance[:, :-1]], axis=1)
+    principal_paid = (opening_balance - balance).round(2)
+    # The last installment pays off what is left, with its own interest
+    interest = np.where(last, (opening_balance * r).round(2), (m - principal_paid).round(2))
+    installment = np.where(last, (principal_paid + interest).round(2), m)
+
+    # Due dates keep the start date's day of month, clamped to shorter months (Jan 31 -> Feb 28)
+    start_month = start.astype('datetime64[M]')
+    day_offset = (start - start_month.astype('datetime64[D]'))[:, None]
+    due_month = start_month[:, None] + periods[None, :]
+    month_days = (due_month + 1).astype('datetime64[D]') - due_month.astype('datetime64[D]')
+    due_date = due_month.astype('datetime64[D]') + np.minimum(day_offset, month_days - 1)
+
+    return {
+        "period": np.broadcast_to(periods, mask.shape),
+        "due_date": np.where(mask, due_date, np.datetime64('NaT')),
+        "payment": np.where(mask, installment, 0.0),
+        "principal": np.where(mask, principal_paid, 0.0),
+        "interest": np.where(mask, interest, 0.0),
+        "balance": np.where(mask, balance, 0.0),
+        "mask": mask,
+    }
+
+def generate_schedule(principal, annual_rate, term_months: int, start_date, payment=None) -> List[dict]:
+    """Per-period schedule of a single loan, one dict per payment; payment is its stored monthly_payment"""
+    arrays = schedule_arrays([principal], [annual_rate], [term_months], [start_date], [payment])
+    count = int(arrays["mask"][0].sum())
+    return [
+        {
+            "period": int(period),
+            "due_date": due_date.item(),
+            "payment": round_money(float(payment)),
+            "principal": round_money(float(principal_paid)),
+            "interest": round_money(float(interest)),
+            "balance": round_money(float(balance)),
+        }
+        for period, due_date, payment, principal_paid, interest, balance in zip(
+            arrays["period"][0, :count],
+            arrays["due_date"][0, :count],
+            arrays["payment"][0, :count],
+            arrays["principal"][0, :count],
+            arrays["interest"][0, :count],
+            arrays["balance"][0, :count],
+        )
+    ]
+
+def iter_loan_schedules(loans: Iterable[dict], batch_size: int = 5000) -> Iterator[Tuple[List[dict], dict]]:
+    """
+    Yield (loans, schedule_arrays) for stored loan items, batch_size loans at a time.
+    Arrays are loans x longest term, so batching keeps memory flat for nightly jobs
+    over the whole portfolio.
+    """
+    batch = []
+    for loan in loans:
+        batch.append(loan)
+        if len(batch) == batch_size:
+            yield batch, _loan_schedule_arrays(batch)
+            batch = []
+    if batch:
+        yield batch, _loan_schedule_arrays(batch)
+
+def _loan_schedule_arrays(loans: List[dict]) -> dict:
+    return schedule_arrays(
+        [loan['amount'] for loan in loans],
+        [loan['interest_rate'] for loan in loans],
+        [loan['term_months'] for loan in loans],
+        [loan['start_date'] for loan in loans],
+        [loan.get('monthly_payment') for loan in loans],
+    )
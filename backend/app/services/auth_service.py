@@ -1,12 +1,19 @@
 import boto3
 from botocore.exceptions import ClientError
 import os
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt, jwk
+from jose import jwt
 from jose.utils import base64url_decode
 from typing import Optional
 from ..models.user import User
+from .jwks_cache import JWKSCache
+from .token_cache import VerifiedTokenCache
+from .ttl_cache import TTLCache
+from .db_executor import run_db
+from ..repositories.errors import StorageError
+from ..repositories.storage import get_storage
 import requests
 import json
 from datetime import datetime
@@ -14,9 +21,8 @@ from datetime import datetime
 # OAuth2 scheme for FastAPI to expect a Bearer token
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login") # Token URL is now symbolic, as login is via Cognito
 
-# DynamoDB setup
-dynamodb = boto3.resource('dynamodb', region_name=os.getenv('AWS_REGION', 'us-east-1'))
-users_table = dynamodb.Table(os.getenv('DYNAMODB_USERS_TABLE', 'loansyncro-users-dev'))
+# User profiles live in the configured storage backend (DynamoDB unless STORAGE_BACKEND says otherwise)
+user_repository = get_storage().users
 
 # Cognito Identity Provider client for updating user attributes
 cognito_idp_client = boto3.client('cognito-idp', region_name=os.getenv('AWS_REGION', 'us-east-1'))
@@ -34,39 +40,65 @@ if not COGNITO_USER_POOL_CLIENT_ID:
 if not AWS_REGION:
   print("ERROR: AWS_REGION environment variable is not set. Cognito JWT validation will fail.")
 
-# Fetch JWKS (JSON Web Key Set) from Cognito User Pool
-# In a production environment, this should be cached and refreshed periodically
+# JWKS (JSON Web Key Set) from the Cognito User Pool, indexed by kid and refreshed in the background
 JWKS_URL = f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}/.well-known/jwks.json"
-JWKS = None
-
-def get_jwks():
-  """Fetches and caches the JSON Web Key Set from Cognito."""
-  global JWKS
-  if JWKS is None:
-      if not COGNITO_USER_POOL_ID or not AWS_REGION:
-          raise HTTPException(
-              status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-              detail="Cognito User Pool ID or AWS Region not configured for JWKS."
-          )
-      try:
-          response = requests.get(JWKS_URL)
-          response.raise_for_status() # Raise an exception for HTTP errors
-          JWKS = response.json()
-          print(f"Successfully fetched JWKS from {JWKS_URL}")
-      except requests.exceptions.RequestException as e:
-          print(f"Error fetching JWKS from {JWKS_URL}: {e}")
-          raise HTTPException(
-              status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-              detail="Failed to retrieve Cognito public keys for token validation."
-          )
-  return JWKS
+jwks_cache = JWKSCache(
+    JWKS_URL,
+    ttl_seconds=int(os.getenv('JWKS_CACHE_TTL_SECONDS', '3600')),
+    min_refresh_interval_seconds=int(os.getenv('JWKS_MIN_REFRESH_INTERVAL_SECONDS', '30'))
+)
+
+# Claims of already-verified tokens, so a reused access token skips the RSA check until it expires
+verified_token_cache = VerifiedTokenCache(max_size=int(os.getenv('VERIFIED_TOKEN_CACHE_SIZE', '10000')))
+
+# Per-process cache of DynamoDB user profiles keyed by Cognito 'sub'
+user_profile_cache = TTLCache(
+    max_size=int(os.getenv('USER_PROFILE_CACHE_SIZE', '10000')),
+    ttl_seconds=int(os.getenv('USER_PROFILE_CACHE_TTL_SECONDS', '300'))
+)
+
+def start_jwks_refresh():
+  """Prefetch the Cognito keys and keep them fresh; called once at application startup."""
+  if COGNITO_USER_POOL_ID and AWS_REGION:
+      jwks_cache.start_background_refresh()
+
+async def get_signing_key(kid: str):
+  """
+  Returns the pre-constructed public key for a token's kid.
+  Only an unknown kid (key rotation, or a request before the startup prefetch finished)
+  triggers a fetch, rate limited and run off the event loop.
+  """
+  key = jwks_cache.get_key(kid)
+  if key is not None:
+      return key
+
+  if not COGNITO_USER_POOL_ID or not AWS_REGION:
+      raise HTTPException(
+          status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+          detail="Cognito User Pool ID or AWS Region not configured for JWKS."
+      )
+  try:
+      await run_in_threadpool(jwks_cache.refresh, True)
+  except requests.exceptions.RequestException as e:
+      print(f"Error fetching JWKS from {JWKS_URL}: {e}")
+      raise HTTPException(
+          status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+          detail="Failed to retrieve Cognito public keys for token validation."
+      )
+  return jwks_cache.get_key(kid)
 
 def get_user_profile_from_dynamodb(user_id: str):
-  """Get user profile from DynamoDB by ID (Cognito 'sub')."""
+  """Get user profile from DynamoDB by ID (Cognito 'sub'), served from the profile cache when possible."""
+  return user_profile_cache.get(user_id) or fetch_user_profile(user_id)
+
+def fetch_user_profile(user_id: str):
+  """Read a user profile from DynamoDB, bypassing the cache, and cache it."""
   try:
-      response = users_table.get_item(Key={'id': user_id})
-      return response.get('Item')
-  except ClientError as e:
+      user_profile = user_repository.get(user_id)
+      if user_profile:
+          user_profile_cache.set(user_id, user_profile)
+      return user_profile
+  except StorageError as e:
       print(f"Error getting user profile from DynamoDB: {e}")
       return None
 
@@ -84,7 +116,10 @@ def create_user_profile_in_dynamodb(user_id: str, email: str, full_name: str):
           "created_at": datetime.utcnow().isoformat(),
           # Add any other default profile data here
       }
-      users_table.put_item(Item=user_data)
+      # Drop any cached copy first so a failed write can never leave a stale profile behind
+      user_profile_cache.invalidate(user_id)
+      user_repository.put(user_data)
+      user_profile_cache.set(user_id, user_data)
       print(f"Successfully created/updated user profile {user_id} in DynamoDB.")
 
       # Optionally, update Cognito custom attribute if needed (e.g., to mark user as initialized)
@@ -109,18 +144,50 @@ def create_user_profile_in_dynamodb(user_id: str, email: str, full_name: str):
           print("Skipping custom:isInitialized update: COGNITO_USER_POOL_ID is not set.")
 
       return user_data
-  except ClientError as e:
+  except StorageError as e:
       print(f"Error creating/updating user profile in DynamoDB: {e}")
       return None
   except Exception as e:
       print(f"Unexpected error in create_user_profile_in_dynamodb: {e}")
       return None
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def verify_token(token: str) -> dict:
+  """Checks a Cognito JWT's signature and claims and returns its payload."""
+  # 1. Decode the header to get the kid (key ID) and algorithm
+  header = jwt.get_unverified_header(token)
+  kid = header.get('kid')
+  alg = header.get('alg')
+
+  if not kid or not alg:
+      raise ValueError("Token header missing 'kid' or 'alg'.")
+
+  # 2. Look up the cached key for this kid
+  key = await get_signing_key(kid)
+  
+  if not key:
+      raise ValueError(f"Public key with kid '{kid}' not found in JWKS.")
+
+  # 3. Verify the token signature and claims
+  # The `jose` library's `decode` function can verify signature and claims in one go
+  return jwt.decode(
+      token,
+      key, # Pre-constructed key, so jose does not rebuild it from the JWK on every call
+      algorithms=[alg], # Use the algorithm from the token header
+      audience=COGNITO_USER_POOL_CLIENT_ID, # Validate against your Cognito User Pool Client ID
+      issuer=f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}" # Validate against your User Pool Issuer
+  )
+
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)):
   """
   Validates a Cognito-issued JWT and returns the current user.
   This function now correctly validates tokens signed by AWS Cognito.
+  The result is kept on request.state, so the router-level and handler-level
+  dependencies resolve it only once per request.
   """
+  current_user = getattr(request.state, "current_user", None)
+  if current_user is not None:
+      return current_user
+
   credentials_exception = HTTPException(
       status_code=status.HTTP_401_UNAUTHORIZED,
       detail="Could not validate credentials",
@@ -132,34 +199,11 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
       raise credentials_exception
 
   try:
-      # 1. Decode the header to get the kid (key ID) and algorithm
-      header = jwt.get_unverified_header(token)
-      kid = header.get('kid')
-      alg = header.get('alg')
-
-      if not kid or not alg:
-          raise ValueError("Token header missing 'kid' or 'alg'.")
-
-      # 2. Get JWKS and find the correct key
-      jwks = get_jwks()
-      key = None
-      for jwk_key in jwks['keys']:
-          if jwk_key.get('kid') == kid:
-              key = jwk.construct(jwk_key)
-              break
-      
-      if not key:
-          raise ValueError(f"Public key with kid '{kid}' not found in JWKS.")
-
-      # 3. Verify the token signature and claims
-      # The `jose` library's `decode` function can verify signature and claims in one go
-      payload = jwt.decode(
-          token,
-          key.to_dict(), # Pass the public key dictionary
-          algorithms=[alg], # Use the algorithm from the token header
-          audience=COGNITO_USER_POOL_CLIENT_ID, # Validate against your Cognito User Pool Client ID
-          issuer=f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}" # Validate against your User Pool Issuer
-      )
+      # 1-3. Verify the token, unless this exact token was already verified and has not expired
+      payload = verified_token_cache.get(token)
+      if payload is None:
+          payload = await verify_token(token)
+          verified_token_cache.put(token, payload)
 
       # Extract user ID (sub) and email from the payload
       user_id: str = payload.get("sub")
@@ -171,25 +215,30 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
           raise credentials_exception
       
       # Ensure the user profile exists in DynamoDB. If not, create it.
-      user_profile = get_user_profile_from_dynamodb(user_id)
+      # Cache hits skip the executor hop entirely
+      user_profile = user_profile_cache.get(user_id) or await run_db(fetch_user_profile, user_id)
       if not user_profile:
           print(f"User profile for {user_id} not found in DynamoDB. Creating...")
-          user_profile = create_user_profile_in_dynamodb(user_id, email, full_name)
+          user_profile = await run_db(create_user_profile_in_dynamodb, user_id, email, full_name)
           if not user_profile:
               raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create user profile in DynamoDB.")
 
       # Return a User object based on the DynamoDB profile
-      return User(
+      current_user = User(
           id=user_profile["id"],
           email=user_profile["email"],
           full_name=user_profile["full_name"],
           created_at=user_profile["created_at"]
       )
+      request.state.current_user = current_user
+      return current_user
 
+  except HTTPException:
+      raise
   except (jwt.JWTError, ValueError, requests.exceptions.RequestException) as e:
       print(f"JWT validation failed: {e}")
       raise credentials_exception
-  except ClientError as e:
+  except StorageError as e:
       print(f"DynamoDB error during user lookup: {e}")
       raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error during user lookup.")
   except Exception as e:
@@ -0,0 +1,179 @@
+import codecs
+import csv
+import json
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+
+from pydantic import ValidationError
+
+from ..models.loan import LoanCreate
+from ..models.repayment import RepaymentCreate
+from ..repositories.errors import ConditionFailedError
+from ..repositories.loans import loan_version
+from .loan_totals import loan_status, new_loan_item, next_due_attributes, next_due_changes, write_loan_version
+from .money import to_decimal
+from .serialization import PYDANTIC_V2
+from .summary_service import apply_summary_delta
+
+# Only the first errors are echoed back; the counts still cover every row
+MAX_REPORTED_ERRORS = 100
+
+def iter_upload_rows(upload: BinaryIO, filename: str = '', content_type: str = '') -> Iterator[Tuple[int, dict]]:
+    """
+    Yield (line number, row dict) from an uploaded CSV (header row first) or JSON-lines
+    file, decoding as it reads so the upload is never held in memory as a whole.
+    JSON numbers are parsed straight into Decimal. A malformed JSON line yields
+    its error message in place of the row.
+    """
+    text = codecs.getreader('utf-8-sig')(upload)
+    if filename.lower().endswith('.csv') or 'csv' in content_type:
+        reader = csv.DictReader(text)
+        for row in reader:
+            # Empty cells are missing values, so optional fields fall back to their defaults
+            yield reader.line_num, {key: value for key, value in row.items() if key and value not in (None, '')}
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line, parse_float=Decimal)
+        except ValueError as e:
+            yield line_number, f"Invalid JSON: {e}"
+            continue
+        yield line_number, row if isinstance(row, dict) else "Each line must be a JSON object"
+
+def _validate(model, row):
+    """Parse one row into a request model, or return the error to report for it"""
+    if isinstance(row, str):
+        return None, row
+    try:
+        return (model.model_validate(row) if PYDANTIC_V2 else model.parse_obj(row)), None
+    except ValidationError as e:
+        return None, '; '.join(
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+        )
+
+class ImportReport:
+    """Running counts and the first MAX_REPORTED_ERRORS row errors of an import"""
+
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+
+    def fail(self, line: int, error: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": error})
+
+    def as_dict(self) -> dict:
+        return {"imported": self.imported, "failed": self.failed, "errors": self.errors}
+
+def import_loans(storage, user_id: str, rows: Iterator[Tuple[int, dict]]) -> dict:
+    """
+    Validate and write loan rows as they stream in. The batch writer groups them into
+    bulk writes (BatchWriteItem requests of 25 on DynamoDB), and the user's summary
+    gets one combined delta at the end instead of one per loan.
+    """
+    report = ImportReport()
+    totals = {"total_loans": 0, "total_borrowed": Decimal('0'), "total_amount": Decimal('0')}
+
+    with storage.loans.batch_writer() as batch:
+        for line, row in rows:
+            loan, error = _validate(LoanCreate, row)
+            if error:
+                report.fail(line, error)
+                continue
+            if loan.term_months <= 0:
+                report.fail(line, "term_months: must be positive")
+                continue
+
+            item = new_loan_item(loan, user_id)
+            batch.put(item)
+            report.imported += 1
+            totals["total_loans"] += 1
+            totals["total_borrowed"] += item["amount"]
+            totals["total_amount"] += item["total_amount"]
+
+    apply_summary_delta(storage.summaries, user_id, **totals)
+    return report.as_dict()
+
+def import_repayments(storage, user_id: str, rows: Iterator[Tuple[int, dict]]) -> dict:
+    """
+    Validate and write repayment rows as they stream in. Each loan is fetched and
+    ownership-checked once, on its first row; repayments go out through the batch
+    writer. Running totals, status and next due date are then updated once per
+    affected loan, and the summary once, at the end.
+    Unlike POST /repayments this is not one transaction per row: if the final
+    updates fail, scripts/backfill_loan_totals.py recomputes the totals.
+    """
+    report = ImportReport()
+    loans: Dict[str, dict] = {}           # loan_id -> loan item, or None if missing / not owned
+    applied: Dict[str, dict] = {}         # loan_id -> amount, count and latest date imported
+
+    with storage.repayments.batch_writer() as batch:
+        for line, row in rows:
+            repayment, error = _validate(RepaymentCreate, row)
+            if error:
+                report.fail(line, error)
+                continue
+
+            if repayment.loan_id not in loans:
+                loan = storage.loans.get(repayment.loan_id)
+                loans[repayment.loan_id] = loan if loan and loan['user_id'] == user_id else None
+            if loans[repayment.loan_id] is None:
+                report.fail(line, f"Loan {repayment.loan_id} not found")
+                continue
+
+            payment_date = repayment.payment_date.isoformat()
+            batch.put({
+                "id": str(uuid.uuid4()),
+                "loan_id": repayment.loan_id,
+                "user_id": user_id,
+                "amount": repayment.amount,
+                "payment_date": payment_date,
+                "notes": repayment.notes or "",
+                "created_at": datetime.utcnow().isoformat()
+            })
+            report.imported += 1
+
+            totals = applied.setdefault(repayment.loan_id, {"amount": Decimal('0'), "count": 0, "last": ''})
+            totals["amount"] += repayment.amount
+            totals["count"] += 1
+            totals["last"] = max(totals["last"], payment_date)
+
+    total_imported = Decimal('0')
+    for loan_id, totals in applied.items():
+        def apply_totals(loan: dict) -> None:
+            total_repaid = to_decimal(loan.get('total_repaid')) + totals["amount"]
+            due_attributes = next_due_attributes(loan, total_repaid)
+            due_set, due_remove = next_due_changes(due_attributes)
+            storage.loans.update(
+                loan_id, user_id,
+                set_fields={
+                    'last_payment_date': max(loan.get('last_payment_date') or '', totals["last"]),
+                    'status': loan_status(
+                        total_repaid, loan.get('total_amount'), loan.get('status', 'active'),
+                        due_attributes.get('next_due_date')
+                    ),
+                    **due_set
+                },
+                add_fields={'total_repaid': totals["amount"], 'repayment_count': totals["count"]},
+                remove_fields=due_remove,
+                expected_version=loan_version(loan)
+            )
+
+        try:
+            write_loan_version(storage.loans, loans[loan_id], user_id, apply_totals)
+        except ConditionFailedError:
+            # The loan was deleted mid-import (or kept changing); its repayments are left to
+            # scripts/backfill_loan_totals.py
+            print(f"Loan {loan_id} was removed or kept changing during import, skipping its totals")
+            continue
+        total_imported += totals["amount"]
+
+    apply_summary_delta(storage.summaries, user_id, total_repaid=total_imported)
+    return report.as_dict()
@@ -0,0 +1,20 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# boto3 is synchronous, so every DynamoDB call runs on this dedicated pool instead of
+# the event loop. Its size bounds how many data-access calls are in flight per worker.
+DB_MAX_CONCURRENCY = int(os.getenv('DB_MAX_CONCURRENCY', '32'))
+
+# Runs data access directly on the event loop; only meant as a baseline for benchmarks
+DB_EXECUTOR_INLINE = os.getenv('DB_EXECUTOR_INLINE', 'false').lower() == 'true'
+
+_executor = ThreadPoolExecutor(max_workers=DB_MAX_CONCURRENCY, thread_name_prefix='dynamodb')
+
+async def run_db(fn, *args, **kwargs):
+    """Run a blocking data-access call without stalling the event loop"""
+    if DB_EXECUTOR_INLINE:
+        return fn(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
@@ -0,0 +1,46 @@
+import hashlib
+from typing import Iterable, Optional
+
+from fastapi.responses import Response
+
+from ..repositories.loans import loan_version
+from .pagination import encode_cursor
+
+# Tagged responses may be kept by the browser only, and are revalidated with
+# If-None-Match before every use; an unchanged one costs a bodiless 304
+ETAG_CACHE_CONTROL = 'private, no-cache'
+
+def entity_tag(*parts) -> str:
+    """
+    Strong ETag from the values a response is built from: item ids and versions,
+    a summary's revision. Equal parts must mean byte-identical bodies.
+    """
+    digest = hashlib.sha256('\x1f'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+def loan_etag(loan: dict) -> str:
+    """ETag of one loan; every write to a loan bumps its version"""
+    return entity_tag(loan['id'], loan_version(loan))
+
+def loan_page_etag(loans: Iterable[dict], last_evaluated_key: Optional[dict]) -> str:
+    """A page of loans changes when any of its loans does, one is added or removed, or the next cursor moves"""
+    return entity_tag(*(f"{loan['id']}:{loan_version(loan)}" for loan in loans), encode_cursor(last_evaluated_key))
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header lists etag or is "*"; W/ prefixes are ignored, as RFC 9110 asks"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith('W/') else tag) == etag:
+            return True
+    return False
+
+def etag_headers(etag: str) -> dict:
+    return {'ETag': etag, 'Cache-Control': ETAG_CACHE_CONTROL}
+
+def not_modified(etag: str) -> Response:
+    """304 for a client that already holds the current representation; nothing is serialized"""
+    return Response(status_code=304, headers=etag_headers(etag))
@@ -0,0 +1,58 @@
+import csv
+import io
+from typing import Iterable, Iterator, Type
+
+from pydantic import BaseModel
+
+from .serialization import ItemProjector, dumps
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Rows are encoded into one chunk per this many items, so the body streams out in
+# reasonably sized writes while memory stays bounded by one chunk and one DynamoDB page
+ROWS_PER_CHUNK = 500
+
+def _chunks(items: Iterable[dict], projector: ItemProjector) -> Iterator[list]:
+    chunk = []
+    for item in items:
+        chunk.append(projector.project(item))
+        if len(chunk) >= ROWS_PER_CHUNK:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def iter_csv(items: Iterable[dict], model: Type[BaseModel]) -> Iterator[bytes]:
+    """
+    Encode items as CSV with one column per model field, header row first.
+    Decimals are written with their stored digits and missing values as empty cells.
+    """
+    projector = ItemProjector(model)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(name for name, _ in projector.fields)
+    for chunk in _chunks(items, projector):
+        writer.writerows(['' if value is None else value for value in row.values()] for row in chunk)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+    # A header-only export still needs its header sent
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def iter_ndjson(items: Iterable[dict], model: Type[BaseModel]) -> Iterator[bytes]:
+    """Encode items as JSON lines shaped like the model, with exact Decimal numbers"""
+    projector = ItemProjector(model)
+    for chunk in _chunks(items, projector):
+        yield b''.join(dumps(row) + b'\n' for row in chunk)
+
+def iter_export(items: Iterable[dict], model: Type[BaseModel], export_format: str) -> Iterator[bytes]:
+    """Encode items in one of EXPORT_FORMATS"""
+    if export_format == 'csv':
+        return iter_csv(items, model)
+    return iter_ndjson(items, model)
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+from ..repositories.errors import ConditionFailedError, StorageError
+from ..repositories.idempotency import COMPLETED, PENDING
+from .serialization import dumps
+
+# Sent with a replayed response, so a client can tell it did not write anything
+IDEMPOTENT_REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+# How long a response is replayed for its key
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', str(24 * 60 * 60)))
+# How long a request holds its key before finishing; after that a retry may run it again
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv('IDEMPOTENCY_LEASE_SECONDS', '60'))
+
+def request_fingerprint(payload) -> str:
+    """Hash of a request body, so a key reused for a different request is refused instead of replayed"""
+    canonical = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+class IdempotentRequest:
+    """A claimed Idempotency-Key: finish() stores the response for replays, release() frees the key"""
+
+    def __init__(self, repository, key: str, token: str):
+        self.repository = repository
+        self.key = key
+        self.token = token
+
+    def finish(self, status_code: int, content) -> Response:
+        """
+        Store the response and return it, so the first answer and every replay are the same bytes.
+        The write has already happened, so failing to store it is logged rather than raised.
+        """
+        body = dumps(content)
+        try:
+            self.repository.complete(
+                self.key, self.token, status_code, body.decode(), int(time.time()) + IDEMPOTENCY_TTL_SECONDS
+            )
+        except ConditionFailedError:
+            print(f"Lease on idempotency key {self.key} was lost before the response was stored")
+        except StorageError as e:
+            print(f"Error storing response for idempotency key {self.key}: {e}")
+        return Response(content=body, status_code=status_code, media_type='application/json')
+
+    def release(self) -> None:
+        """Free the key after a failed request; if this fails too, the lease runs out instead"""
+        try:
+            self.repository.release(self.key, self.token)
+        except ConditionFailedError:
+            # The lease ran out and another request holds the key now; it is not ours to free
+            print(f"Lease on idempotency key {self.key} was lost before it was released")
+        except StorageError as e:
+            print(f"Error releasing idempotency key {self.key}: {e}")
+
+def begin_idempotent_request(repository, user_id: str, scope: str, idempotency_key: Optional[str],
+                             payload) -> Tuple[Optional[IdempotentRequest], Optional[Response]]:
+    """
+    Claim a user's Idempotency-Key for one endpoint (scope). Returns (claim, None) for a
+    new key, (None, stored response) for a replay and (None, None) without a key.
+    Raises 409 while the first request with the key is still running and 422 when
+    the key was used for a different request.
+    """
+    if not idempotency_key:
+        return None, None
+
+    key = f"{user_id}#{scope}#{idempotency_key}"
+    fingerprint = request_fingerprint(payload)
+    now = int(time.time())
+    token = uuid.uuid4().hex
+    try:
+        existing = repository.claim({
+            'key': key,
+            'state': PENDING,
+            'token': token,
+            'request_hash': fingerprint,
+            'locked_until': now + IDEMPOTENCY_LEASE_SECONDS,
+            'expires_at': now + IDEMPOTENCY_TTL_SECONDS,
+        }, now)
+    except ConditionFailedError:
+        existing = {'state': PENDING, 'request_hash': fingerprint}
+    except StorageError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to check the Idempotency-Key: {str(e)}"
+        )
+
+    if existing is None:
+        return IdempotentRequest(repository, key, token), None
+    if existing.get('request_hash') != fingerprint:
+        # 422 spelled out: starlette renamed its constant
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used for a different request"
+        )
+    if existing['state'] != COMPLETED:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this Idempotency-Key is still in progress"
+        )
+    return None, Response(
+        content=existing['body'],
+        status_code=int(existing['status_code']),
+        media_type='application/json',
+        headers={IDEMPOTENT_REPLAYED_HEADER: 'true'}
+    )
@@ -0,0 +1,78 @@
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from jose import jwk
+
+class JWKSCache:
+    """
+    kid-indexed cache of Cognito verification keys.
+    Keys are constructed once per fetch, so token validation is a dictionary lookup.
+    A background thread re-fetches the key set every ttl_seconds. An unknown kid
+    (e.g. just after key rotation) may force a refresh, but at most once every
+    min_refresh_interval_seconds, so forged kids cannot hammer the JWKS endpoint.
+    """
+
+    def __init__(self, url: str, ttl_seconds: float = 3600, min_refresh_interval_seconds: float = 30,
+                 request_timeout_seconds: float = 5):
+        self.url = url
+        self.ttl_seconds = ttl_seconds
+        self.min_refresh_interval_seconds = min_refresh_interval_seconds
+        self.request_timeout_seconds = request_timeout_seconds
+        self._keys: Dict[str, jwk.Key] = {}
+        self._fetched_at: Optional[float] = None
+        self._last_attempt_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+
+    def get_key(self, kid: str) -> Optional[jwk.Key]:
+        """Return the pre-constructed key for a kid, without any I/O"""
+        return self._keys.get(kid)
+
+    def can_force_refresh(self) -> bool:
+        return (self._last_attempt_at is None
+                or time.monotonic() - self._last_attempt_at >= self.min_refresh_interval_seconds)
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Fetch the key set and swap in a new kid index. Blocking; call it from a worker thread.
+        With force=True the fetch is skipped if another one happened within the rate limit.
+        Returns whether a fetch was made; raises requests.RequestException if it failed.
+        """
+        with self._lock:
+            if force and not self.can_force_refresh():
+                return False
+            self._last_attempt_at = time.monotonic()
+
+            response = requests.get(self.url, timeout=self.request_timeout_seconds)
+            response.raise_for_status()
+
+            keys = {}
+            for jwk_key in response.json().get('keys', []):
+                kid = jwk_key.get('kid')
+                if kid:
+                    keys[kid] = jwk.construct(jwk_key, jwk_key.get('alg', 'RS256'))
+
+            # Readers never take the lock; replacing the dict is atomic for them
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+            print(f"Successfully fetched JWKS from {self.url} ({len(keys)} keys)")
+            return True
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self.refresh()
+                delay = self.ttl_seconds
+            except (requests.exceptions.RequestException, ValueError) as e:
+                # Keep serving the previous keys and retry sooner
+                print(f"Error fetching JWKS from {self.url}: {e}")
+                delay = self.min_refresh_interval_seconds
+            time.sleep(delay)
+
+    def start_background_refresh(self):
+        """Fetch the key set now and keep it fresh from a daemon thread"""
+        if self._refresher is None or not self._refresher.is_alive():
+            self._refresher = threading.Thread(target=self._refresh_loop, name='jwks-refresh', daemon=True)
+            self._refresher.start()
@@ -0,0 +1,149 @@
+import os
+import random
+import time
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Optional
+
+from ..repositories.errors import ConditionFailedError
+from ..repositories.loans import DUE_BUCKET, loan_version
+from .amortization import monthly_payment as calculate_monthly_payment, next_due_date
+from .money import to_decimal
+from .summary_service import summary_deltas
+
+# Tries at a loan write whose version check fails because other writes to the loan got in first
+LOAN_WRITE_ATTEMPTS = int(os.getenv('LOAN_WRITE_ATTEMPTS', '5'))
+# Backoff before the first retry, doubled (with full jitter) for every later one
+LOAN_RETRY_BASE_SECONDS = float(os.getenv('LOAN_RETRY_BASE_SECONDS', '0.02'))
+
+# An unpaid loan more than this many days behind its next installment is defaulted
+DEFAULT_AFTER_DAYS = int(os.getenv('LOAN_DEFAULT_AFTER_DAYS', '90'))
+
+def past_default(next_due: Optional[str], today: Optional[date] = None,
+                 default_after_days: int = DEFAULT_AFTER_DAYS) -> bool:
+    """Whether an installment due on next_due (ISO date) is more than default_after_days overdue"""
+    if not next_due:
+        return False
+    return ((today or date.today()) - date.fromisoformat(next_due[:10])).days > default_after_days
+
+def loan_status(total_repaid, total_amount, current_status: str = 'active', next_due: Optional[str] = None) -> str:
+    """
+    Status a loan should have for the given amount repaid. A defaulted loan stays
+    defaulted until it is paid off or its next installment, next_due, is no longer
+    more than DEFAULT_AFTER_DAYS overdue.
+    """
+    if to_decimal(total_repaid) >= to_decimal(total_amount):
+        return 'paid'
+    if current_status == 'defaulted':
+        return 'active' if next_due and not past_default(next_due) else 'defaulted'
+    if current_status == 'paid' or to_decimal(total_repaid) > 0:
+        return 'active'
+    return current_status
+
+def new_loan_item(loan, user_id: str) -> dict:
+    """DynamoDB item for a new loan from a validated LoanCreate, with payment, totals and due date derived"""
+    monthly_payment = calculate_monthly_payment(loan.amount, loan.interest_rate, loan.term_months)
+    item = {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "title": loan.title,
+        "amount": loan.amount,
+        "interest_rate": loan.interest_rate,
+        "term_months": int(loan.term_months),
+        "start_date": loan.start_date.isoformat(),
+        "description": loan.description or "",
+        "created_at": datetime.utcnow().isoformat(),
+        "total_amount": monthly_payment * loan.term_months,  # Principal + Interest
+        "monthly_payment": monthly_payment,
+        "status": "active",
+        "total_repaid": Decimal('0'),
+        "repayment_count": 0,
+        "version": 1
+    }
+    item.update(next_due_attributes(item))
+    return item
+
+def next_due_attributes(loan: dict, total_repaid=None) -> dict:
+    """next_due_date/due_bucket for a loan item, or {} if nothing is left to pay"""
+    if total_repaid is None:
+        total_repaid = loan.get('total_repaid')
+    due = None
+    if loan_status(total_repaid, loan.get('total_amount')) != 'paid':
+        due = next_due_date(loan['start_date'], loan['term_months'], loan.get('monthly_payment'), total_repaid)
+    if due is None:
+        return {}
+    return {'next_due_date': due.isoformat(), 'due_bucket': DUE_BUCKET}
+
+def next_due_changes(attributes: dict):
+    """
+    (fields to set, fields to remove) that write next_due_attributes onto an existing
+    loan, taking it out of the due-date indexes when it is empty.
+    """
+    if attributes:
+        return dict(attributes), ()
+    return {}, ('next_due_date', 'due_bucket')
+
+def write_loan_version(loans, loan: dict, user_id: str, write):
+    """
+    Call write(loan), which derives its changes from the loan as read and makes them
+    conditional on loan_version(loan). When another write got in first, re-read the
+    loan and call it again, backing off between tries, up to LOAN_WRITE_ATTEMPTS times.
+    Raises ConditionFailedError once the loan is gone or belongs to another user, or
+    when the tries run out.
+    """
+    for attempt in range(LOAN_WRITE_ATTEMPTS):
+        try:
+            return write(loan)
+        except ConditionFailedError:
+            if attempt + 1 == LOAN_WRITE_ATTEMPTS:
+                raise
+            loan = loans.get(loan['id'], consistent_read=True)
+            if loan is None or loan['user_id'] != user_id:
+                raise
+            time.sleep(random.uniform(0, LOAN_RETRY_BASE_SECONDS * 2 ** attempt))
+
+def record_repayment(storage, repayment_data: dict, loan: dict) -> dict:
+    """
+    Write a repayment and fold it into the loan's running totals and the user's
+    summary in one transaction. total_repaid and repayment_count are bumped with
+    atomic ADDs, so the cost is constant no matter how many repayments the loan
+    already has; status and next due date are derived from the loan as read, so
+    the write only applies while the loan still has that version and is redone
+    from a fresh read when a concurrent write got in first.
+    Returns the loan attributes as they are after the write.
+    """
+    return write_loan_version(
+        storage.loans, loan, repayment_data['user_id'],
+        lambda current: _record_repayment(storage, repayment_data, current)
+    )
+
+def _record_repayment(storage, repayment_data: dict, loan: dict) -> dict:
+    amount = to_decimal(repayment_data['amount'])
+    total_repaid = to_decimal(loan.get('total_repaid')) + amount
+    due_attributes = next_due_attributes(loan, total_repaid)
+    new_status = loan_status(
+        total_repaid, loan.get('total_amount'), loan.get('status', 'active'), due_attributes.get('next_due_date')
+    )
+    last_payment_date = max(loan.get('last_payment_date') or '', repayment_data['payment_date'])
+    due_set, due_remove = next_due_changes(due_attributes)
+
+    storage.record_repayment(
+        repayment_data,
+        set_fields={'last_payment_date': last_payment_date, 'status': new_status, **due_set},
+        add_fields={'total_repaid': amount, 'repayment_count': 1},
+        remove_fields=due_remove,
+        summary_deltas=summary_deltas(total_repaid=amount),
+        expected_version=loan_version(loan)
+    )
+
+    updated_loan = {key: value for key, value in loan.items() if key not in ('next_due_date', 'due_bucket')}
+    return {
+        **updated_loan,
+        **due_attributes,
+        'total_repaid': total_repaid,
+        'repayment_count': int(loan.get('repayment_count', 0)) + 1,
+        'last_payment_date': last_payment_date,
+        'status': new_status,
+        'version': loan_version(loan) + 1
+    }
@@ -0,0 +1,17 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+# Money is carried as Decimal from the request models through DynamoDB (which stores
+# Decimals natively) to the JSON body, so amounts never round-trip through float
+Money = Decimal
+
+CENT = Decimal('0.01')
+
+def to_decimal(value) -> Decimal:
+    """Coerce a DynamoDB/JSON number into a Decimal without float rounding artifacts"""
+    if isinstance(value, Decimal):
+        return value
+    return Decimal(str(value or 0))
+
+def round_money(value) -> Decimal:
+    """Round an amount to whole cents, half up"""
+    return to_decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
@@ -0,0 +1,42 @@
+import base64
+import binascii
+import json
+from typing import Optional
+from fastapi import HTTPException, Response, status
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Response header carrying the continuation token; absent on the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(last_evaluated_key: Optional[dict]) -> Optional[str]:
+    """Turn a DynamoDB LastEvaluatedKey into an opaque URL-safe token"""
+    if not last_evaluated_key:
+        return None
+    raw = json.dumps(last_evaluated_key, separators=(',', ':'), sort_keys=True, default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: Optional[str], **expected) -> Optional[dict]:
+    """
+    Turn a token from encode_cursor back into an ExclusiveStartKey.
+    Keyword arguments name key attributes the cursor must carry (e.g. user_id),
+    so a token cannot be replayed against another user's or loan's listing.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, binascii.Error):
+        key = None
+
+    if not isinstance(key, dict) or any(key.get(name) != value for name, value in expected.items()):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination cursor")
+    return key
+
+def set_next_cursor(response: Response, last_evaluated_key: Optional[dict]) -> None:
+    """Expose the continuation token for the next page, if there is one"""
+    next_cursor = encode_cursor(last_evaluated_key)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
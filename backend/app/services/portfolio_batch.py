@@ -0,0 +1,187 @@
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from ..repositories.errors import StorageError
+from ..repositories.storage import get_storage
+from .loan_totals import DEFAULT_AFTER_DAYS, loan_status, next_due_attributes, past_default
+from .money import to_decimal
+from .summary_service import rebuild_summary
+
+# The only repayment attributes the batch reads
+REPAYMENT_ATTRIBUTES = ('loan_id', 'amount', 'payment_date')
+TOTAL_FIELDS = ('total_repaid', 'repayment_count', 'last_payment_date')
+# Every repayment write changes these, so a correction only applies if they still hold what was read
+GUARDED_FIELDS = ('total_repaid', 'repayment_count', 'status')
+
+# Corrections a worker buffers before writing them with one update_many call
+UPDATE_BATCH_SIZE = 100
+
+def aggregate_repayments(repayments: Iterable[dict]) -> Dict[str, list]:
+    """Fold repayments into {loan_id: [total repaid, repayment count, last payment date]}"""
+    aggregates = {}
+    for repayment in repayments:
+        _add(aggregates, repayment['loan_id'], to_decimal(repayment.get('amount')), 1, repayment.get('payment_date'))
+    return aggregates
+
+def merge_aggregates(parts: Iterable[Dict[str, list]]) -> Dict[str, list]:
+    """Combine the aggregates of several scan segments; a loan's repayments may fall in any of them"""
+    merged = {}
+    for part in parts:
+        for loan_id, (total_repaid, repayment_count, last_payment_date) in part.items():
+            _add(merged, loan_id, total_repaid, repayment_count, last_payment_date)
+    return merged
+
+def _add(aggregates: dict, loan_id: str, total_repaid: Decimal, repayment_count: int,
+         last_payment_date: Optional[str]) -> None:
+    aggregate = aggregates.get(loan_id)
+    if aggregate is None:
+        aggregates[loan_id] = [total_repaid, repayment_count, last_payment_date]
+        return
+    aggregate[0] += total_repaid
+    aggregate[1] += repayment_count
+    if last_payment_date and (aggregate[2] is None or last_payment_date > aggregate[2]):
+        aggregate[2] = last_payment_date
+
+def portfolio_status(loan: dict, total_repaid, next_due: Optional[str], today: date,
+                     default_after_days: int = DEFAULT_AFTER_DAYS) -> str:
+    """paid once fully repaid, defaulted while more than default_after_days overdue, otherwise active"""
+    if loan_status(total_repaid, loan.get('total_amount')) == 'paid':
+        return 'paid'
+    if past_default(next_due, today, default_after_days):
+        return 'defaulted'
+    return 'active'
+
+def reconciled_fields(loan: dict, aggregate: Optional[list], today: date,
+                      default_after_days: int = DEFAULT_AFTER_DAYS) -> dict:
+    """
+    Totals, status and due-date attributes a loan should carry given its repayments'
+    aggregate; next_due_date and due_bucket are left out once nothing is due.
+    """
+    total_repaid, repayment_count, last_payment_date = aggregate or (Decimal('0'), 0, None)
+    due_attributes = next_due_attributes(loan, total_repaid)
+    return {
+        'total_repaid': total_repaid,
+        'repayment_count': repayment_count,
+        'last_payment_date': last_payment_date,
+        'status': portfolio_status(loan, total_repaid, due_attributes.get('next_due_date'), today, default_after_days),
+        **due_attributes
+    }
+
+def loan_correction(loan: dict, fields: dict) -> Optional[dict]:
+    """update_many entry changing a loan to reconciled fields, or None if it already matches"""
+    set_fields = {name: value for name, value in fields.items() if loan.get(name) != value}
+    remove_fields = tuple(name for name in ('next_due_date', 'due_bucket') if name not in fields and name in loan)
+    if not set_fields and not remove_fields:
+        return None
+    return {
+        'loan_id': loan['id'],
+        'user_id': loan['user_id'],
+        'expected': {name: loan.get(name) for name in GUARDED_FIELDS},
+        'set_fields': set_fields,
+        'remove_fields': remove_fields,
+    }
+
+def reconcile_segment(storage, segment: int, total_segments: int, aggregates: Dict[str, list], today: date,
+                      default_after_days: int = DEFAULT_AFTER_DAYS, dry_run: bool = False) -> Counter:
+    """
+    Stream one scan segment of the loans against the repayment aggregates and write
+    the loans that disagree in batches. Returns counts for the run's report.
+    """
+    stats = Counter()
+    pending: List[dict] = []
+    # Users whose summary total_repaid no longer matches their corrected loans
+    summary_users = set()
+
+    def flush():
+        if pending and not dry_run:
+            stale = set(storage.loans.update_many(pending))
+            stats['changed_since_read'] += len(stale)
+            stats['updated'] += len(pending) - len(stale)
+            summary_users.update(
+                correction['user_id'] for correction in pending
+                if correction['loan_id'] not in stale and 'total_repaid' in correction['set_fields']
+            )
+        pending.clear()
+
+    for loan in storage.loans.iter_segment(segment, total_segments):
+        aggregate = aggregates.get(loan['id'])
+        fields = reconciled_fields(loan, aggregate, today, default_after_days)
+        correction = loan_correction(loan, fields)
+        if correction and any(name in correction['set_fields'] for name in TOTAL_FIELDS):
+            # The repayments were scanned before this loan was read, so a repayment recorded
+            # in between would look like drift; recount from a query made after the read
+            aggregate = aggregate_repayments(storage.repayments.iter_loan_repayments(loan['id'])).get(loan['id'])
+            fields = reconciled_fields(loan, aggregate, today, default_after_days)
+            correction = loan_correction(loan, fields)
+
+        stats['loans'] += 1
+        stats[fields['status']] += 1
+        stats['repayments_matched'] += aggregate[1] if aggregate else 0
+        if fields.get('next_due_date') and fields['next_due_date'] < today.isoformat():
+            stats['overdue'] += 1
+        if correction:
+            stats['corrected'] += 1
+            pending.append(correction)
+            if len(pending) >= UPDATE_BATCH_SIZE:
+                flush()
+    flush()
+
+    # The summaries kept the drifted totals, so they are recounted like scripts/rebuild_summaries.py does
+    for user_id in summary_users:
+        try:
+            rebuild_summary(storage.summaries, storage.loans, storage.repayments, user_id)
+            stats['summaries_rebuilt'] += 1
+        except StorageError as e:
+            print(f"Error rebuilding summary for user {user_id}: {e}")
+            stats['summaries_failed'] += 1
+    return stats
+
+# Worker process state: the merged aggregates, sent once per process rather than once per segment
+_aggregates: Dict[str, list] = {}
+
+def _init_reconcile_worker(aggregates: Dict[str, list]) -> None:
+    global _aggregates
+    _aggregates = aggregates
+
+def _aggregate_segment(segment: int, total_segments: int) -> Dict[str, list]:
+    return aggregate_repayments(get_storage().repayments.iter_segment(segment, total_segments, REPAYMENT_ATTRIBUTES))
+
+def _reconcile_segment(segment: int, total_segments: int, today: date, default_after_days: int,
+                       dry_run: bool) -> Counter:
+    return reconcile_segment(get_storage(), segment, total_segments, _aggregates, today, default_after_days, dry_run)
+
+def _map_segments(fn, total_segments: int, extra_args: tuple, workers: int, initializer=None, initargs=()) -> list:
+    calls = [(segment, total_segments, *extra_args) for segment in range(total_segments)]
+    if workers <= 1:
+        if initializer:
+            initializer(*initargs)
+        return [fn(*args) for args in calls]
+    # spawn rather than fork: boto3 sessions and SQLite connections must not cross a fork
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=initializer, initargs=initargs) as pool:
+        return list(pool.map(fn, *zip(*calls)))
+
+def run_portfolio_batch(total_segments: int, workers: int, today: Optional[date] = None,
+                        default_after_days: int = DEFAULT_AFTER_DAYS, dry_run: bool = False) -> Counter:
+    """
+    Reconcile every loan with its repayments: totals, status (including defaulted) and
+    next due date. Both tables are read as total_segments parallel Scan segments over
+    `workers` processes (in this process when workers <= 1). The repayments are reduced
+    to a few numbers per loan, the build side of a hash join the loan segments then
+    stream against, so memory grows with the number of loans, not repayments.
+    """
+    today = today or date.today()
+    aggregates = merge_aggregates(_map_segments(_aggregate_segment, total_segments, (), workers))
+    stats = sum(
+        _map_segments(_reconcile_segment, total_segments, (today, default_after_days, dry_run), workers,
+                      initializer=_init_reconcile_worker, initargs=(aggregates,)),
+        Counter()
+    )
+    stats['repayments'] = sum(aggregate[1] for aggregate in aggregates.values())
+    # Repayments whose loan was deleted (or never existed) match no loan segment
+    stats['orphaned_repayments'] = stats['repayments'] - stats.pop('repayments_matched', 0)
+    return stats
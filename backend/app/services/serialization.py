@@ -0,0 +1,95 @@
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterable, List, Optional, Type
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from pydantic.version import VERSION as PYDANTIC_VERSION
+
+try:
+    import orjson
+    orjson.Fragment  # Added in orjson 3.9.14; needed to write Decimals exactly
+except (ImportError, AttributeError):  # Optional; simplejson's C encoder is the fallback
+    orjson = None
+    import simplejson
+
+PYDANTIC_V2 = PYDANTIC_VERSION.startswith('2.')
+
+if PYDANTIC_V2:
+    from pydantic import field_serializer
+
+# Model Config.json_encoders entry for Decimals under pydantic v1: it passes them through
+# FastAPI's encoder untouched, so MoneyJSONResponse writes their exact digits.
+MONEY_JSON_ENCODERS = {Decimal: lambda value: value}
+
+def _money_to_json(self, value: Decimal) -> float:
+    return float(value)
+
+def money_serializer(*fields: str):
+    """
+    pydantic v2 field serializer for a model's Money fields. v2 turns any Decimal left in a
+    JSON-mode dump into a string, so this hands over a float; that is why every endpoint
+    returning money sends ItemProjector responses instead of going through response_model
+    serialization.
+    """
+    return field_serializer(*fields, when_used='json')(_money_to_json)
+
+def _orjson_default(value):
+    # Fragment embeds the Decimal's own digits as a raw JSON number
+    if isinstance(value, Decimal):
+        return orjson.Fragment(str(value).encode())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _simplejson_default(value):
+    # orjson writes dates natively; match its ISO format
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(content) -> bytes:
+    """Serialize to JSON bytes, writing Decimals as exact numbers"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_orjson_default)
+    return simplejson.dumps(
+        content, use_decimal=True, ensure_ascii=False, allow_nan=False, separators=(',', ':'),
+        default=_simplejson_default
+    ).encode('utf-8')
+
+class MoneyJSONResponse(JSONResponse):
+    """JSON response that writes Decimals as exact JSON numbers"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+def _field_defaults(model: Type[BaseModel]):
+    """(name, default) per model field, None for required ones; pydantic v2 or v1"""
+    fields = getattr(model, 'model_fields', None)
+    if fields is not None:
+        for name, field in fields.items():
+            yield name, None if field.is_required() else field.get_default(call_default_factory=True)
+        return
+    for name, field in model.__fields__.items():
+        yield name, None if field.required else field.get_default()
+
+class ItemProjector:
+    """
+    Shapes stored DynamoDB items like a response model without re-validating them.
+    Our items were validated by the request models on the way in, so list endpoints
+    only need to keep the model's fields and fill in defaults for attributes older
+    items lack; that skips building a pydantic object per item.
+    """
+
+    def __init__(self, model: Type[BaseModel]):
+        self.fields = tuple(_field_defaults(model))
+
+    def project(self, item: dict) -> dict:
+        return {name: item.get(name, default) for name, default in self.fields}
+
+    def response(self, items: Iterable[dict], headers: Optional[dict] = None) -> MoneyJSONResponse:
+        """A ready-to-send list response; returning it bypasses response_model serialization"""
+        projected: List[dict] = [self.project(item) for item in items]
+        return MoneyJSONResponse(content=projected, headers=headers)
+
+    def item_response(self, item: dict, status_code: int = 200, headers: Optional[dict] = None) -> MoneyJSONResponse:
+        """response() for a single item, so its money keeps the same exact digits as in lists"""
+        return MoneyJSONResponse(content=self.project(item), status_code=status_code, headers=headers)
@@ -0,0 +1,89 @@
+import os
+from datetime import datetime
+from typing import Tuple
+from ..repositories.errors import ConditionFailedError, StorageError
+from .etags import entity_tag
+from .money import to_decimal
+
+# Aggregates kept on each user's summary item; outstanding_amount is derived on read
+SUMMARY_FIELDS = ('total_loans', 'total_borrowed', 'total_amount', 'total_repaid')
+# Recounts of a summary whose revision keeps moving (writes landing mid-rebuild) before
+# the last one is served without being stored
+SUMMARY_REBUILD_ATTEMPTS = int(os.getenv('SUMMARY_REBUILD_ATTEMPTS', '3'))
+
+def summary_deltas(**deltas) -> dict:
+    """Non-zero deltas as Decimals, ready for SummaryRepository.add"""
+    return {name: to_decimal(value) for name, value in deltas.items() if value}
+
+def apply_summary_delta(summary_repository, user_id: str, **deltas) -> None:
+    """
+    Incrementally adjust a user's summary after a loan write.
+    A failure here only leaves the summary stale, so it is logged rather than
+    failing the request; scripts/rebuild_summaries.py repairs any drift.
+    """
+    try:
+        summary_repository.add(user_id, summary_deltas(**deltas))
+    except StorageError as e:
+        print(f"Error updating summary for user {user_id}: {e}")
+
+def rebuild_summary(summary_repository, loan_repository, repayment_repository, user_id: str) -> dict:
+    """
+    Recompute a user's summary from the loans and repayments tables and store it.
+    The store only applies while the summary still has the revision read before the
+    recount, since every loan or repayment write bumps it; otherwise that write would
+    be overwritten, so the recount is redone, up to SUMMARY_REBUILD_ATTEMPTS times.
+    The last recount is returned without being stored if the summary never settles.
+    """
+    for _ in range(SUMMARY_REBUILD_ATTEMPTS):
+        stored = summary_repository.get(user_id)
+        revision = int(stored.get('revision', 0)) if stored else 0
+        summary = _recount_summary(loan_repository, repayment_repository, user_id)
+        try:
+            summary_repository.replace(user_id, summary, expected_revision=revision)
+        except ConditionFailedError:
+            continue
+        return {**summary, 'revision': revision + 1}
+    print(f"Summary of user {user_id} kept changing during {SUMMARY_REBUILD_ATTEMPTS} rebuilds; serving it unstored")
+    return summary
+
+def _recount_summary(loan_repository, repayment_repository, user_id: str) -> dict:
+    summary = {name: to_decimal(0) for name in SUMMARY_FIELDS}
+    loan_ids = set()
+    for loan in loan_repository.iter_user_loans(user_id):
+        loan_ids.add(loan['id'])
+        summary['total_loans'] += 1
+        summary['total_borrowed'] += to_decimal(loan.get('amount'))
+        summary['total_amount'] += to_decimal(loan.get('total_amount'))
+
+    # Repayments of deleted loans no longer count towards the portfolio
+    for repayment in repayment_repository.iter_user_repayments(user_id):
+        if repayment.get('loan_id') in loan_ids:
+            summary['total_repaid'] += to_decimal(repayment.get('amount'))
+
+    # rebuilt_at marks the item as complete; deltas applied before the first rebuild
+    # only create a partial item, which get_summary will not trust
+    summary['rebuilt_at'] = datetime.utcnow().isoformat()
+    return summary
+
+def get_summary(summary_repository, loan_repository, repayment_repository, user_id: str) -> Tuple[dict, str]:
+    """
+    Read a user's summary with a single get, building it on first use.
+    next_payment_due comes from one Limit=1 query on the user's due-date index.
+    Returns the summary and its ETag, from the stored item's revision (bumped by
+    every write to it) and the next due date.
+    """
+    summary = summary_repository.get(user_id)
+    if summary is None or 'rebuilt_at' not in summary:
+        summary = rebuild_summary(summary_repository, loan_repository, repayment_repository, user_id)
+
+    total_repaid = to_decimal(summary.get('total_repaid'))
+    next_due = loan_repository.next_due_date(user_id)
+    # A summary served without being stored has no revision; rebuilt_at tells those apart instead
+    etag = entity_tag(user_id, summary.get('revision'), summary['rebuilt_at'], next_due)
+    return {
+        "total_loans": int(summary.get('total_loans', 0)),
+        "total_borrowed": to_decimal(summary.get('total_borrowed')),
+        "total_repaid": total_repaid,
+        "outstanding_amount": max(to_decimal(0), to_decimal(summary.get('total_amount')) - total_repaid),
+        "next_payment_due": datetime.fromisoformat(next_due) if next_due else None
+    }, etag
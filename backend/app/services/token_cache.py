@@ -0,0 +1,58 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of JWT claims that already passed signature and claim validation.
+    Entries are keyed by a SHA-256 digest of the token (the raw token is never kept)
+    and expire at the token's own exp, so a hit is exactly as trustworthy as
+    re-verifying the signature.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        """Return the cached claims for a token, or None if it has to be verified"""
+        digest = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and entry[1] > time.time():
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[digest]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, claims: dict) -> None:
+        """Remember the claims of a freshly verified token until it expires"""
+        expires_at = claims.get('exp')
+        if not expires_at or self.max_size <= 0:
+            return
+        digest = self._digest(token)
+        with self._lock:
+            self._entries[digest] = (claims, float(expires_at))
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
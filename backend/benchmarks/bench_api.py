@@ -0,0 +1,344 @@
+"""
+Load test of the API: throughput and p50/p95/p99 latency per endpoint, for the FastAPI app and the Lambda handlers.
+
+Seeds --users synthetic users, each with --loans-per-user loans carrying
+--repayments-per-loan repayments (loan totals and summaries kept consistent), then
+drives in-process:
+
+  fastapi   app.main through httpx's ASGI transport with --concurrency requests in
+            flight, on moto's in-memory DynamoDB or, with --storage sqlite, the
+            embedded backend
+  lambda    loans_handler / repayments_handler of infrastructure/lambda_function.py
+            with API Gateway proxy events, one at a time like a single container,
+            always on moto
+
+Every endpoint (GET /loans, GET /repayments, GET /repayments/summary and
+POST /repayments) gets --warmup unrecorded requests and then --requests timed
+ones, round-robin over the users. The stand-ins have their own overhead, so
+compare runs of this harness with each other, not with production latencies:
+--output writes the results as JSON tagged with the commit, and --baseline
+prints the change against such a file.
+
+Usage (from backend/, needs httpx and moto):
+    python -m benchmarks.bench_api [--target all|fastapi|lambda] [--storage dynamodb|sqlite]
+        [--users 20] [--loans-per-user 10] [--repayments-per-loan 12] [--requests 300]
+        [--concurrency 16] [--output results.json] [--baseline previous.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+from . import local_dynamodb
+
+INFRASTRUCTURE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'infrastructure'
+)
+# Header the FastAPI auth override reads the user from (the Lambda gets it as an authorizer claim)
+USER_HEADER = 'X-Bench-User'
+PAYMENT_DATE = '2025-01-15T00:00:00'
+
+# name -> (method, path, JSON body for a (user, loan id) or None)
+ENDPOINTS = {
+    'GET /loans': ('GET', '/loans/', None),
+    'GET /repayments': ('GET', '/repayments/', None),
+    'GET /repayments/summary': ('GET', '/repayments/summary', None),
+    'POST /repayments': ('POST', '/repayments/', lambda user_id, loan_id: {
+        'loan_id': loan_id, 'amount': '25.00', 'payment_date': PAYMENT_DATE, 'notes': 'bench'
+    }),
+}
+
+def seed(storage, user_ids, loans_per_user: int, repayments_per_loan: int, rng: random.Random) -> dict:
+    """
+    Write the synthetic loans and repayments through the repositories and build each
+    user's summary. Returns {user id: [loan ids]}.
+    """
+    from app.models.loan import LoanCreate
+    from app.services.amortization import installment_due_date
+    from app.services.loan_totals import loan_status, new_loan_item, next_due_attributes
+    from app.services.summary_service import rebuild_summary
+
+    owned = {}
+    with storage.loans.batch_writer() as loans, storage.repayments.batch_writer() as repayments:
+        for user_id in user_ids:
+            owned[user_id] = []
+            for n in range(loans_per_user):
+                loan = new_loan_item(LoanCreate(
+                    title=f"Loan {n}",
+                    amount=Decimal(rng.randrange(1000, 50000)),
+                    interest_rate=Decimal(rng.choice(('0', '3.5', '5', '7.25', '12'))),
+                    term_months=rng.choice((12, 24, 36, 60)),
+                    start_date=datetime(2023, rng.randint(1, 12), rng.randint(1, 28)),
+                ), user_id)
+                paid = min(repayments_per_loan, loan['term_months'])
+                for period in range(1, paid + 1):
+                    repayments.put({
+                        'id': f"{loan['id']}-{period}",
+                        'loan_id': loan['id'],
+                        'user_id': user_id,
+                        'amount': loan['monthly_payment'],
+                        'payment_date': f"{installment_due_date(loan['start_date'], period).isoformat()}T00:00:00",
+                        'notes': '',
+                        'created_at': loan['created_at'],
+                    })
+                total_repaid = loan['monthly_payment'] * paid
+                loan.pop('next_due_date', None)
+                loan.pop('due_bucket', None)
+                loan.update(
+                    total_repaid=total_repaid,
+                    repayment_count=paid,
+                    status=loan_status(total_repaid, loan['total_amount']),
+                    **next_due_attributes(loan, total_repaid)
+                )
+                if paid:
+                    loan['last_payment_date'] = f"{installment_due_date(loan['start_date'], paid).isoformat()}T00:00:00"
+                loans.put(loan)
+                owned[user_id].append(loan['id'])
+
+    for user_id in user_ids:
+        rebuild_summary(storage.summaries, storage.loans, storage.repayments, user_id)
+    return owned
+
+def plan(endpoint: str, count: int, owned: dict, rng: random.Random):
+    """(user id, method, path, body) for `count` requests to an endpoint, round-robin over the users"""
+    method, path, body = ENDPOINTS[endpoint]
+    user_ids = list(owned)
+    requests = []
+    for i in range(count):
+        user_id = user_ids[i % len(user_ids)]
+        payload = body(user_id, rng.choice(owned[user_id])) if body else None
+        requests.append((user_id, method, path, payload))
+    return requests
+
+async def _drive_fastapi(app, requests, concurrency: int):
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(user_id, method, path, payload):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.request(method, path, json=payload, headers={USER_HEADER: user_id})
+                latencies.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(*request) for request in requests))
+        return latencies, errors, time.perf_counter() - started
+
+def drive_fastapi(app, requests, concurrency: int):
+    """Send the requests to the app, `concurrency` at a time: (latencies, errors, elapsed seconds)"""
+    return asyncio.run(_drive_fastapi(app, requests, concurrency))
+
+def drive_lambda(lambda_function, requests):
+    """Invoke the handlers with one API Gateway event per request, in order: (latencies, errors, elapsed seconds)"""
+    latencies, errors = [], 0
+    # report_timing prints a log line per invocation; keep it out of the results
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        for user_id, method, path, payload in requests:
+            handler = lambda_function.loans_handler if path.startswith('/loans') else lambda_function.repayments_handler
+            event = {
+                'httpMethod': method,
+                'path': path,
+                'headers': {},
+                'queryStringParameters': None,
+                'body': json.dumps(payload) if payload is not None else None,
+                'requestContext': {'authorizer': {'claims': {'sub': user_id}}},
+            }
+            request_started = time.perf_counter()
+            response = handler(event, None)
+            latencies.append(time.perf_counter() - request_started)
+            if response['statusCode'] >= 400:
+                errors += 1
+        return latencies, errors, time.perf_counter() - started
+
+def percentile(ordered, fraction: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+def summarize(target: str, storage_backend: str, endpoint: str, latencies, errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        'target': target,
+        'storage': storage_backend,
+        'endpoint': endpoint,
+        'requests': len(ordered),
+        'errors': errors,
+        'throughput_rps': round(len(ordered) / elapsed, 1),
+        'latency_ms': {
+            'p50': round(percentile(ordered, 0.50) * 1000, 3),
+            'p95': round(percentile(ordered, 0.95) * 1000, 3),
+            'p99': round(percentile(ordered, 0.99) * 1000, 3),
+            'mean': round(sum(ordered) / len(ordered) * 1000, 3),
+            'max': round(ordered[-1] * 1000, 3),
+        },
+    }
+
+def run_target(label: str, storage_backend: str, drive, owned: dict, args, rng: random.Random):
+    results = []
+    for endpoint in ENDPOINTS:
+        if args.warmup:
+            drive(plan(endpoint, args.warmup, owned, rng))
+        latencies, errors, elapsed = drive(plan(endpoint, args.requests, owned, rng))
+        result = summarize(label, storage_backend, endpoint, latencies, errors, elapsed)
+        latency = result['latency_ms']
+        print(f"  {label:<8} {endpoint:<24} {result['throughput_rps']:9.1f} req/s"
+              f"  p50 {latency['p50']:8.2f}  p95 {latency['p95']:8.2f}  p99 {latency['p99']:8.2f} ms"
+              f"{f'  {errors} errors' if errors else ''}")
+        results.append(result)
+    return results
+
+def setup_fastapi(args, rng: random.Random):
+    """Import the app on the configured storage, create its tables if on moto and seed them"""
+    from fastapi import Request
+
+    from app.main import app
+    from app.models.user import User
+    from app.repositories.storage import get_storage
+    from app.services import auth_service
+
+    storage = get_storage()
+    if args.storage == 'dynamodb':
+        dynamodb = storage.loans.table.meta.client
+        for logical_name in ('users', 'loans', 'repayments', 'summaries', 'idempotency'):
+            table = getattr(storage, logical_name).table
+            if table.name not in dynamodb.list_tables()['TableNames']:
+                local_dynamodb.create_table(dynamodb, logical_name, table.name)
+
+    def bench_user(request: Request) -> User:
+        user_id = request.headers[USER_HEADER]
+        return User(id=user_id, email=f"{user_id}@example.com", full_name=user_id, created_at=datetime.utcnow())
+
+    app.dependency_overrides[auth_service.get_current_user] = bench_user
+    owned = seed(storage, user_ids(args), args.loans_per_user, args.repayments_per_loan, rng)
+    return app, owned
+
+def setup_lambda(args, rng: random.Random):
+    """Import lambda_function, create the tables under its names and seed them with the backend's repositories"""
+    from app.repositories.loans import LoanRepository
+    from app.repositories.repayments import RepaymentRepository
+    from app.repositories.summaries import SummaryRepository
+
+    sys.path.insert(0, INFRASTRUCTURE_DIR)
+    import lambda_function
+
+    dynamodb = lambda_function.loans_table.meta.client
+    tables = {
+        'loans': lambda_function.loans_table,
+        'repayments': lambda_function.repayments_table,
+        'summaries': lambda_function.summaries_table,
+        'idempotency': lambda_function.idempotency_table,
+    }
+    for logical_name, table in tables.items():
+        if table.name not in dynamodb.list_tables()['TableNames']:
+            local_dynamodb.create_table(dynamodb, logical_name, table.name)
+
+    storage = SimpleNamespace(
+        loans=LoanRepository(tables['loans']),
+        repayments=RepaymentRepository(tables['repayments']),
+        summaries=SummaryRepository(tables['summaries']),
+    )
+    owned = seed(storage, user_ids(args), args.loans_per_user, args.repayments_per_loan, rng)
+    return lambda_function, owned
+
+def user_ids(args):
+    return [f"bench-user-{n}" for n in range(args.users)]
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path: str):
+    """Print p95 and throughput changes against the results of an earlier --output run"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r['target'], r['storage'], r['endpoint']): r for r in baseline['results']}
+    print(f"Against {baseline_path} (commit {(baseline.get('commit') or 'unknown')[:12]}):")
+    matched = [(previous.get((r['target'], r['storage'], r['endpoint'])), r) for r in results]
+    matched = [(before, result) for before, result in matched if before is not None]
+    if not matched:
+        print("  no results for the same target, storage and endpoint")
+    for before, result in matched:
+        old_p95, new_p95 = before['latency_ms']['p95'], result['latency_ms']['p95']
+        old_rps, new_rps = before['throughput_rps'], result['throughput_rps']
+        print(f"  {result['target']:<8} {result['endpoint']:<24}"
+              f" p95 {old_p95:8.2f} -> {new_p95:8.2f} ms ({(new_p95 - old_p95) / old_p95 * 100:+6.1f}%)"
+              f"  {old_rps:9.1f} -> {new_rps:9.1f} req/s ({(new_rps - old_rps) / old_rps * 100:+6.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target", choices=("all", "fastapi", "lambda"), default="all")
+    parser.add_argument("--storage", choices=("dynamodb", "sqlite"), default="dynamodb",
+                        help="storage backend of the FastAPI app (the Lambda always uses DynamoDB)")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--loans-per-user", type=int, default=10)
+    parser.add_argument("--repayments-per-loan", type=int, default=12)
+    parser.add_argument("--requests", type=int, default=300, help="timed requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=20, help="untimed requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight against the FastAPI app")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    # Both runtimes read their configuration and create their boto3 resources at import,
+    # so the mock and the backend choice must be in place before either is imported
+    os.environ['STORAGE_BACKEND'] = args.storage
+    mock = None
+    if args.target != 'fastapi' or args.storage == 'dynamodb':
+        mock = local_dynamodb.start_mock()
+
+    rng = random.Random(args.seed)
+    print(f"{args.users} users x {args.loans_per_user} loans x {args.repayments_per_loan} repayments, "
+          f"{args.requests} requests per endpoint")
+    results = []
+    try:
+        if args.target in ('all', 'fastapi'):
+            app, owned = setup_fastapi(args, rng)
+            results += run_target('fastapi', args.storage, lambda requests: drive_fastapi(app, requests, args.concurrency),
+                                  owned, args, rng)
+        if args.target in ('all', 'lambda'):
+            lambda_function, owned = setup_lambda(args, rng)
+            results += run_target('lambda', 'dynamodb', lambda requests: drive_lambda(lambda_function, requests),
+                                  owned, args, rng)
+    finally:
+        if mock is not None:
+            mock.stop()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'commit': git_commit(),
+                'created_at': datetime.utcnow().isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'config': vars(args),
+                'results': results,
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+if __name__ == "__main__":
+    main()
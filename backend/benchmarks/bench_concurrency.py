@@ -0,0 +1,92 @@
+"""
+Concurrent-request throughput of the FastAPI app with and without the DynamoDB executor.
+
+The loans tables are replaced by in-memory stand-ins that sleep for --latency-ms
+per call, like a DynamoDB round trip. The "inline" run executes those calls on
+the event loop (the old behaviour, via DB_EXECUTOR_INLINE); the "executor" run
+uses app.services.db_executor. With inline calls, concurrent requests serialize
+and throughput stays near 1 / latency whatever the concurrency.
+
+Usage (from backend/, needs httpx):
+    python -m benchmarks.bench_concurrency [--requests 500] [--concurrency 50] [--latency-ms 20]
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+import httpx
+
+from app.main import app
+from app.models.user import User
+from app.repositories.loans import LoanRepository
+from app.routers import loans
+from app.services import auth_service, db_executor
+
+USER = User(id="bench-user", email="bench@example.com", full_name="Bench User", created_at=datetime.utcnow())
+
+class SlowLoansTable:
+    """Loans table stand-in that blocks like a network round trip"""
+
+    def __init__(self, latency_seconds: float, loan_count: int = 20):
+        self.latency_seconds = latency_seconds
+        self.items = {
+            f"loan-{i}": {
+                "id": f"loan-{i}",
+                "user_id": USER.id,
+                "title": f"Loan {i}",
+                "amount": 1000,
+                "interest_rate": 5,
+                "term_months": 12,
+                "start_date": "2024-01-01T00:00:00",
+                "description": "",
+                "created_at": "2024-01-01T00:00:00",
+                "total_amount": 1027.29,
+                "monthly_payment": 85.61,
+                "status": "active",
+            }
+            for i in range(loan_count)
+        }
+
+    def get_item(self, Key):
+        time.sleep(self.latency_seconds)
+        return {"Item": self.items.get(Key["id"])}
+
+    def query(self, **kwargs):
+        time.sleep(self.latency_seconds)
+        user_id = kwargs["ExpressionAttributeValues"][":user_id"]
+        return {"Items": [item for item in self.items.values() if item["user_id"] == user_id]}
+
+async def run_load(total_requests: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(i: int):
+            async with semaphore:
+                url = "/loans/" if i % 2 else f"/loans/loan-{i % 20}"
+                response = await client.get(url)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total_requests)))
+        return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    app.dependency_overrides[auth_service.get_current_user] = lambda: USER
+    loans.loan_repository = LoanRepository(SlowLoansTable(args.latency_ms / 1000))
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {args.latency_ms:g} ms per DynamoDB call")
+    for label, inline in (("inline (before)", True), ("executor (after)", False)):
+        db_executor.DB_EXECUTOR_INLINE = inline
+        elapsed = asyncio.run(run_load(args.requests, args.concurrency))
+        print(f"  {label:<18} {elapsed:7.2f} s  {args.requests / elapsed:8.1f} req/s")
+
+if __name__ == "__main__":
+    main()
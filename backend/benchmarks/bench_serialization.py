@@ -0,0 +1,101 @@
+"""
+Serialization cost of list responses: response_model validation vs pre-validated projection.
+
+Builds --items synthetic loan and repayment items shaped like DynamoDB returns them
+(Decimals, ISO date strings) and times turning each list into response bytes:
+
+  response_model  pydantic validation of List[Model] + jsonable_encoder + simplejson
+                  (what FastAPI does for a returned list)
+  projection      ItemProjector (no validation) + simplejson
+  projection      ItemProjector + orjson, when orjson is installed (the default path)
+
+Usage (from backend/):
+    python -m benchmarks.bench_serialization [--items 10000] [--repeat 5]
+"""
+import argparse
+import time
+from decimal import Decimal
+from typing import List
+
+import simplejson
+from fastapi.encoders import jsonable_encoder
+from pydantic import parse_obj_as
+
+from app.models.loan import Loan
+from app.models.repayment import Repayment
+from app.services import serialization
+from app.services.serialization import ItemProjector
+
+def loan_items(count: int):
+    return [
+        {
+            "id": f"loan-{i}",
+            "user_id": "bench-user",
+            "title": f"Loan {i}",
+            "amount": Decimal("25000"),
+            "interest_rate": Decimal("6.5"),
+            "term_months": 60,
+            "start_date": "2024-01-15T00:00:00",
+            "description": "",
+            "created_at": "2024-01-15T09:30:00.123456",
+            "total_amount": Decimal("29348.40"),
+            "monthly_payment": Decimal("489.14"),
+            "status": "active",
+            "total_repaid": Decimal(i % 60) * Decimal("489.14"),
+            "repayment_count": i % 60,
+            "next_due_date": "2025-03-15",
+            "due_bucket": "due",
+        }
+        for i in range(count)
+    ]
+
+def repayment_items(count: int):
+    return [
+        {
+            "id": f"repayment-{i}",
+            "loan_id": f"loan-{i % 50}",
+            "user_id": "bench-user",
+            "amount": Decimal("489.14"),
+            "payment_date": "2024-06-15T00:00:00",
+            "notes": "",
+            "created_at": "2024-06-15T10:00:00.654321",
+        }
+        for i in range(count)
+    ]
+
+def simplejson_dumps(content) -> bytes:
+    return simplejson.dumps(content, use_decimal=True, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def timed(fn, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{args.items} items, best of {args.repeat}")
+    for model, items in ((Loan, loan_items(args.items)), (Repayment, repayment_items(args.items))):
+        projector = ItemProjector(model)
+        cases = [
+            ("response_model", lambda: simplejson_dumps(jsonable_encoder(
+                parse_obj_as(List[model], items), custom_encoder=serialization.MONEY_JSON_ENCODERS
+            ))),
+            ("projection + simplejson", lambda: simplejson_dumps([projector.project(item) for item in items])),
+        ]
+        if serialization.orjson is not None:
+            cases.append(("projection + orjson", lambda: serialization.dumps([projector.project(item) for item in items])))
+
+        print(f"  List[{model.__name__}]")
+        for label, run in cases:
+            elapsed = timed(run, args.repeat)
+            print(f"    {label:<26} {elapsed * 1000:8.1f} ms  {args.items / elapsed:10.0f} items/s")
+
+if __name__ == "__main__":
+    main()
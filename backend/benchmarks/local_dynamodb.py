@@ -0,0 +1,94 @@
+"""
+In-process DynamoDB for benchmarks: moto's mock with tables shaped like infrastructure/storage.tf.
+
+Keep TABLES in step with storage.tf when keys or indexes change, or queries against
+the stand-in fail with a missing index.
+"""
+import os
+import threading
+
+# Logical table -> (hash key, [(index name, hash key, range key or None, projection)])
+TABLES = {
+    'users': ('id', [('email-index', 'email', None, 'ALL')]),
+    'loans': ('id', [
+        ('user-id-index', 'user_id', None, 'ALL'),
+        ('due-bucket-next-due-date-index', 'due_bucket', 'next_due_date', 'ALL'),
+        ('user-id-next-due-date-index', 'user_id', 'next_due_date', 'KEYS_ONLY'),
+    ]),
+    'repayments': ('id', [
+        ('loan-id-index', 'loan_id', None, 'ALL'),
+        ('loan-id-payment-date-index', 'loan_id', 'payment_date', 'ALL'),
+        ('user-id-payment-date-index', 'user_id', 'payment_date', 'ALL'),
+    ]),
+    'summaries': ('user_id', []),
+    'idempotency': ('key', []),
+}
+
+_moto_lock = threading.Lock()
+
+def _serialize_moto_requests():
+    """
+    moto's backends are not thread-safe (a transaction deep-copies the tables while
+    other threads write to them), but the app calls DynamoDB from a thread pool.
+    Handle one intercepted request at a time, as the real service would atomically.
+    """
+    from moto.core.botocore_stubber import BotocoreStubber
+
+    handle = BotocoreStubber.__call__
+    if getattr(handle, 'serialized', False):
+        return
+
+    def serialized(self, *args, **kwargs):
+        with _moto_lock:
+            return handle(self, *args, **kwargs)
+
+    serialized.serialized = True
+    BotocoreStubber.__call__ = serialized
+
+def start_mock():
+    """
+    Start moto's AWS mock and return it (call .stop() when done). Must run before any
+    boto3 client or resource is created, so it is started before the app is imported.
+    """
+    from moto import mock_aws
+
+    _serialize_moto_requests()
+
+    # moto accepts any credentials, but botocore still needs some to sign requests
+    for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+        os.environ.setdefault(name, 'bench')
+    os.environ.setdefault('AWS_REGION', 'us-east-1')
+    os.environ.setdefault('AWS_DEFAULT_REGION', os.environ['AWS_REGION'])
+    mock = mock_aws()
+    mock.start()
+    return mock
+
+def _key(name, key_type):
+    return {'AttributeName': name, 'KeyType': key_type}
+
+def create_table(dynamodb, logical_name: str, table_name: str):
+    """Create one table (with its GSIs) under the name a runtime resolved for it"""
+    hash_key, indexes = TABLES[logical_name]
+    attributes = {hash_key}
+    global_indexes = []
+    for index_name, index_hash, index_range, projection in indexes:
+        key_schema = [_key(index_hash, 'HASH')]
+        attributes.add(index_hash)
+        if index_range:
+            key_schema.append(_key(index_range, 'RANGE'))
+            attributes.add(index_range)
+        global_indexes.append({
+            'IndexName': index_name,
+            'KeySchema': key_schema,
+            'Projection': {'ProjectionType': projection},
+        })
+
+    kwargs = {
+        'TableName': table_name,
+        'BillingMode': 'PAY_PER_REQUEST',
+        'KeySchema': [_key(hash_key, 'HASH')],
+        'AttributeDefinitions': [{'AttributeName': name, 'AttributeType': 'S'} for name in sorted(attributes)],
+    }
+    if global_indexes:
+        kwargs['GlobalSecondaryIndexes'] = global_indexes
+    return dynamodb.create_table(**kwargs)
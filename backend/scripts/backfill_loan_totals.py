@@ -0,0 +1,116 @@
+"""
+Backfill the running totals stored on each loan.
+
+Loans carry total_repaid, repayment_count and last_payment_date, which repayment
+writes maintain incrementally. Loans created before those attributes existed
+start from zero, so this recomputes them once from the repayments table and
+sets status and next_due_date (the due-date indexes' key) to match. Runs
+against the configured STORAGE_BACKEND.
+
+Usage (from backend/):
+    python -m scripts.backfill_loan_totals [--dry-run]
+"""
+import argparse
+
+from app.repositories.errors import ConditionFailedError, StorageError
+from app.repositories.loans import loan_version
+from app.repositories.storage import get_storage
+from app.services.loan_totals import loan_status, next_due_attributes, next_due_changes, write_loan_version
+from app.services.money import to_decimal
+
+def recount(loan, repayment_repository):
+    """
+    (fields to set, fields to remove) bringing a loan's totals, status and due date in
+    line with its repayments, queried after the loan was read; None if they already are.
+    """
+    total_repaid = to_decimal(0)
+    repayment_count = 0
+    last_payment_date = None
+    for repayment in repayment_repository.iter_loan_repayments(loan['id']):
+        total_repaid += to_decimal(repayment.get('amount'))
+        repayment_count += 1
+        last_payment_date = max(last_payment_date or '', repayment.get('payment_date', ''))
+
+    due_attributes = next_due_attributes(loan, total_repaid)
+    new_status = loan_status(
+        total_repaid, loan.get('total_amount'), loan.get('status', 'active'),
+        due_attributes.get('next_due_date')
+    )
+    unchanged = (
+        to_decimal(loan.get('total_repaid')) == total_repaid
+        and int(loan.get('repayment_count', -1)) == repayment_count
+        and loan.get('last_payment_date') == last_payment_date
+        and loan.get('status') == new_status
+        and loan.get('next_due_date') == due_attributes.get('next_due_date')
+    )
+    if unchanged:
+        return None
+
+    due_set, due_remove = next_due_changes(due_attributes)
+    return {
+        'total_repaid': total_repaid,
+        'repayment_count': repayment_count,
+        'last_payment_date': last_payment_date,
+        'status': new_status,
+        **due_set
+    }, due_remove
+
+def backfill(storage, dry_run=False):
+    loan_repository, repayment_repository = storage.loans, storage.repayments
+    scanned = updated = skipped = 0
+
+    for loan in loan_repository.iter_segment():
+        scanned += 1
+        changes = recount(loan, repayment_repository)
+        if changes is None:
+            continue
+
+        if dry_run:
+            updated += 1
+            set_fields = changes[0]
+            print(f"Would update loan {loan['id']}: total_repaid={set_fields['total_repaid']} "
+                  f"repayment_count={set_fields['repayment_count']} status={set_fields['status']} "
+                  f"next_due_date={set_fields.get('next_due_date')}")
+            continue
+        if 'user_id' not in loan:
+            skipped += 1
+            print(f"Skipped loan {loan['id']}: it has no user_id")
+            continue
+
+        def write(current):
+            # A repayment posted since the scan bumps the version; the retry recounts from a fresh read
+            current_changes = changes if current is loan else recount(current, repayment_repository)
+            if current_changes is None:
+                return False
+            set_fields, remove_fields = current_changes
+            # The owner condition also keeps a loan deleted since the scan from being recreated
+            loan_repository.update(
+                current['id'], current['user_id'], set_fields=set_fields, remove_fields=remove_fields,
+                expected_version=loan_version(current)
+            )
+            return True
+
+        try:
+            if write_loan_version(loan_repository, loan, loan['user_id'], write):
+                updated += 1
+        except ConditionFailedError:
+            skipped += 1
+            print(f"Skipped loan {loan['id']}: deleted or still changing during the backfill")
+
+    return scanned, updated, skipped
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help='Report changes without writing them')
+    args = parser.parse_args()
+
+    try:
+        scanned, updated, skipped = backfill(get_storage(), dry_run=args.dry_run)
+    except StorageError as e:
+        raise SystemExit(f"Backfill failed: {e}")
+
+    action = 'would update' if args.dry_run else 'updated'
+    print(f"Scanned {scanned} loans, {action} {updated}" + (f", skipped {skipped}." if skipped else "."))
+
+if __name__ == '__main__':
+    main()
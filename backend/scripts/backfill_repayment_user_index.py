@@ -0,0 +1,84 @@
+"""
+Backfill repayments so they appear in user-id-payment-date-index.
+
+DynamoDB only indexes items that carry both key attributes, so repayments written
+before user_id/payment_date were stored on every row are invisible to the
+single-query listing. This scans the repayments table and fills in user_id from
+the owning loan and payment_date from created_at where they are missing.
+
+Usage (from backend/):
+    python -m scripts.backfill_repayment_user_index [--dry-run]
+"""
+import argparse
+import os
+
+import boto3
+from botocore.exceptions import ClientError
+
+def backfill(repayments_table, loans_table, dry_run=False):
+    loan_owners = {}
+    scanned = updated = orphaned = 0
+
+    scan_kwargs = {
+        'ProjectionExpression': 'id, loan_id, user_id, payment_date, created_at',
+    }
+    while True:
+        response = repayments_table.scan(**scan_kwargs)
+        for repayment in response.get('Items', []):
+            scanned += 1
+            updates = {}
+
+            if not repayment.get('user_id'):
+                loan_id = repayment.get('loan_id')
+                if loan_id not in loan_owners:
+                    loan = loans_table.get_item(Key={'id': loan_id}).get('Item') if loan_id else None
+                    loan_owners[loan_id] = loan['user_id'] if loan else None
+                if loan_owners[loan_id] is None:
+                    orphaned += 1
+                    print(f"Skipping repayment {repayment['id']}: loan {loan_id} not found")
+                    continue
+                updates['user_id'] = loan_owners[loan_id]
+
+            if not repayment.get('payment_date') and repayment.get('created_at'):
+                updates['payment_date'] = repayment['created_at']
+
+            if not updates:
+                continue
+
+            updated += 1
+            if dry_run:
+                print(f"Would update repayment {repayment['id']}: {updates}")
+                continue
+
+            repayments_table.update_item(
+                Key={'id': repayment['id']},
+                UpdateExpression='SET ' + ', '.join(f'{name} = :{name}' for name in updates),
+                ExpressionAttributeValues={f':{name}': value for name, value in updates.items()}
+            )
+
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        scan_kwargs['ExclusiveStartKey'] = last_key
+
+    return scanned, updated, orphaned
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help='Report changes without writing them')
+    args = parser.parse_args()
+
+    dynamodb = boto3.resource('dynamodb', region_name=os.getenv('AWS_REGION', 'us-east-1'))
+    repayments_table = dynamodb.Table(os.getenv('DYNAMODB_REPAYMENTS_TABLE', 'loansyncro-repayments-dev'))
+    loans_table = dynamodb.Table(os.getenv('DYNAMODB_LOANS_TABLE', 'loansyncro-loans-dev'))
+
+    try:
+        scanned, updated, orphaned = backfill(repayments_table, loans_table, dry_run=args.dry_run)
+    except ClientError as e:
+        raise SystemExit(f"Backfill failed: {e}")
+
+    action = 'would update' if args.dry_run else 'updated'
+    print(f"Scanned {scanned} repayments, {action} {updated}, skipped {orphaned} without a loan.")
+
+if __name__ == '__main__':
+    main()
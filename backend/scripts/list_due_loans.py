@@ -0,0 +1,42 @@
+"""
+List loans, across all users, with an installment due in the next N days.
+
+Reads the sparse due-date index with one range query (paged), so it costs the
+number of due loans rather than a scan of the loans table. Meant as the input
+of payment reminder jobs; --include-overdue also lists installments already late.
+
+Usage (from backend/):
+    python -m scripts.list_due_loans [--days 7] [--include-overdue]
+"""
+import argparse
+from datetime import date, timedelta
+
+from app.repositories.errors import StorageError
+from app.repositories.storage import get_storage
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--days', type=int, default=7, help='Look-ahead window in days (default 7)')
+    parser.add_argument('--include-overdue', action='store_true',
+                        help='Also list loans whose next installment is already past due')
+    args = parser.parse_args()
+
+    loan_repository = get_storage().loans
+
+    today = date.today()
+    due_from = date.min if args.include_overdue else today
+    due_to = today + timedelta(days=args.days)
+
+    count = 0
+    try:
+        for loan in loan_repository.iter_due_loans(due_from.isoformat(), due_to.isoformat()):
+            count += 1
+            print(f"{loan['next_due_date']}  user={loan['user_id']}  loan={loan['id']}  "
+                  f"{loan.get('title', '')}  payment={loan.get('monthly_payment')}")
+    except StorageError as e:
+        raise SystemExit(f"Query failed after {count} loans: {e}")
+
+    print(f"{count} loans due by {due_to.isoformat()}.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""
+Rebuild per-user portfolio summaries from the loans and repayments tables.
+
+Summaries are maintained incrementally on every write, so they only need this
+after a failed delta update, a manual data fix, or a restore. Runs against the
+configured STORAGE_BACKEND.
+
+Usage (from backend/):
+    python -m scripts.rebuild_summaries [--user-id USER_ID ...]
+"""
+import argparse
+
+from app.repositories.errors import StorageError
+from app.repositories.storage import get_storage
+from app.services.summary_service import rebuild_summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--user-id', action='append', dest='user_ids',
+                        help='Rebuild only this user (repeatable); defaults to every user')
+    args = parser.parse_args()
+
+    storage = get_storage()
+    user_ids = args.user_ids or (user['id'] for user in storage.users.iter_segment(attributes=['id']))
+
+    rebuilt = 0
+    try:
+        for user_id in user_ids:
+            summary = rebuild_summary(storage.summaries, storage.loans, storage.repayments, user_id)
+            rebuilt += 1
+            print(f"Rebuilt summary for {user_id}: {summary['total_loans']} loans, "
+                  f"{summary['total_repaid']} repaid of {summary['total_amount']}")
+    except StorageError as e:
+        raise SystemExit(f"Rebuild failed after {rebuilt} users: {e}")
+
+    print(f"Rebuilt {rebuilt} summaries.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Nightly portfolio batch: recompute every loan's totals, status and next due date from the repayments table.
+
+Reads the loans and repayments tables as parallel Scan segments spread over
+worker processes, joins the repayments to their loans, and writes only the loans
+that disagree: totals that drifted, loans that are now paid, and unpaid loans more
+than --default-after-days behind their next installment, which become
+"defaulted" (and "active" again once caught up). Writes are batched and
+conditional, so a loan that takes a repayment while the batch runs is left to
+that write. Users whose loan totals were corrected get their summary rebuilt.
+Also reports how many loans are overdue.
+
+Runs against the configured STORAGE_BACKEND; with SQLite, worker processes
+need SQLITE_DATABASE to be a file.
+
+Usage (from backend/):
+    python -m scripts.reconcile_portfolio [--workers N] [--segments N] [--default-after-days 90]
+        [--today YYYY-MM-DD] [--dry-run]
+"""
+import argparse
+import os
+import time
+from datetime import date
+
+from app.repositories import storage
+from app.repositories.errors import StorageError
+from app.services.portfolio_batch import DEFAULT_AFTER_DAYS, run_portfolio_batch
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes (default: one per core; 1 runs in this process)')
+    parser.add_argument('--segments', type=int,
+                        help='Scan segments per table (default: 4 per worker, so uneven segments even out)')
+    parser.add_argument('--default-after-days', type=int, default=DEFAULT_AFTER_DAYS,
+                        help='Days past the next installment after which an unpaid loan is defaulted')
+    parser.add_argument('--today', type=date.fromisoformat, default=date.today(),
+                        help='Date to judge overdue loans by (default: today)')
+    parser.add_argument('--dry-run', action='store_true', help='Report corrections without writing them')
+    args = parser.parse_args()
+
+    workers = max(1, args.workers)
+    if workers > 1 and storage.STORAGE_BACKEND == 'sqlite' and storage.SQLITE_DATABASE == ':memory:':
+        raise SystemExit("An in-memory SQLite database is not shared with worker processes; "
+                         "set SQLITE_DATABASE to a file or use --workers 1")
+
+    started = time.perf_counter()
+    try:
+        stats = run_portfolio_batch(
+            args.segments or workers * 4, workers, today=args.today,
+            default_after_days=args.default_after_days, dry_run=args.dry_run
+        )
+    except StorageError as e:
+        raise SystemExit(f"Portfolio batch failed: {e}")
+
+    print(f"Scanned {stats['loans']} loans and {stats['repayments']} repayments "
+          f"in {time.perf_counter() - started:.1f} s.")
+    print(f"  active {stats['active']}, paid {stats['paid']}, defaulted {stats['defaulted']}, "
+          f"overdue {stats['overdue']}")
+    if args.dry_run:
+        print(f"  would correct {stats['corrected']} loans")
+    else:
+        print(f"  corrected {stats['updated']} loans, "
+              f"{stats['changed_since_read']} skipped because they changed during the run")
+        print(f"  rebuilt {stats['summaries_rebuilt']} user summaries after correcting their totals")
+        if stats['summaries_failed']:
+            print(f"  {stats['summaries_failed']} summaries failed to rebuild; run scripts.rebuild_summaries")
+    if stats['orphaned_repayments']:
+        print(f"  {stats['orphaned_repayments']} repayments belong to no loan")
+
+if __name__ == '__main__':
+    main()
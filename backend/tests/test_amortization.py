@@ -0,0 +1,47 @@
+"""
+Amortization schedules must agree with the loan they belong to, to the cent.
+
+Run from backend/:
+    python -m pytest tests
+"""
+import random
+from decimal import Decimal
+
+from app.services.amortization import generate_schedule, monthly_payment
+
+def random_loans(count: int, seed: int = 1):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield (
+            Decimal(rng.randint(100, 5_000_000)) / 100,
+            Decimal(rng.randint(0, 3000)) / 100,
+            rng.randint(1, 360),
+        )
+
+def test_rows_add_up_to_the_cent():
+    for amount, rate, term in random_loans(3000):
+        payment = monthly_payment(amount, rate, term)
+        rows = generate_schedule(amount, rate, term, '2024-01-31')
+
+        assert len(rows) == term
+        assert rows[0]['payment'] == payment
+        balance = amount
+        for row in rows:
+            assert row['principal'] + row['interest'] == row['payment']
+            assert balance - row['principal'] == row['balance']
+            assert row['interest'] >= 0
+            if row['period'] < term:
+                assert row['payment'] == payment
+            balance = row['balance']
+        assert rows[-1]['balance'] == 0
+        assert sum(row['principal'] for row in rows) == amount
+
+def test_installment_matches_monthly_payment_where_float_rounding_differs():
+    # The float formula gives 9582.86 here; Decimal ROUND_HALF_UP gives 9582.87
+    rows = generate_schedule(Decimal('479143.25'), Decimal('0'), 50, '2024-01-01')
+    assert rows[0]['payment'] == monthly_payment(Decimal('479143.25'), Decimal('0'), 50) == Decimal('9582.87')
+
+def test_stored_monthly_payment_is_used():
+    rows = generate_schedule(Decimal('1000'), Decimal('12'), 3, '2024-01-31', payment=Decimal('340.02'))
+    assert [row['payment'] for row in rows] == [Decimal('340.02'), Decimal('340.02'), Decimal('340.03')]
+    assert [str(row['due_date']) for row in rows] == ['2024-02-29', '2024-03-31', '2024-04-30']
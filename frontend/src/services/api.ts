@@ -46,19 +46,57 @@ api.interceptors.response.use(
   },
 )
 
+// List endpoints are paginated; the next page's token comes back in this header
+const NEXT_CURSOR_HEADER = "x-next-cursor"
+
+const getAllPages = async <T>(url: string) => {
+  const items: T[] = []
+  let cursor: string | undefined
+  let response
+  do {
+    response = await api.get<T[]>(url, { params: cursor ? { cursor } : undefined })
+    items.push(...response.data)
+    cursor = response.headers[NEXT_CURSOR_HEADER]
+  } while (cursor)
+  return { ...response, data: items }
+}
+
+// Retried POSTs resend the same key, so the API records them once and replays the first response
+const IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+const MAX_POST_ATTEMPTS = 3
+
+const newIdempotencyKey = () => crypto.randomUUID()
+
+// Only failures where the request may not have reached the API, or the API was briefly unavailable
+const isRetryable = (error: unknown) =>
+  axios.isAxiosError(error) && (!error.response || [502, 503, 504].includes(error.response.status))
+
+const postIdempotent = async <T>(url: string, data: unknown, idempotencyKey = newIdempotencyKey()) => {
+  for (let attempt = 1; ; attempt++) {
+    try {
+      return await api.post<T>(url, data, { headers: { [IDEMPOTENCY_KEY_HEADER]: idempotencyKey } })
+    } catch (error) {
+      if (attempt >= MAX_POST_ATTEMPTS || !isRetryable(error)) throw error
+      await new Promise((resolve) => setTimeout(resolve, 500 * 2 ** (attempt - 1)))
+    }
+  }
+}
+
 // API services
 export const loanService = {
-  getAll: () => api.get<Loan[]>("/loans"),
+  getAll: () => getAllPages<Loan>("/loans"),
   getById: (id: string) => api.get<Loan>(`/loans/${id}`),
-  create: (data: LoanFormData) => api.post<Loan>("/loans", data),
+  create: (data: LoanFormData, idempotencyKey?: string) => postIdempotent<Loan>("/loans", data, idempotencyKey),
   update: (id: string, data: LoanFormData) => api.put<Loan>(`/loans/${id}`, data),
-  delete: (id: string) => api.delete(`/loans/${id}`),
+  // cascade also deletes the loan's repayments instead of leaving them behind
+  delete: (id: string, cascade = false) => api.delete(`/loans/${id}`, { params: cascade ? { cascade } : undefined }),
 }
 
 export const repaymentService = {
-  getAll: () => api.get<Repayment[]>("/repayments"),
-  create: (data: Partial<Repayment>) => api.post<Repayment>("/repayments", data),
-  getForLoan: (loanId: string) => api.get<Repayment[]>(`/repayments/loan/${loanId}`),
+  getAll: () => getAllPages<Repayment>("/repayments"),
+  create: (data: Partial<Repayment>, idempotencyKey?: string) =>
+    postIdempotent<Repayment>("/repayments", data, idempotencyKey),
+  getForLoan: (loanId: string) => getAllPages<Repayment>(`/repayments/loan/${loanId}`),
   getSummary: () => api.get<Summary>("/repayments/summary"),
 }
 
@@ -11,6 +11,10 @@ export interface Loan {
   total_amount: number;
   monthly_payment: number;
   status: 'active' | 'paid' | 'defaulted';
+  total_repaid?: number;
+  repayment_count?: number;
+  last_payment_date?: string | null;
+  next_due_date?: string | null;
 }
 
 export interface LoanFormData {
@@ -204,7 +204,7 @@ resource "aws_api_gateway_integration_response" "loans_options_integration_respo
   http_method = aws_api_gateway_method.loans_options.http_method
   status_code = aws_api_gateway_method_response.loans_options_200.status_code
   response_parameters = {
-    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,Authorization'",
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,Authorization,Idempotency-Key,If-None-Match'",
     "method.response.header.Access-Control-Allow-Methods" = "'GET,POST,PUT,DELETE,OPTIONS'",
     "method.response.header.Access-Control-Allow-Origin"  = "'*'"
   }
@@ -247,7 +247,7 @@ resource "aws_api_gateway_integration_response" "repayments_options_integration_
   http_method = aws_api_gateway_method.repayments_options.http_method
   status_code = aws_api_gateway_method_response.repayments_options_200.status_code
   response_parameters = {
-    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,Authorization'",
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,Authorization,Idempotency-Key,If-None-Match'",
     "method.response.header.Access-Control-Allow-Methods" = "'GET,POST,PUT,DELETE,OPTIONS'",
     "method.response.header.Access-Control-Allow-Origin"  = "'*'"
   }
@@ -290,7 +290,7 @@ resource "aws_api_gateway_integration_response" "loans_proxy_options_integration
   http_method = aws_api_gateway_method.loans_proxy_options.http_method
   status_code = aws_api_gateway_method_response.loans_proxy_options_200.status_code
   response_parameters = {
-    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,Authorization'",
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,Authorization,Idempotency-Key,If-None-Match'",
     "method.response.header.Access-Control-Allow-Methods" = "'GET,POST,PUT,DELETE,OPTIONS'",
     "method.response.header.Access-Control-Allow-Origin"  = "'*'"
   }
@@ -333,7 +333,7 @@ resource "aws_api_gateway_integration_response" "repayments_proxy_options_integr
   http_method = aws_api_gateway_method.repayments_proxy_options.http_method
   status_code = aws_api_gateway_method_response.repayments_proxy_options_200.status_code
   response_parameters = {
-    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,Authorization'",
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,Authorization,Idempotency-Key,If-None-Match'",
     "method.response.header.Access-Control-Allow-Methods" = "'GET,POST,PUT,DELETE,OPTIONS'",
     "method.response.header.Access-Control-Allow-Origin"  = "'*'"
   }
@@ -0,0 +1,69 @@
+"""
+Per-request routing cost of the Lambda handlers' route table.
+
+Times Router.match for a mix of literal and templated paths against the old
+split-the-path if/elif chain, plus a full dispatch() of requests that never touch
+DynamoDB (CORS preflight, missing claims, unknown path) to show the shared
+middleware overhead. Routes and regexes are compiled at import, so none of this
+includes compilation.
+
+Usage (from infrastructure/, needs boto3 for the import; no AWS calls are made):
+    python -m benchmarks.bench_dispatch [--iterations 200000]
+"""
+import argparse
+import timeit
+
+import lambda_function
+
+SAMPLE_PATHS = (
+    (lambda_function.loans_router, 'GET', '/loans'),
+    (lambda_function.loans_router, 'PUT', '/loans/9b2f4c1e-6f1a-4c7e-9d3b-2a8e5f0c7d11'),
+    (lambda_function.repayments_router, 'GET', '/repayments/summary'),
+    (lambda_function.repayments_router, 'GET', '/repayments/loan/9b2f4c1e-6f1a-4c7e-9d3b-2a8e5f0c7d11'),
+)
+
+def legacy_match(method, path):
+    """The if/elif chain the handlers used before the route table, minus the handler bodies"""
+    path = path.split('/')
+    if method == 'POST' and path[-1] in ('loans', 'repayments'):
+        return 'create'
+    elif method == 'GET' and path[-1] in ('loans', 'repayments'):
+        return 'list'
+    elif method == 'GET' and path[-2] == 'repayments' and path[-1] != 'summary':
+        return 'loan_repayments'
+    elif method == 'GET' and path[-1] == 'summary':
+        return 'summary'
+    elif method in ('GET', 'PUT', 'DELETE') and path[-2] == 'loans':
+        return 'loan'
+    return None
+
+def dispatch_event(method, path, claims=True):
+    event = {'httpMethod': method, 'path': path, 'requestContext': {}}
+    if claims:
+        event['requestContext']['authorizer'] = {'claims': {'sub': 'bench-user'}}
+    return event
+
+def report(label, seconds, iterations):
+    print(f"  {label:<44} {seconds / iterations * 1e9:8.0f} ns/op")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+    n = args.iterations
+
+    print(f"{n} iterations per case")
+    for router, method, path in SAMPLE_PATHS:
+        report(f"route table  {method} {path[:30]}", timeit.timeit(lambda: router.match(method, path), number=n), n)
+        report(f"if/elif      {method} {path[:30]}", timeit.timeit(lambda: legacy_match(method, path), number=n), n)
+
+    router = lambda_function.loans_router
+    for label, event in (
+        ("dispatch OPTIONS preflight", dispatch_event('OPTIONS', '/loans')),
+        ("dispatch missing claims (401)", dispatch_event('GET', '/loans', claims=False)),
+        ("dispatch unknown path (404)", dispatch_event('GET', '/loans/a/b')),
+    ):
+        report(label, timeit.timeit(lambda: router.dispatch(event), number=n), n)
+
+if __name__ == "__main__":
+    main()
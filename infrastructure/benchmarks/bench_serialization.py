@@ -0,0 +1,59 @@
+"""
+Response body serialization in the Lambda handlers on a 10k-item list.
+
+Compares json.dumps with DecimalEncoder (one Python step per value) against
+dumps_body, which uses orjson with a raw-Decimal Fragment hook when orjson is
+importable (provided by a layer in Lambda; pip install orjson locally).
+
+Usage (from infrastructure/, needs boto3 for the import; no AWS calls are made):
+    python -m benchmarks.bench_serialization [--items 10000] [--repeat 5]
+"""
+import argparse
+import json
+import time
+from decimal import Decimal
+
+import lambda_function
+
+def repayment_items(count: int):
+    return [
+        {
+            'id': f'repayment-{i}',
+            'loan_id': f'loan-{i % 50}',
+            'user_id': 'bench-user',
+            'amount': Decimal('489.14'),
+            'payment_date': '2024-06-15T00:00:00',
+            'notes': '',
+            'created_at': '2024-06-15T10:00:00.654321'
+        }
+        for i in range(count)
+    ]
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    items = repayment_items(args.items)
+    cases = [('json + DecimalEncoder', lambda: json.dumps(items, cls=lambda_function.DecimalEncoder))]
+    if lambda_function.orjson is not None:
+        cases.append(('orjson + Fragment hook', lambda: lambda_function.dumps_body(items)))
+    else:
+        print('orjson is not installed; only the stdlib path is measured')
+
+    print(f'{args.items} items, best of {args.repeat}')
+    for label, run in cases:
+        elapsed = timed(run, args.repeat)
+        print(f'  {label:<24} {elapsed * 1000:8.1f} ms  {args.items / elapsed:10.0f} items/s')
+
+if __name__ == '__main__':
+    main()
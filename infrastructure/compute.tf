@@ -19,9 +19,11 @@ resource "aws_lambda_function" "auth_handler" {
   environment {
     variables = {
       # DynamoDB Tables
-      DYNAMODB_USERS_TABLE      = aws_dynamodb_table.users.name
-      DYNAMODB_LOANS_TABLE      = aws_dynamodb_table.loans.name
-      DYNAMODB_REPAYMENTS_TABLE = aws_dynamodb_table.repayments.name
+      DYNAMODB_USERS_TABLE       = aws_dynamodb_table.users.name
+      DYNAMODB_LOANS_TABLE       = aws_dynamodb_table.loans.name
+      DYNAMODB_REPAYMENTS_TABLE  = aws_dynamodb_table.repayments.name
+      DYNAMODB_SUMMARIES_TABLE   = aws_dynamodb_table.summaries.name
+      DYNAMODB_IDEMPOTENCY_TABLE = aws_dynamodb_table.idempotency.name
       
       # S3 Storage
       S3_BUCKET_NAME = aws_s3_bucket.storage.bucket
@@ -62,13 +64,16 @@ resource "aws_lambda_function" "loans_handler" {
   runtime          = "python3.9"
   timeout          = var.lambda_timeout
   memory_size      = var.lambda_memory_size
+  layers           = var.lambda_layer_arns
 
   environment {
     variables = {
       # DynamoDB Tables
-      DYNAMODB_USERS_TABLE      = aws_dynamodb_table.users.name
-      DYNAMODB_LOANS_TABLE      = aws_dynamodb_table.loans.name
-      DYNAMODB_REPAYMENTS_TABLE = aws_dynamodb_table.repayments.name
+      DYNAMODB_USERS_TABLE       = aws_dynamodb_table.users.name
+      DYNAMODB_LOANS_TABLE       = aws_dynamodb_table.loans.name
+      DYNAMODB_REPAYMENTS_TABLE  = aws_dynamodb_table.repayments.name
+      DYNAMODB_SUMMARIES_TABLE   = aws_dynamodb_table.summaries.name
+      DYNAMODB_IDEMPOTENCY_TABLE = aws_dynamodb_table.idempotency.name
       
       # S3 Storage
       S3_BUCKET_NAME = aws_s3_bucket.storage.bucket
@@ -80,8 +85,9 @@ resource "aws_lambda_function" "loans_handler" {
       # Security
       KMS_KEY_ID = aws_kms_key.main.key_id
       
-      # SNS
-      SNS_TOPIC_ARN = aws_sns_topic.alerts.arn
+      # SNS (published off the request path via the notifications queue)
+      SNS_TOPIC_ARN           = aws_sns_topic.alerts.arn
+      NOTIFICATIONS_QUEUE_URL = aws_sqs_queue.notifications.url
       
       # General
       ENVIRONMENT  = var.environment
@@ -107,13 +113,16 @@ resource "aws_lambda_function" "repayments_handler" {
   runtime          = "python3.9"
   timeout          = var.lambda_timeout
   memory_size      = var.lambda_memory_size
+  layers           = var.lambda_layer_arns
 
   environment {
     variables = {
       # DynamoDB Tables
-      DYNAMODB_USERS_TABLE      = aws_dynamodb_table.users.name
-      DYNAMODB_LOANS_TABLE      = aws_dynamodb_table.loans.name
-      DYNAMODB_REPAYMENTS_TABLE = aws_dynamodb_table.repayments.name
+      DYNAMODB_USERS_TABLE       = aws_dynamodb_table.users.name
+      DYNAMODB_LOANS_TABLE       = aws_dynamodb_table.loans.name
+      DYNAMODB_REPAYMENTS_TABLE  = aws_dynamodb_table.repayments.name
+      DYNAMODB_SUMMARIES_TABLE   = aws_dynamodb_table.summaries.name
+      DYNAMODB_IDEMPOTENCY_TABLE = aws_dynamodb_table.idempotency.name
       
       # S3 Storage
       S3_BUCKET_NAME = aws_s3_bucket.storage.bucket
@@ -125,8 +134,9 @@ resource "aws_lambda_function" "repayments_handler" {
       # Security
       KMS_KEY_ID = aws_kms_key.main.key_id
       
-      # SNS
-      SNS_TOPIC_ARN = aws_sns_topic.alerts.arn
+      # SNS (published off the request path via the notifications queue)
+      SNS_TOPIC_ARN           = aws_sns_topic.alerts.arn
+      NOTIFICATIONS_QUEUE_URL = aws_sqs_queue.notifications.url
       
       # General
       ENVIRONMENT  = var.environment
@@ -142,3 +152,43 @@ resource "aws_lambda_function" "repayments_handler" {
 
   depends_on = [aws_cloudwatch_log_group.repayments_logs]
 }
+
+# Lambda Function: Notifications Worker
+resource "aws_lambda_function" "notifications_handler" {
+  filename         = data.archive_file.lambda_zip.output_path
+  function_name    = "${local.name_prefix}-notifications"
+  role             = aws_iam_role.lambda_execution_role.arn
+  handler          = "lambda_function.notifications_handler"
+  runtime          = "python3.9"
+  timeout          = var.lambda_timeout
+  memory_size      = var.lambda_memory_size
+  layers           = var.lambda_layer_arns
+
+  environment {
+    variables = {
+      # SNS
+      SNS_TOPIC_ARN = aws_sns_topic.alerts.arn
+
+      # General
+      ENVIRONMENT  = var.environment
+      PROJECT_NAME = var.project_name
+    }
+  }
+  source_code_hash = data.archive_file.lambda_zip.output_base64sha256
+
+  tags = merge(local.common_tags, {
+    Name     = "${local.name_prefix}-notifications"
+    Function = "Notifications"
+  })
+
+  depends_on = [aws_cloudwatch_log_group.notifications_logs]
+}
+
+# Deliver queued notifications in batches; only failed messages are retried
+resource "aws_lambda_event_source_mapping" "notifications_queue" {
+  event_source_arn                   = aws_sqs_queue.notifications.arn
+  function_name                      = aws_lambda_function.notifications_handler.arn
+  batch_size                         = 10
+  maximum_batching_window_in_seconds = 5
+  function_response_types            = ["ReportBatchItemFailures"]
+}
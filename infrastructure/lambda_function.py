@@ -1,522 +1,1303 @@
+import time
+_INIT_STARTED_AT = time.perf_counter()
+
 import json
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+import base64
+import binascii
+import calendar
+import functools
+import hashlib
+import heapq
 import os
+import random
+import re
 import uuid
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
 import decimal
 
-sns = boto3.client("sns", region_name=os.environ.get("AWS_REGION", "us-east-1"))
+AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
 SNS_TOPIC_ARN = os.environ.get("SNS_TOPIC_ARN")
 
+# Clients and tables are built once per container during init and reused by every warm
+# invocation, along with their keep-alive HTTP connection pool
+BOTO_CONFIG = Config(
+    max_pool_connections=int(os.environ.get('BOTO_MAX_POOL_CONNECTIONS', '32')),
+    tcp_keepalive=True,
+    retries={'max_attempts': 3, 'mode': 'standard'}
+)
+dynamodb = boto3.resource('dynamodb', region_name=AWS_REGION, config=BOTO_CONFIG)
+loans_table = dynamodb.Table(os.environ.get('DYNAMODB_LOANS_TABLE', 'loansyncro-dev-loans'))
+repayments_table = dynamodb.Table(os.environ.get('DYNAMODB_REPAYMENTS_TABLE', 'loansyncro-dev-repayments'))
+summaries_table = dynamodb.Table(os.environ.get('DYNAMODB_SUMMARIES_TABLE', 'loansyncro-dev-summaries'))
+idempotency_table = dynamodb.Table(os.environ.get('DYNAMODB_IDEMPOTENCY_TABLE', 'loansyncro-dev-idempotency'))
+
+_sns = None
+
+def get_sns():
+    """SNS client, created on first publish so invocations that never notify skip its setup"""
+    global _sns
+    if _sns is None:
+        _sns = boto3.client('sns', region_name=AWS_REGION, config=BOTO_CONFIG)
+    return _sns
+
+_cold_start = True
+
+def report_timing(handler):
+    """
+    Log one JSON line per invocation with its duration and whether it was a cold start.
+    Cold starts also carry init_ms, the module import and client setup time, so
+    CloudWatch can compare cold vs warm cost (see the metric filters in monitoring.tf).
+    """
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        global _cold_start
+        cold_start, _cold_start = _cold_start, False
+        started_at = time.perf_counter()
+        try:
+            return handler(event, context)
+        finally:
+            print(json.dumps({
+                'event': 'invocation_timing',
+                'handler': handler.__name__,
+                'cold_start': cold_start,
+                'init_ms': round(INIT_DURATION_MS, 2) if cold_start else None,
+                'duration_ms': round((time.perf_counter() - started_at) * 1000, 2)
+            }))
+    return wrapper
+
+try:
+    import orjson  # Not in the deployment zip; used when a layer provides it (var.lambda_layer_arns)
+    orjson.Fragment  # Added in orjson 3.9.14; needed to write Decimals exactly
+except (ImportError, AttributeError):
+    orjson = None
+
+_encode_str = json.encoder.encode_basestring_ascii
+
 class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, decimal.Decimal):
-            return float(obj)
-        return super(DecimalEncoder, self).default(obj)
-
-def convert_dynamodb_item(item):
-    """Convert DynamoDB item with potential Decimal values to JSON-serializable object"""
-    if isinstance(item, dict):
-        return {k: convert_dynamodb_item(v) for k, v in item.items()}
-    elif isinstance(item, list):
-        return [convert_dynamodb_item(i) for i in item]
-    elif isinstance(item, Decimal):
-        return float(item)
-    else:
-        return item
+    """
+    Writes DynamoDB Decimals as JSON numbers with their own digits, so amounts never
+    pass through float. Dicts and lists are walked in Python, which is why orjson is
+    preferred when a layer provides it; other values go through the stdlib encoder.
+    """
+    def encode(self, o):
+        return self._encode(o)
 
-def loans_handler(event, context):
-    """Loans handler with full CRUD operations"""
-    headers = {
-        'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-    }
-    
+    def iterencode(self, o, _one_shot=False):
+        yield self._encode(o)
+
+    def _encode(self, o):
+        if isinstance(o, str):
+            return _encode_str(o)
+        if isinstance(o, decimal.Decimal):
+            return str(o)
+        if isinstance(o, dict):
+            items = sorted(o.items()) if self.sort_keys else o.items()
+            return '{' + self.item_separator.join(
+                _encode_str(str(key)) + self.key_separator + self._encode(value) for key, value in items
+            ) + '}'
+        if isinstance(o, (list, tuple)):
+            return '[' + self.item_separator.join(self._encode(value) for value in o) + ']'
+        return ''.join(super().iterencode(o, _one_shot=True))
+
+def _orjson_default(obj):
+    # Fragment embeds the Decimal's own digits as a raw JSON number
+    if isinstance(obj, decimal.Decimal):
+        return orjson.Fragment(str(obj).encode())
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+def dumps_body(payload):
+    """
+    JSON response body. orjson encodes everything but Decimals natively and embeds their
+    digits verbatim; the stdlib fallback writes the same digits through DecimalEncoder.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, default=_orjson_default).decode()
+    return json.dumps(payload, cls=DecimalEncoder, separators=(',', ':'))
+
+class ApiError(Exception):
+    """Raised from route handlers to answer with an error status instead of a 500"""
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+def query_all(table, **query_kwargs):
+    """Yield every item matched by a query, following LastEvaluatedKey across pages"""
+    while True:
+        response = table.query(**query_kwargs)
+        yield from response.get('Items', [])
+        if not response.get('LastEvaluatedKey'):
+            return
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def query_page(table, limit, exclusive_start_key=None, **query_kwargs):
+    """Get one page of a query and the key to continue from"""
+    query_kwargs['Limit'] = limit
+    if exclusive_start_key:
+        query_kwargs['ExclusiveStartKey'] = exclusive_start_key
+    response = table.query(**query_kwargs)
+    return response.get('Items', []), response.get('LastEvaluatedKey')
+
+def encode_cursor(last_evaluated_key):
+    """Turn a DynamoDB LastEvaluatedKey into an opaque URL-safe token"""
+    if not last_evaluated_key:
+        return None
+    raw = json.dumps(last_evaluated_key, separators=(',', ':'), sort_keys=True, default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def parse_page_params(event, **expected):
+    """
+    Read limit/cursor query parameters into (limit, ExclusiveStartKey).
+    Keyword arguments name key attributes the cursor must carry. Raises ApiError(400) on bad input.
+    """
+    params = event.get('queryStringParameters') or {}
     try:
-        if event.get('httpMethod') == 'OPTIONS':
-            return {'statusCode': 200, 'headers': headers, 'body': ''}
-        
-        # Get user info from Cognito authorizer
-        authorizer = event.get('requestContext', {}).get('authorizer', {})
-        claims = authorizer.get('claims', {})
-        user_id = claims.get('user_id') or claims.get('sub')
-        if not user_id:
-            return {
-                'statusCode': 401,
-                'headers': headers,
-                'body': json.dumps({'error': 'User ID not found in token'})
-            }
-        
-        dynamodb = boto3.resource('dynamodb', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
-        loans_table = dynamodb.Table(os.environ.get('DYNAMODB_LOANS_TABLE', 'loansyncro-dev-loans'))
-        
-        path = event.get('path', '').split('/')
-        method = event.get('httpMethod', '')
-        
-        if method == 'POST' and path[-1] == 'loans':
-            body = json.loads(event.get('body', '{}'))
-            
-            principal = float(body.get('amount', 0))
-            rate = float(body.get('interest_rate', 0)) / 100 / 12
-            term = int(body.get('term_months', 0))
-            
-            if rate > 0:
-                monthly_payment = principal * rate * (1 + rate)**term / ((1 + rate)**term - 1)
-            else:
-                monthly_payment = principal / term
-            
-            total_amount = monthly_payment * term
-            
-            loan_data = {
-                'id': str(uuid.uuid4()),
-                'user_id': user_id,
-                'title': body.get('title'),
-                'amount': Decimal(str(principal)),
-                'interest_rate': Decimal(str(body.get('interest_rate', 0))),
-                'term_months': term,
-                'start_date': body.get('start_date', datetime.utcnow().isoformat()),
-                'description': body.get('description', ''),
-                'created_at': datetime.utcnow().isoformat(),
-                'total_amount': Decimal(str(total_amount)),
-                'monthly_payment': Decimal(str(monthly_payment)),
-                'status': 'active'
-            }
-            
-            loans_table.put_item(Item=loan_data)
+        limit = int(params.get('limit') or DEFAULT_PAGE_SIZE)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ApiError(400, f'limit must be between 1 and {MAX_PAGE_SIZE}')
 
-            # SNS Notification: Loan Created
-            if SNS_TOPIC_ARN:
-                try:
-                    sns.publish(
-                    TopicArn=SNS_TOPIC_ARN,
-                    Subject="📄 Loan Created Successfully!",
-                    Message=(
-                        "🎉 Congratulations!\n\n"
-                        "Your loan has been created successfully.\n\n"
-                        f"Loan Title: {loan_data.get('title')}\n"
-                        f"Amount: ${loan_data.get('amount')}\n"
-                        f"Interest Rate: {loan_data.get('interest_rate')}%\n"
-                        f"Term: {loan_data.get('term_months')} months\n"
-                        f"Start Date: {loan_data.get('start_date')}\n"
-                        "Status: Active\n\n"
-                        "Thank you for using LoanSyncro! 😊"
-                    )
-                )
-                except Exception as snse:
-                    print("SNS publish failed:", str(snse))
-        
-            return {
-                'statusCode': 201,
-                'headers': headers,
-                'body': json.dumps(loan_data, cls=DecimalEncoder)
-            }
-        
-        elif method == 'GET' and path[-1] == 'loans':
-            response = loans_table.query(
-                IndexName='user-id-index',
-                KeyConditionExpression='user_id = :user_id',
-                ExpressionAttributeValues={':user_id': user_id}
+    cursor = params.get('cursor')
+    if not cursor:
+        return limit, None
+    try:
+        key = json.loads(base64.urlsafe_b64decode((cursor + '=' * (-len(cursor) % 4)).encode()))
+    except (ValueError, binascii.Error):
+        key = None
+    if not isinstance(key, dict) or any(key.get(name) != value for name, value in expected.items()):
+        raise ApiError(400, 'Invalid pagination cursor')
+    return limit, key
+
+def page_headers(headers, last_evaluated_key):
+    """Response headers with the continuation token for the next page, if there is one"""
+    next_cursor = encode_cursor(last_evaluated_key)
+    if not next_cursor:
+        return headers
+    return dict(headers, **{NEXT_CURSOR_HEADER: next_cursor})
+
+# Bounded pool for per-loan repayment queries, created on first use and reused across warm invocations
+REPAYMENTS_FANOUT_MAX_WORKERS = int(os.environ.get('REPAYMENTS_FANOUT_MAX_WORKERS', '16'))
+_fanout_executor = None
+
+def _get_fanout_executor():
+    global _fanout_executor
+    if _fanout_executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _fanout_executor = ThreadPoolExecutor(max_workers=REPAYMENTS_FANOUT_MAX_WORKERS)
+    return _fanout_executor
+
+def _payment_date(repayment):
+    return repayment.get('payment_date', '')
+
+def query_loan_repayments(loan_id):
+    """Get the repayments of a single loan from loan-id-payment-date-index, most recent first"""
+    # boto3 resources are not thread safe but clients are, so fan-out workers share the
+    # table's client, which (built by the resource) still takes and returns plain Python values
+    repayments = []
+    query_kwargs = {
+        'TableName': repayments_table.name,
+        'IndexName': 'loan-id-payment-date-index',
+        'KeyConditionExpression': 'loan_id = :loan_id',
+        'ExpressionAttributeValues': {':loan_id': loan_id},
+        'ScanIndexForward': False
+    }
+    while True:
+        response = repayments_table.meta.client.query(**query_kwargs)
+        repayments.extend(response.get('Items', []))
+        if not response.get('LastEvaluatedKey'):
+            return repayments
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def fetch_repayments_for_loans(loan_ids):
+    """Query every loan's repayments concurrently and k-way merge them, most recent first"""
+    loan_ids = list(loan_ids)
+    if not loan_ids:
+        return []
+    if len(loan_ids) == 1:
+        return query_loan_repayments(loan_ids[0])
+    per_loan = list(_get_fanout_executor().map(query_loan_repayments, loan_ids))
+    return list(heapq.merge(*per_loan, key=_payment_date, reverse=True))
+
+USE_USER_REPAYMENT_INDEX = os.environ.get('USE_USER_REPAYMENT_INDEX', 'true').lower() == 'true'
+
+def query_user_repayments(repayments_table, user_id):
+    """Get every repayment of a user from user-id-payment-date-index, most recent first"""
+    return list(query_all(
+        repayments_table,
+        IndexName='user-id-payment-date-index',
+        KeyConditionExpression='user_id = :user_id',
+        ExpressionAttributeValues={':user_id': user_id},
+        ScanIndexForward=False
+    ))
+
+def list_user_loans(loans_table, user_id):
+    """Get every loan of a user"""
+    return list(query_all(
+        loans_table,
+        IndexName='user-id-index',
+        KeyConditionExpression='user_id = :user_id',
+        ExpressionAttributeValues={':user_id': user_id}
+    ))
+
+def query_loans_repayments_page(loan_ids, limit, exclusive_start_key=None):
+    """
+    Get one page of the repayments of several loans without the user index, and the key to
+    continue from. Loans are read one after another, each most recent first, so a page never
+    reads more than its own items; the key names the loan to resume with.
+    """
+    position, loan_start_key = 0, None
+    if exclusive_start_key:
+        position = loan_ids.index(exclusive_start_key['loan_id'])
+        loan_start_key = exclusive_start_key.get('start_key')
+
+    items = []
+    for index in range(position, len(loan_ids)):
+        loan_id = loan_ids[index]
+        while True:
+            page, loan_start_key = query_page(
+                repayments_table, limit - len(items), loan_start_key,
+                IndexName='loan-id-payment-date-index',
+                KeyConditionExpression='loan_id = :loan_id',
+                ExpressionAttributeValues={':loan_id': loan_id},
+                ScanIndexForward=False
             )
-            return {
-                'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps(response.get('Items', []), cls=DecimalEncoder)
-            }
-        
-        elif method == 'GET' and path[-2] == 'loans':
-            loan_id = path[-1]
-            response = loans_table.get_item(Key={'id': loan_id})
-            loan = response.get('Item')
-            
-            if not loan:
-                return {
-                    'statusCode': 404,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Loan not found'})
-                }
-            
-            if loan['user_id'] != user_id:
-                return {
-                    'statusCode': 403,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Not authorized to access this loan'})
+            items.extend(page)
+            if not loan_start_key:
+                break
+            if len(items) >= limit:
+                return items, {'loan_id': loan_id, 'start_key': loan_start_key}
+        if len(items) >= limit and index + 1 < len(loan_ids):
+            return items, {'loan_id': loan_ids[index + 1]}
+    return items, None
+
+def to_decimal(value):
+    """Coerce a DynamoDB/JSON number into a Decimal without float rounding artifacts"""
+    if isinstance(value, Decimal):
+        return value
+    return Decimal(str(value or 0))
+
+CENT = Decimal('0.01')
+
+def round_money(value):
+    """Round an amount to whole cents, half up"""
+    return to_decimal(value).quantize(CENT, rounding=decimal.ROUND_HALF_UP)
+
+def calculate_monthly_payment(principal, annual_rate, term_months):
+    """
+    Level monthly payment, P * r * (1 + r)^n / ((1 + r)^n - 1), in Decimal rounded to the
+    cent; same as app/services/amortization.py
+    """
+    principal = to_decimal(principal)
+    rate = to_decimal(annual_rate) / 1200
+    term_months = int(term_months)
+    if rate > 0:
+        growth = (1 + rate) ** term_months
+        return round_money(principal * rate * growth / (growth - 1))
+    return round_money(principal / term_months)
+
+def installment_due_date(start_date, period):
+    """Due date of installment `period` (1-based), keeping the start day clamped to short months"""
+    start = date.fromisoformat(str(start_date)[:10])
+    months = start.month - 1 + period
+    year, month = start.year + months // 12, months % 12 + 1
+    return date(year, month, min(start.day, calendar.monthrange(year, month)[1]))
+
+def next_due_date(start_date, term_months, monthly_payment, total_repaid):
+    """Due date of the first installment total_repaid does not cover (with a cent of slack each), or None"""
+    payment = to_decimal(monthly_payment) - CENT
+    if payment <= 0:
+        return None
+    covered = int(to_decimal(total_repaid) // payment)
+    if covered >= int(term_months):
+        return None
+    return installment_due_date(start_date, covered + 1)
+
+# An unpaid loan more than this many days behind its next installment is defaulted
+DEFAULT_AFTER_DAYS = int(os.environ.get('LOAN_DEFAULT_AFTER_DAYS', '90'))
+
+def past_default(next_due, today=None):
+    """Whether an installment due on next_due (ISO date) is more than DEFAULT_AFTER_DAYS overdue"""
+    if not next_due:
+        return False
+    return ((today or date.today()) - date.fromisoformat(next_due[:10])).days > DEFAULT_AFTER_DAYS
+
+def loan_status(total_repaid, total_amount, current_status='active', next_due=None):
+    """
+    Status a loan should have for the given amount repaid. A defaulted loan stays
+    defaulted until it is paid off or its next installment, next_due, is caught up.
+    """
+    if to_decimal(total_repaid) >= to_decimal(total_amount):
+        return 'paid'
+    if current_status == 'defaulted':
+        return 'active' if next_due and not past_default(next_due) else 'defaulted'
+    if current_status == 'paid' or to_decimal(total_repaid) > 0:
+        return 'active'
+    return current_status
+
+# Only loans with an installment outstanding carry next_due_date and due_bucket, keeping
+# both due-date indexes sparse; the constant due_bucket lets one query span every user
+DUE_BUCKET = 'due'
+
+def next_due_attributes(loan, total_repaid=None):
+    """next_due_date/due_bucket for a loan item, or {} if nothing is left to pay"""
+    if total_repaid is None:
+        total_repaid = loan.get('total_repaid')
+    due = None
+    if loan_status(total_repaid, loan.get('total_amount')) != 'paid':
+        due = next_due_date(loan['start_date'], loan['term_months'], loan.get('monthly_payment'), total_repaid)
+    if due is None:
+        return {}
+    return {'next_due_date': due.isoformat(), 'due_bucket': DUE_BUCKET}
+
+def next_due_update(attributes):
+    """(SET assignments, REMOVE clause, expression values) that write next_due_attributes onto a loan"""
+    if attributes:
+        return (
+            'next_due_date = :next_due_date, due_bucket = :due_bucket',
+            '',
+            {':next_due_date': attributes['next_due_date'], ':due_bucket': attributes['due_bucket']}
+        )
+    return '', ' REMOVE next_due_date, due_bucket', {}
+
+SUMMARY_FIELDS = ('total_loans', 'total_borrowed', 'total_amount', 'total_repaid')
+
+def summary_delta_update(user_id, **deltas):
+    """update_item arguments that ADD the given deltas to a user's summary and bump its revision"""
+    deltas = {name: to_decimal(value) for name, value in deltas.items() if value}
+    deltas['revision'] = 1
+    return {
+        'Key': {'user_id': user_id},
+        'UpdateExpression': 'ADD ' + ', '.join(f'{name} :{name}' for name in deltas),
+        'ExpressionAttributeValues': {f':{name}': value for name, value in deltas.items()}
+    }
+
+def apply_summary_delta(summaries_table, user_id, **deltas):
+    """Incrementally adjust a user's summary; failures only leave it stale until the next rebuild"""
+    try:
+        summaries_table.update_item(**summary_delta_update(user_id, **deltas))
+    except ClientError as e:
+        print(f"Error updating summary for user {user_id}: {e}")
+
+# Recounts of a summary whose revision keeps moving (writes landing mid-rebuild) before
+# the last one is served without being stored
+SUMMARY_REBUILD_ATTEMPTS = int(os.environ.get('SUMMARY_REBUILD_ATTEMPTS', '3'))
+
+def rebuild_summary(summaries_table, loans_table, repayments_table, user_id):
+    """
+    Recompute a user's summary from the loans and repayments tables and store it, only
+    while its revision is still the one read before the recount; every loan or repayment
+    write bumps it, and such a write would otherwise be overwritten. Redone up to
+    SUMMARY_REBUILD_ATTEMPTS times, then the last recount is served without being stored.
+    """
+    for _ in range(SUMMARY_REBUILD_ATTEMPTS):
+        stored = summaries_table.get_item(Key={'user_id': user_id}).get('Item')
+        revision = int(stored.get('revision', 0)) if stored else 0
+        summary = recount_summary(loans_table, repayments_table, user_id)
+        condition = 'revision = :revision' if revision else 'attribute_not_exists(revision) OR revision = :revision'
+        try:
+            summaries_table.update_item(
+                Key={'user_id': user_id},
+                UpdateExpression='SET ' + ', '.join(f'{name} = :{name}' for name in summary) + ' ADD revision :one',
+                ConditionExpression=condition,
+                ExpressionAttributeValues={
+                    **{f':{name}': value for name, value in summary.items()}, ':one': 1, ':revision': revision
                 }
-            
-            return {
-                'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps(loan, cls=DecimalEncoder)
-            }
-        
-        elif method == 'PUT' and path[-2] == 'loans':
-            loan_id = path[-1]
-            body = json.loads(event.get('body', '{}'))
-            
-            response = loans_table.get_item(Key={'id': loan_id})
-            loan = response.get('Item')
-            
-            if not loan:
-                return {
-                    'statusCode': 404,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Loan not found'})
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            continue
+        return dict(summary, revision=revision + 1)
+    print(f"Summary of user {user_id} kept changing during {SUMMARY_REBUILD_ATTEMPTS} rebuilds; serving it unstored")
+    return summary
+
+def recount_summary(loans_table, repayments_table, user_id):
+    """A user's summary fields recomputed from the loans and repayments tables"""
+    summary = {name: Decimal('0') for name in SUMMARY_FIELDS}
+    loan_ids = set()
+    for loan in list_user_loans(loans_table, user_id):
+        loan_ids.add(loan['id'])
+        summary['total_loans'] += 1
+        summary['total_borrowed'] += to_decimal(loan.get('amount'))
+        summary['total_amount'] += to_decimal(loan.get('total_amount'))
+
+    # Repayments of deleted loans no longer count towards the portfolio
+    for repayment in query_user_repayments(repayments_table, user_id):
+        if repayment.get('loan_id') in loan_ids:
+            summary['total_repaid'] += to_decimal(repayment.get('amount'))
+
+    summary['rebuilt_at'] = datetime.utcnow().isoformat()
+    return summary
+
+def get_user_summary(summaries_table, loans_table, repayments_table, user_id):
+    """
+    Read a user's summary with a single get_item, building it on first use. Returns it
+    with its ETag, from the item's revision (bumped by every write) and the next due date.
+    """
+    summary = summaries_table.get_item(Key={'user_id': user_id}).get('Item')
+    if summary is None or 'rebuilt_at' not in summary:
+        summary = rebuild_summary(summaries_table, loans_table, repayments_table, user_id)
+
+    total_repaid = to_decimal(summary.get('total_repaid'))
+    # The user's sparse due-date index is ordered by date, so its first item is the next payment
+    next_due = loans_table.query(
+        IndexName='user-id-next-due-date-index',
+        KeyConditionExpression='user_id = :user_id',
+        ExpressionAttributeValues={':user_id': user_id},
+        Limit=1
+    ).get('Items', [])
+    next_payment_due = next_due[0]['next_due_date'] if next_due else None
+    # A summary served without being stored has no revision; rebuilt_at tells those apart instead
+    etag = entity_tag(user_id, summary.get('revision'), summary['rebuilt_at'], next_payment_due)
+    return {
+        'total_loans': int(summary.get('total_loans', 0)),
+        'total_borrowed': to_decimal(summary.get('total_borrowed')),
+        'total_repaid': total_repaid,
+        'outstanding_amount': max(Decimal('0'), to_decimal(summary.get('total_amount')) - total_repaid),
+        'next_payment_due': next_payment_due
+    }, etag
+
+# Tries at a loan write whose version check fails because other writes to the loan got in first
+LOAN_WRITE_ATTEMPTS = int(os.environ.get('LOAN_WRITE_ATTEMPTS', '5'))
+# Backoff before the first retry, doubled (with full jitter) for every later one
+LOAN_RETRY_BASE_SECONDS = float(os.environ.get('LOAN_RETRY_BASE_SECONDS', '0.02'))
+
+def record_repayment(repayments_table, loans_table, summaries_table, repayment_data, loan):
+    """
+    Write a repayment and fold it into the loan's running totals and the user's
+    summary in one transaction. Status and next due date are derived from the loan
+    as read, so the write only applies while the loan still has that version.
+    Returns the loan attributes as they are after the write.
+    """
+    version = int(loan.get('version', 0))
+    amount = to_decimal(repayment_data['amount'])
+    total_repaid = to_decimal(loan.get('total_repaid')) + amount
+    due_attributes = next_due_attributes(loan, total_repaid)
+    new_status = loan_status(
+        total_repaid, loan.get('total_amount'), loan.get('status', 'active'), due_attributes.get('next_due_date')
+    )
+    last_payment_date = max(loan.get('last_payment_date') or '', repayment_data['payment_date'])
+    due_set, due_remove, due_values = next_due_update(due_attributes)
+
+    loans_table.meta.client.transact_write_items(
+        TransactItems=[
+            {
+                'Put': {
+                    'TableName': repayments_table.name,
+                    'Item': repayment_data,
+                    'ConditionExpression': 'attribute_not_exists(id)'
                 }
-            
-            if loan['user_id'] != user_id:
-                return {
-                    'statusCode': 403,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Not authorized to update this loan'})
+            },
+            {
+                'Update': {
+                    'TableName': loans_table.name,
+                    'Key': {'id': loan['id']},
+                    'UpdateExpression': (
+                        'ADD total_repaid :amount, repayment_count :one, #version :one '
+                        'SET last_payment_date = :last_payment_date, #status = :status'
+                        + (', ' + due_set if due_set else '') + due_remove
+                    ),
+                    # Loans written before versioning have none until their next write
+                    'ConditionExpression': 'user_id = :user_id AND ' + (
+                        '(attribute_not_exists(#version) OR #version = :version)' if version == 0
+                        else '#version = :version'
+                    ),
+                    'ExpressionAttributeNames': {'#status': 'status', '#version': 'version'},
+                    'ExpressionAttributeValues': {
+                        ':amount': amount,
+                        ':one': 1,
+                        ':version': version,
+                        ':last_payment_date': last_payment_date,
+                        ':status': new_status,
+                        ':user_id': repayment_data['user_id'],
+                        **due_values
+                    }
                 }
-            
-            principal = float(body.get('amount', loan['amount']))
-            rate = float(body.get('interest_rate', loan['interest_rate'])) / 100 / 12
-            term = int(body.get('term_months', loan['term_months']))
-            
-            if rate > 0:
-                monthly_payment = principal * rate * (1 + rate)**term / ((1 + rate)**term - 1)
-            else:
-                monthly_payment = principal / term
-            
-            total_amount = monthly_payment * term
-            
-            update_expression = """
-                SET title = :title,
-                    amount = :amount,
-                    interest_rate = :interest_rate,
-                    term_months = :term_months,
-                    start_date = :start_date,
-                    description = :description,
-                    total_amount = :total_amount,
-                    monthly_payment = :monthly_payment
-            """
-            
-            loans_table.update_item(
-                Key={'id': loan_id},
-                UpdateExpression=update_expression,
-                ExpressionAttributeValues={
-                    ':title': body.get('title', loan['title']),
-                    ':amount': Decimal(str(principal)),
-                    ':interest_rate': Decimal(str(body.get('interest_rate', loan['interest_rate']))),
-                    ':term_months': term,
-                    ':start_date': body.get('start_date', loan['start_date']),
-                    ':description': body.get('description', loan['description']),
-                    ':total_amount': Decimal(str(total_amount)),
-                    ':monthly_payment': Decimal(str(monthly_payment))
+            },
+            {
+                'Update': {
+                    'TableName': summaries_table.name,
+                    **summary_delta_update(repayment_data['user_id'], total_repaid=amount)
                 }
+            }
+        ]
+    )
+
+    return dict(
+        {key: value for key, value in loan.items() if key not in ('next_due_date', 'due_bucket')},
+        **due_attributes,
+        total_repaid=total_repaid,
+        repayment_count=int(loan.get('repayment_count', 0)) + 1,
+        last_payment_date=last_payment_date,
+        status=new_status,
+        version=version + 1
+    )
+
+# Notifications leave the request path: handlers only record an event built from data
+# they already hold, dispatch() hands the invocation's events to SQS in one batch call
+# after the response is ready, and notifications_handler formats and publishes them to
+# SNS in batches. Without a queue (local runs) a background thread plays the worker.
+NOTIFICATIONS_QUEUE_URL = os.environ.get('NOTIFICATIONS_QUEUE_URL')
+NOTIFICATION_BATCH_SIZE = 10  # Most entries SQS SendMessageBatch and SNS PublishBatch accept
+
+_sqs = None
+_pending_notifications = []
+_local_notifications = None
+
+def get_sqs():
+    global _sqs
+    if _sqs is None:
+        _sqs = boto3.client('sqs', region_name=AWS_REGION, config=BOTO_CONFIG)
+    return _sqs
+
+def notify(notification_type, **data):
+    """Record a notification for this invocation; nothing is sent until flush_notifications"""
+    _pending_notifications.append(dict(data, type=notification_type))
+
+def discard_notifications():
+    """Drop notifications of a request that failed after recording them"""
+    _pending_notifications.clear()
+
+def flush_notifications():
+    """Hand this invocation's notifications to the queue. Never raises: a lost notification must not fail the write"""
+    if not _pending_notifications:
+        return
+    notifications = list(_pending_notifications)
+    _pending_notifications.clear()
+    if not SNS_TOPIC_ARN:
+        return
+
+    if not NOTIFICATIONS_QUEUE_URL:
+        local_queue = _get_local_notifications()
+        for notification in notifications:
+            local_queue.put(notification)
+        return
+
+    for start in range(0, len(notifications), NOTIFICATION_BATCH_SIZE):
+        chunk = notifications[start:start + NOTIFICATION_BATCH_SIZE]
+        try:
+            response = get_sqs().send_message_batch(
+                QueueUrl=NOTIFICATIONS_QUEUE_URL,
+                Entries=[
+                    {'Id': str(i), 'MessageBody': dumps_body(notification)}
+                    for i, notification in enumerate(chunk)
+                ]
             )
-            
-            response = loans_table.get_item(Key={'id': loan_id})
+            for failure in response.get('Failed', []):
+                print("Notification enqueue failed:", failure.get('Message'))
+        except Exception as e:
+            print("Notification enqueue failed:", str(e))
+
+def format_notification(notification):
+    """(subject, message) for a notification event, using only the event's own fields"""
+    kind = notification['type']
+    if kind == 'loan_created':
+        return "📄 Loan Created Successfully!", (
+            "🎉 Congratulations!\n\n"
+            "Your loan has been created successfully.\n\n"
+            f"Loan Title: {notification.get('title')}\n"
+            f"Amount: ${notification.get('amount')}\n"
+            f"Interest Rate: {notification.get('interest_rate')}%\n"
+            f"Term: {notification.get('term_months')} months\n"
+            f"Start Date: {notification.get('start_date')}\n"
+            "Status: Active\n\n"
+            "Thank you for using LoanSyncro! 😊"
+        )
+    if kind == 'loan_paid_off':
+        return "🎉 Congratulations! Loan Paid Off!", (
+            "🏆 Congratulations!\n\n"
+            f"Your loan '{notification.get('title', '')}' has been *fully paid off*!\n"
+            "We appreciate your timely repayments.\n\n"
+            "Thank you for choosing LoanSyncro! 🎊"
+        )
+    if kind == 'repayment_received':
+        return "💸 Loan Repayment Received!", (
+            "✅ Payment Received!\n\n"
+            f"Loan Title: {notification.get('title', '')}\n"
+            f"Repayment Amount: ${notification.get('amount')}\n"
+            f"Total Paid So Far: ${notification.get('total_repaid')}\n"
+            f"Outstanding Balance: ${notification.get('outstanding')}\n"
+            "Thank you for your payment! 🏦"
+        )
+    raise ValueError(f'Unknown notification type: {kind}')
+
+def publish_notifications(notifications):
+    """Publish notifications to SNS with PublishBatch; returns the indexes that failed"""
+    failed = []
+    for start in range(0, len(notifications), NOTIFICATION_BATCH_SIZE):
+        entries = []
+        for offset, notification in enumerate(notifications[start:start + NOTIFICATION_BATCH_SIZE]):
+            try:
+                subject, message = format_notification(notification)
+            except (KeyError, ValueError) as e:
+                # Malformed events would fail forever; log and drop them instead of retrying
+                print("Dropping notification:", str(e))
+                continue
+            entries.append({'Id': str(start + offset), 'Subject': subject, 'Message': message})
+        if not entries:
+            continue
+        try:
+            response = get_sns().publish_batch(TopicArn=SNS_TOPIC_ARN, PublishBatchRequestEntries=entries)
+            failed.extend(int(failure['Id']) for failure in response.get('Failed', []))
+        except Exception as e:
+            print("SNS publish failed:", str(e))
+            failed.extend(int(entry['Id']) for entry in entries)
+    return failed
+
+def _get_local_notifications():
+    global _local_notifications
+    if _local_notifications is None:
+        import queue
+        import threading
+        _local_notifications = queue.Queue()
+        threading.Thread(target=_drain_local_notifications, name='notifications', daemon=True).start()
+    return _local_notifications
+
+def _drain_local_notifications():
+    import queue
+    while True:
+        batch = [_local_notifications.get()]
+        try:
+            # Wait briefly for more events so bursts go out in one PublishBatch call
+            while len(batch) < NOTIFICATION_BATCH_SIZE:
+                batch.append(_local_notifications.get(timeout=0.05))
+        except queue.Empty:
+            pass
+        publish_notifications(batch)
+
+# Sent with a replayed response, so a client can tell it did not write anything
+IDEMPOTENT_REPLAYED_HEADER = 'Idempotent-Replayed'
+
+CORS_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization, Idempotency-Key, If-None-Match',
+    'Access-Control-Expose-Headers': f'{NEXT_CURSOR_HEADER}, {IDEMPOTENT_REPLAYED_HEADER}, ETag'
+}
+
+# Tagged responses may be kept by the browser only, and are revalidated with
+# If-None-Match before every use; an unchanged one costs a bodiless 304
+ETAG_CACHE_CONTROL = 'private, no-cache'
+
+def entity_tag(*parts):
+    """Strong ETag from the values a response is built from; equal parts must mean identical bodies"""
+    digest = hashlib.sha256('\x1f'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header lists etag or is "*"; W/ prefixes are ignored, as RFC 9110 asks"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith('W/') else tag) == etag:
+            return True
+    return False
+
+def tagged_response(request, etag, payload, headers=CORS_HEADERS):
+    """(200, payload, headers) carrying etag, or a 304 without a body if the client already holds it"""
+    headers = dict(headers, **{'ETag': etag, 'Cache-Control': ETAG_CACHE_CONTROL})
+    if etag_matches(request_header(request.event, 'if-none-match'), etag):
+        return 304, None, headers
+    return 200, payload, headers
+
+class Request:
+    """What a route handler gets: the raw event, the caller's user id and the path parameters"""
+    __slots__ = ('event', 'user_id', 'path_params', '_body')
+
+    def __init__(self, event, user_id, path_params):
+        self.event = event
+        self.user_id = user_id
+        self.path_params = path_params
+        self._body = None
+
+    @property
+    def body(self):
+        if self._body is None:
+            try:
+                # Numbers are parsed straight into Decimal so amounts never pass through float
+                self._body = json.loads(self.event.get('body') or '{}', parse_float=Decimal)
+            except ValueError:
+                raise ApiError(400, 'Request body must be valid JSON')
+        return self._body
+
+class Router:
+    """
+    Table-driven dispatch for API Gateway proxy events.
+    Routes are compiled once at import: literal paths live in a dict keyed by (method, path)
+    and templated ones ('/loans/{loan_id}') become a precompiled regex per route, tried in
+    registration order only when no literal path matches. dispatch() runs every route
+    behind the same CORS, auth-claim and error-mapping steps.
+    """
+
+    def __init__(self):
+        self._static = {}
+        self._dynamic = {}
+
+    def route(self, method, template):
+        """Register a handler(request) returning (status, payload) or (status, payload, headers)"""
+        def register(handler):
+            path = template.rstrip('/')
+            if '{' in path:
+                pattern = re.compile('^' + re.sub(r'\{(\w+)\}', r'(?P<\1>[^/]+)', path) + '$')
+                self._dynamic.setdefault(method, []).append((pattern, handler))
+            else:
+                self._static[(method, path)] = handler
+            return handler
+        return register
+
+    def match(self, method, path):
+        """Return (handler, path_params) for a request, or (None, None) if no route matches"""
+        path = path.rstrip('/')
+        handler = self._static.get((method, path))
+        if handler is not None:
+            return handler, {}
+        for pattern, handler in self._dynamic.get(method, ()):
+            found = pattern.match(path)
+            if found:
+                return handler, found.groupdict()
+        return None, None
+
+    def dispatch(self, event):
+        method = event.get('httpMethod', '')
+        if method == 'OPTIONS':
+            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': ''}
+
+        try:
+            # Get user info from Cognito authorizer
+            authorizer = (event.get('requestContext') or {}).get('authorizer') or {}
+            claims = authorizer.get('claims') or {}
+            user_id = claims.get('user_id') or claims.get('sub')
+            if not user_id:
+                raise ApiError(401, 'User ID not found in token')
+
+            handler, path_params = self.match(method, event.get('path') or '')
+            if handler is None:
+                raise ApiError(404, 'Invalid endpoint')
+
+            result = handler(Request(event, user_id, path_params))
+            status_code, payload = result[0], result[1]
+            headers = result[2] if len(result) > 2 else CORS_HEADERS
+            flush_notifications()
             return {
-                'statusCode': 200,
+                'statusCode': status_code,
                 'headers': headers,
-                'body': json.dumps(response.get('Item'), cls=DecimalEncoder)
+                'body': '' if status_code == 304 else dumps_body(payload)
             }
-        
-        elif method == 'DELETE' and path[-2] == 'loans':
-            loan_id = path[-1]
-            response = loans_table.get_item(Key={'id': loan_id})
-            loan = response.get('Item')
-            
-            if not loan:
-                return {
-                    'statusCode': 404,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Loan not found'})
-                }
-            
-            if loan['user_id'] != user_id:
-                return {
-                    'statusCode': 403,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Not authorized to delete this loan'})
-                }
-            
-            loans_table.delete_item(Key={'id': loan_id})
+        except ApiError as e:
+            discard_notifications()
             return {
-                'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps({'message': 'Loan deleted successfully'})
+                'statusCode': e.status_code,
+                'headers': CORS_HEADERS,
+                'body': json.dumps({'error': e.message})
             }
-        
-        else:
+        except Exception as e:
+            discard_notifications()
             return {
-                'statusCode': 404,
-                'headers': headers,
-                'body': json.dumps({'error': 'Invalid endpoint'})
+                'statusCode': 500,
+                'headers': CORS_HEADERS,
+                'body': json.dumps({'error': str(e)})
             }
-            
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': headers,
-            'body': json.dumps({'error': str(e)})
-        }
 
-def repayments_handler(event, context):
-    """Repayments handler with full CRUD operations"""
-    headers = {
-        'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-    }
-    
-    try:
-        if event.get('httpMethod') == 'OPTIONS':
-            return {'statusCode': 200, 'headers': headers, 'body': ''}
-        
-        # Get user info from Cognito authorizer
-        authorizer = event.get('requestContext', {}).get('authorizer', {})
-        claims = authorizer.get('claims', {})
-        user_id = claims.get('user_id') or claims.get('sub')
-        if not user_id:
-            return {
-                'statusCode': 401,
-                'headers': headers,
-                'body': json.dumps({'error': 'User ID not found in token'})
-            }
-        
-        dynamodb = boto3.resource('dynamodb', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
-        repayments_table = dynamodb.Table(os.environ.get('DYNAMODB_REPAYMENTS_TABLE', 'loansyncro-dev-repayments'))
-        loans_table = dynamodb.Table(os.environ.get('DYNAMODB_LOANS_TABLE', 'loansyncro-dev-loans'))
-        
-        path = event.get('path', '').split('/')
-        method = event.get('httpMethod', '')
-        
-        def update_loan_status(loan_id):
-            loan_response = loans_table.get_item(Key={'id': loan_id})
-            loan = loan_response.get('Item')
-            
-            if not loan:
-                return
-            
-            repayments_response = repayments_table.query(
-                IndexName='loan-id-index',
-                KeyConditionExpression='loan_id = :loan_id',
-                ExpressionAttributeValues={':loan_id': loan_id}
+def get_owned_loan(loan_id, user_id, action='access', consistent_read=False):
+    """Fetch a loan, raising 404 if it does not exist and 403 if it belongs to someone else"""
+    loan = loans_table.get_item(Key={'id': loan_id}, ConsistentRead=consistent_read).get('Item')
+    if not loan:
+        raise ApiError(404, 'Loan not found')
+    if loan['user_id'] != user_id:
+        raise ApiError(403, f'Not authorized to {action} this loan')
+    return loan
+
+# Idempotency-Key records: pending while their request runs, then completed with the
+# response to replay. The table's TTL on expires_at deletes them afterwards.
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 60 * 60)))
+# How long a request holds its key before finishing; after that a retry may run it again
+IDEMPOTENCY_LEASE_SECONDS = int(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', '60'))
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+def request_header(event, name):
+    """A request header by case-insensitive name; API Gateway keeps the client's spelling"""
+    for header, value in (event.get('headers') or {}).items():
+        if header.lower() == name:
+            return value
+    return None
+
+def claim_idempotency_key(record, now):
+    """
+    Store a pending record unless one still holds its key: completed and unexpired, or
+    pending within its lease. Returns None once claimed, otherwise that existing record.
+    """
+    # TTL deletion lags, so expired records are overwritten too
+    for _ in range(2):
+        try:
+            idempotency_table.put_item(
+                Item=record,
+                ConditionExpression=(
+                    'attribute_not_exists(#key) OR #expires_at < :now '
+                    'OR (#state = :pending AND #locked_until < :now)'
+                ),
+                ExpressionAttributeNames={
+                    '#key': 'key', '#expires_at': 'expires_at', '#state': 'state', '#locked_until': 'locked_until'
+                },
+                ExpressionAttributeValues={':now': now, ':pending': 'pending'}
             )
-            
-            total_repaid = Decimal('0')
-            for repayment in repayments_response.get('Items', []):
-                amount = repayment.get('amount', 0)
-                if not isinstance(amount, Decimal):
-                    amount = Decimal(str(amount))
-                total_repaid += amount
-            
-            loan_total = Decimal(str(loan.get('total_amount', 0))) if not isinstance(loan.get('total_amount'), Decimal) else loan.get('total_amount', 0)
-            
-            new_status = loan.get('status', 'active')
-            if total_repaid >= loan_total:
-                new_status = 'paid'
-            elif total_repaid > 0:
-                new_status = 'active'
-            
-            if new_status != loan.get('status'):
-                loans_table.update_item(
-                    Key={'id': loan_id},
-                    UpdateExpression='SET #status = :status',
-                    ExpressionAttributeNames={'#status': 'status'},
-                    ExpressionAttributeValues={':status': new_status}
-                )
+            return None
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+        existing = idempotency_table.get_item(Key={'key': record['key']}, ConsistentRead=True).get('Item')
+        if existing is not None and int(existing['expires_at']) >= now and (
+                existing['state'] == 'completed' or int(existing['locked_until']) >= now):
+            return existing
+    raise ApiError(409, 'A request with this Idempotency-Key is still in progress')
 
-                # SNS Notification: Loan Paid Off
-            if SNS_TOPIC_ARN and new_status == "paid":
-                try:
-                    sns.publish(
-                        TopicArn=SNS_TOPIC_ARN,
-                        Subject="🎉 Congratulations! Loan Paid Off!",
-                        Message=(
-                            "🏆 Congratulations!\n\n"
-                            f"Your loan '{loan.get('title', '')}' has been *fully paid off*!\n"
-                            "We appreciate your timely repayments.\n\n"
-                            "Thank you for choosing LoanSyncro! 🎊"
-                        )
-                    )
-
-                except Exception as snse:
-                    print("SNS publish failed:", str(snse))
-
-        
-        if method == 'POST' and path[-1] == 'repayments':
-            body = json.loads(event.get('body', '{}'))
-            
-            loan_response = loans_table.get_item(Key={'id': body.get('loan_id')})
-            loan = loan_response.get('Item')
-            
-            if not loan:
-                return {
-                    'statusCode': 404,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Loan not found'})
-                }
-            
-            if loan['user_id'] != user_id:
-                return {
-                    'statusCode': 403,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Not authorized to access this loan'})
-                }
-            
-            repayment_id = str(uuid.uuid4())
-            repayment_data = {
-                'id': repayment_id,
-                'loan_id': body.get('loan_id'),
-                'user_id': user_id,
-                'amount': Decimal(str(body.get('amount'))),
-                'payment_date': body.get('payment_date', datetime.utcnow().isoformat()),
-                'notes': body.get('notes', ''),
-                'created_at': datetime.utcnow().isoformat()
+def idempotent(scope):
+    """
+    Route decorator honoring an Idempotency-Key header: the first request with a key runs
+    and its response is stored; retries of the same request get that response back without
+    running the handler (so without writes or notifications). A key reused for a different
+    body is refused with 422, and one whose first request is still running with 409.
+    """
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(request):
+            idempotency_key = request_header(request.event, 'idempotency-key')
+            if not idempotency_key:
+                return handler(request)
+            if len(idempotency_key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+                raise ApiError(400, f'Idempotency-Key must be at most {MAX_IDEMPOTENCY_KEY_LENGTH} characters')
+
+            key = f'{request.user_id}#{scope}#{idempotency_key}'
+            canonical = json.dumps(request.body, sort_keys=True, cls=DecimalEncoder, separators=(',', ':'))
+            fingerprint = hashlib.sha256(canonical.encode()).hexdigest()
+            now = int(time.time())
+            # A claim's token keeps a request whose lease ran out from completing or freeing a newer claim
+            token = uuid.uuid4().hex
+            claim_condition = {
+                'ConditionExpression': '#state = :pending AND #token = :token',
+                'ExpressionAttributeNames': {'#state': 'state', '#token': 'token'},
+                'ExpressionAttributeValues': {':pending': 'pending', ':token': token}
             }
-            
-            repayments_table.put_item(Item=repayment_data)
-            update_loan_status(body.get('loan_id'))
+            existing = claim_idempotency_key({
+                'key': key,
+                'state': 'pending',
+                'token': token,
+                'request_hash': fingerprint,
+                'locked_until': now + IDEMPOTENCY_LEASE_SECONDS,
+                'expires_at': now + IDEMPOTENCY_TTL_SECONDS
+            }, now)
+            if existing is not None:
+                if existing.get('request_hash') != fingerprint:
+                    raise ApiError(422, 'Idempotency-Key was already used for a different request')
+                if existing['state'] != 'completed':
+                    raise ApiError(409, 'A request with this Idempotency-Key is still in progress')
+                # Parsed back with Decimals, the stored body re-encodes to the same bytes
+                payload = json.loads(existing['body'], parse_float=Decimal)
+                return int(existing['status_code']), payload, {**CORS_HEADERS, IDEMPOTENT_REPLAYED_HEADER: 'true'}
 
-            # SNS Notification: Repayment Made
-            if SNS_TOPIC_ARN:
+            try:
+                result = handler(request)
+            except Exception:
+                # Free the key so a retry runs again; if this fails too, the lease runs out instead
                 try:
-                    loan_response = loans_table.get_item(Key={'id': body.get('loan_id')})
-                    loan = loan_response.get('Item')
-                    total_amount = float(loan.get('total_amount', 0))
-                    repayments_response = repayments_table.query(
-                        IndexName='loan-id-index',
-                        KeyConditionExpression='loan_id = :loan_id',
-                        ExpressionAttributeValues={':loan_id': body.get('loan_id')}
-                    )
-                    total_repaid = sum(float(rep.get('amount', 0)) for rep in repayments_response.get('Items', []))
-                    outstanding = max(0, total_amount - total_repaid)
-                    sns.publish(
-                        TopicArn=SNS_TOPIC_ARN,
-                        Subject="💸 Loan Repayment Received!",
-                        Message=(
-                            "✅ Payment Received!\n\n"
-                            f"Loan Title: {loan.get('title', '')}\n"
-                            f"Repayment Amount: ${repayment_data.get('amount')}\n"
-                            f"Total Paid So Far: ${total_repaid}\n"
-                            f"Outstanding Balance: ${outstanding}\n"
-                            "Thank you for your payment! 🏦"
-                        )
-                    )
-
-                except Exception as snse:
-                    print("SNS publish failed:", str(snse))
+                    idempotency_table.delete_item(Key={'key': key}, **claim_condition)
+                except ClientError as e:
+                    if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                        print(f"Lease on idempotency key {key} was lost before it was released")
+                    else:
+                        print(f"Error releasing idempotency key {key}: {e}")
+                raise
 
-            return {
-                'statusCode': 201,
-                'headers': headers,
-                'body': json.dumps(repayment_data, cls=DecimalEncoder)
-            }
-        
-        elif method == 'GET' and path[-1] == 'repayments':
-            loans_response = loans_table.query(
-                IndexName='user-id-index',
-                KeyConditionExpression='user_id = :user_id',
-                ExpressionAttributeValues={':user_id': user_id}
-            )
-            
-            user_loan_ids = [loan['id'] for loan in loans_response.get('Items', [])]
-            all_repayments = []
-            
-            for loan_id in user_loan_ids:
-                repayments_response = repayments_table.query(
-                    IndexName='loan-id-index',
-                    KeyConditionExpression='loan_id = :loan_id',
-                    ExpressionAttributeValues={':loan_id': loan_id}
+            # The write has happened; failing to store its response only loses the replay
+            try:
+                idempotency_table.update_item(
+                    Key={'key': key},
+                    UpdateExpression='SET #state = :completed, #status_code = :status_code, #body = :body, '
+                                     '#expires_at = :expires_at',
+                    ConditionExpression=claim_condition['ConditionExpression'],
+                    ExpressionAttributeNames={
+                        **claim_condition['ExpressionAttributeNames'],
+                        '#status_code': 'status_code', '#body': 'body', '#expires_at': 'expires_at'
+                    },
+                    ExpressionAttributeValues={
+                        **claim_condition['ExpressionAttributeValues'],
+                        ':completed': 'completed',
+                        ':status_code': result[0],
+                        ':body': dumps_body(result[1]),
+                        ':expires_at': int(time.time()) + IDEMPOTENCY_TTL_SECONDS
+                    }
                 )
-                all_repayments.extend(repayments_response.get('Items', []))
-            
-            all_repayments.sort(key=lambda x: x.get('payment_date', ''), reverse=True)
-            
-            return {
-                'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps(all_repayments, cls=DecimalEncoder)
-            }
-        
-        elif method == 'GET' and path[-2] == 'repayments' and path[-1] != 'summary':
-            loan_id = path[-1]
-            loan_response = loans_table.get_item(Key={'id': loan_id})
-            loan = loan_response.get('Item')
-            
-            if not loan:
-                return {
-                    'statusCode': 404,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Loan not found'})
-                }
-            
-            if loan['user_id'] != user_id:
-                return {
-                    'statusCode': 403,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Not authorized to access this loan'})
-                }
-            
-            repayments_response = repayments_table.query(
-                IndexName='loan-id-index',
+            except ClientError as e:
+                if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                    print(f"Lease on idempotency key {key} was lost before the response was stored")
+                else:
+                    print(f"Error storing response for idempotency key {key}: {e}")
+            return result
+        return wrapper
+    return decorate
+
+loans_router = Router()
+repayments_router = Router()
+
+@loans_router.route('POST', '/loans')
+@idempotent('POST /loans')
+def create_loan(request):
+    body = request.body
+    user_id = request.user_id
+
+    principal = to_decimal(body.get('amount', 0))
+    term = int(body.get('term_months', 0))
+    monthly_payment = calculate_monthly_payment(principal, body.get('interest_rate', 0), term)
+    total_amount = monthly_payment * term
+    
+    loan_data = {
+        'id': str(uuid.uuid4()),
+        'user_id': user_id,
+        'title': body.get('title'),
+        'amount': principal,
+        'interest_rate': to_decimal(body.get('interest_rate', 0)),
+        'term_months': term,
+        'start_date': body.get('start_date', datetime.utcnow().isoformat()),
+        'description': body.get('description', ''),
+        'created_at': datetime.utcnow().isoformat(),
+        'total_amount': total_amount,
+        'monthly_payment': monthly_payment,
+        'status': 'active',
+        'total_repaid': Decimal('0'),
+        'repayment_count': 0,
+        'version': 1
+    }
+    loan_data.update(next_due_attributes(loan_data))
+    
+    loans_table.put_item(Item=loan_data)
+    apply_summary_delta(
+        summaries_table, user_id,
+        total_loans=1, total_borrowed=loan_data['amount'], total_amount=loan_data['total_amount']
+    )
+
+    notify(
+        'loan_created',
+        user_id=user_id,
+        loan_id=loan_data['id'],
+        title=loan_data.get('title'),
+        amount=loan_data.get('amount'),
+        interest_rate=loan_data.get('interest_rate'),
+        term_months=loan_data.get('term_months'),
+        start_date=loan_data.get('start_date')
+    )
+
+    return 201, loan_data
+
+@loans_router.route('GET', '/loans')
+def list_loans(request):
+    limit, start_key = parse_page_params(request.event, user_id=request.user_id)
+    loans, last_key = query_page(
+        loans_table, limit, start_key,
+        IndexName='user-id-index',
+        KeyConditionExpression='user_id = :user_id',
+        ExpressionAttributeValues={':user_id': request.user_id}
+    )
+    # Every loan write bumps its version, so the page changes only with a version, a loan or the cursor
+    etag = entity_tag(*(f"{loan['id']}:{int(loan.get('version', 0))}" for loan in loans), encode_cursor(last_key))
+    return tagged_response(request, etag, loans, page_headers(CORS_HEADERS, last_key))
+
+@loans_router.route('GET', '/loans/{loan_id}')
+def get_loan(request):
+    loan = get_owned_loan(request.path_params['loan_id'], request.user_id)
+    return tagged_response(request, entity_tag(loan['id'], int(loan.get('version', 0))), loan)
+
+@loans_router.route('PUT', '/loans/{loan_id}')
+def update_loan(request):
+    """
+    Replace a loan's terms. Status and next due date follow from the amount repaid, so
+    the loan is read once and the write is conditional on its owner and the version
+    read (redone from a fresh read if a repayment got in first); ALL_NEW returns the
+    updated loan, so it is not read again.
+    """
+    loan_id = request.path_params['loan_id']
+    body = request.body
+    loan = get_owned_loan(loan_id, request.user_id, 'update')
+    
+    for attempt in range(LOAN_WRITE_ATTEMPTS):
+        try:
+            updated_loan = write_loan_terms(loan, body, request.user_id)
+            break
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+        if attempt + 1 < LOAN_WRITE_ATTEMPTS:
+            loan = loans_table.get_item(Key={'id': loan_id}, ConsistentRead=True).get('Item')
+        if attempt + 1 == LOAN_WRITE_ATTEMPTS or loan is None or loan['user_id'] != request.user_id:
+            raise write_failed(loan_id, request.user_id, 'update')
+        time.sleep(random.uniform(0, LOAN_RETRY_BASE_SECONDS * 2 ** attempt))
+    
+    apply_summary_delta(
+        summaries_table, request.user_id,
+        total_borrowed=updated_loan['amount'] - to_decimal(loan.get('amount')),
+        total_amount=updated_loan['total_amount'] - to_decimal(loan.get('total_amount'))
+    )
+    return 200, updated_loan
+
+def write_loan_terms(loan, body, user_id):
+    """Write a PUT body's terms over a loan while it still has the owner and version read; returns it after"""
+    principal = to_decimal(body.get('amount', loan['amount']))
+    term = int(body.get('term_months', loan['term_months']))
+    monthly_payment = calculate_monthly_payment(principal, body.get('interest_rate', loan['interest_rate']), term)
+    total_amount = monthly_payment * term
+    version = int(loan.get('version', 0))
+    
+    update_expression = """
+        SET title = :title,
+            amount = :amount,
+            interest_rate = :interest_rate,
+            term_months = :term_months,
+            start_date = :start_date,
+            description = :description,
+            total_amount = :total_amount,
+            monthly_payment = :monthly_payment,
+            #status = :status
+    """
+    due_attributes = next_due_attributes({
+        'start_date': body.get('start_date', loan['start_date']),
+        'term_months': term,
+        'monthly_payment': monthly_payment,
+        'total_amount': total_amount
+    }, loan.get('total_repaid'))
+    due_set, due_remove, due_values = next_due_update(due_attributes)
+    if due_set:
+        update_expression += ', ' + due_set
+    update_expression += due_remove + ' ADD #version :one'
+    
+    return loans_table.update_item(
+        Key={'id': loan['id']},
+        UpdateExpression=update_expression,
+        # Loans written before versioning have none until their next write
+        ConditionExpression='user_id = :user_id AND ' + (
+            '(attribute_not_exists(#version) OR #version = :version)' if version == 0 else '#version = :version'
+        ),
+        ExpressionAttributeNames={'#status': 'status', '#version': 'version'},
+        ExpressionAttributeValues={
+            ':user_id': user_id,
+            ':version': version,
+            ':one': 1,
+            ':status': loan_status(
+                loan.get('total_repaid'), total_amount, loan.get('status', 'active'),
+                due_attributes.get('next_due_date')
+            ),
+            ':title': body.get('title', loan['title']),
+            ':amount': principal,
+            ':interest_rate': to_decimal(body.get('interest_rate', loan['interest_rate'])),
+            ':term_months': term,
+            ':start_date': body.get('start_date', loan['start_date']),
+            ':description': body.get('description', loan['description']),
+            ':total_amount': total_amount,
+            ':monthly_payment': monthly_payment,
+            **due_values
+        },
+        ReturnValues='ALL_NEW'
+    )['Attributes']
+
+@loans_router.route('DELETE', '/loans/{loan_id}')
+def delete_loan(request):
+    """
+    Delete a loan with one write that is conditional on its owner and returns what it
+    deleted. Its repayments stop counting towards the summary either way; with
+    ?cascade=true they are deleted too, in batches, instead of being left behind.
+    """
+    loan_id = request.path_params['loan_id']
+    try:
+        loan = loans_table.delete_item(
+            Key={'id': loan_id},
+            ConditionExpression='user_id = :user_id',
+            ExpressionAttributeValues={':user_id': request.user_id},
+            ReturnValues='ALL_OLD'
+        )['Attributes']
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        raise write_failed(loan_id, request.user_id, 'delete')
+    
+    apply_summary_delta(
+        summaries_table, request.user_id,
+        total_loans=-1,
+        total_borrowed=-to_decimal(loan.get('amount')),
+        total_amount=-to_decimal(loan.get('total_amount')),
+        total_repaid=-to_decimal(loan.get('total_repaid'))
+    )
+    
+    params = request.event.get('queryStringParameters') or {}
+    if (params.get('cascade') or '').lower() != 'true':
+        return 200, {'message': 'Loan deleted successfully'}
+    try:
+        repayments_deleted = delete_loan_repayments(loan_id)
+    except ClientError as e:
+        raise ApiError(500, f'Loan deleted, but failed to delete its repayments: {e}')
+    return 200, {'message': 'Loan deleted successfully', 'repayments_deleted': repayments_deleted}
+
+def delete_loan_repayments(loan_id):
+    """Delete every repayment of a loan, reading only their keys; returns how many were deleted"""
+    deleted, start_key = 0, None
+    # Deletes go out as BatchWriteItem requests of 25, with unprocessed ones retried
+    with repayments_table.batch_writer() as batch:
+        while True:
+            items, start_key = query_page(
+                repayments_table, MAX_PAGE_SIZE, start_key,
+                IndexName='loan-id-payment-date-index',
                 KeyConditionExpression='loan_id = :loan_id',
-                ExpressionAttributeValues={':loan_id': loan_id}
+                ExpressionAttributeValues={':loan_id': loan_id},
+                ProjectionExpression='id'
             )
-            
-            loan_repayments = repayments_response.get('Items', [])
-            loan_repayments.sort(key=lambda x: x.get('payment_date', ''), reverse=True)
-            
-            return {
-                'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps(loan_repayments, cls=DecimalEncoder)
-            }
-        
-        elif method == 'GET' and path[-1] == 'summary':
-            loans_response = loans_table.query(
-                IndexName='user-id-index',
-                KeyConditionExpression='user_id = :user_id',
-                ExpressionAttributeValues={':user_id': user_id}
-            )
-            
-            user_loans = loans_response.get('Items', [])
-            all_repayments = []
-            
-            for loan in user_loans:
-                repayments_response = repayments_table.query(
-                    IndexName='loan-id-index',
-                    KeyConditionExpression='loan_id = :loan_id',
-                    ExpressionAttributeValues={':loan_id': loan['id']}
-                )
-                all_repayments.extend(repayments_response.get('Items', []))
-            
-            total_loans = len(user_loans)
-            total_borrowed = sum(float(loan.get('amount', 0)) for loan in user_loans)
-            total_repaid = sum(float(repayment.get('amount', 0)) for repayment in all_repayments)
-            outstanding_amount = sum(float(loan.get('total_amount', 0)) for loan in user_loans) - total_repaid
-            
-            summary = {
-                'total_loans': total_loans,
-                'total_borrowed': total_borrowed,
-                'total_repaid': total_repaid,
-                'outstanding_amount': max(0, outstanding_amount),
-                'next_payment_due': None
-            }
-            
-            return {
-                'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps(summary, cls=DecimalEncoder)
-            }
-        
-        else:
-            return {
-                'statusCode': 404,
-                'headers': headers,
-                'body': json.dumps({'error': 'Invalid endpoint'})
-            }
-            
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': headers,
-            'body': json.dumps({'error': str(e)})
-        }
\ No newline at end of file
+            for item in items:
+                batch.delete_item(Key={'id': item['id']})
+                deleted += 1
+            if not start_key:
+                return deleted
+
+def write_failed(loan_id, user_id, action):
+    """
+    The error for a conditional loan write that did not apply. Only now is the loan
+    read, to tell a missing loan (404) from someone else's (403); a loan that is still
+    ours kept changing under the write (409).
+    """
+    get_owned_loan(loan_id, user_id, action, consistent_read=True)
+    return ApiError(409, f'Loan kept changing while trying to {action} it')
+
+@repayments_router.route('POST', '/repayments')
+@idempotent('POST /repayments')
+def create_repayment(request):
+    body = request.body
+    user_id = request.user_id
+    loan = get_owned_loan(body.get('loan_id'), user_id)
+    
+    repayment_id = str(uuid.uuid4())
+    repayment_data = {
+        'id': repayment_id,
+        'loan_id': body.get('loan_id'),
+        'user_id': user_id,
+        'amount': to_decimal(body.get('amount')),
+        'payment_date': body.get('payment_date', datetime.utcnow().isoformat()),
+        'notes': body.get('notes', ''),
+        'created_at': datetime.utcnow().isoformat()
+    }
+    
+    # A concurrent write to the loan cancels the transaction; redo it from a fresh read
+    for attempt in range(LOAN_WRITE_ATTEMPTS):
+        try:
+            updated_loan = record_repayment(repayments_table, loans_table, summaries_table, repayment_data, loan)
+            break
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+        if attempt + 1 < LOAN_WRITE_ATTEMPTS:
+            loan = loans_table.get_item(Key={'id': loan['id']}, ConsistentRead=True).get('Item')
+        if attempt + 1 == LOAN_WRITE_ATTEMPTS or loan is None or loan['user_id'] != user_id:
+            raise ApiError(409, 'Loan was removed, reassigned or kept changing while recording the repayment')
+        time.sleep(random.uniform(0, LOAN_RETRY_BASE_SECONDS * 2 ** attempt))
+
+    if updated_loan['status'] == 'paid' and loan.get('status') != 'paid':
+        notify('loan_paid_off', user_id=user_id, loan_id=loan['id'], title=loan.get('title', ''))
+
+    total_repaid = updated_loan['total_repaid']
+    notify(
+        'repayment_received',
+        user_id=user_id,
+        loan_id=loan['id'],
+        title=loan.get('title', ''),
+        amount=repayment_data.get('amount'),
+        total_repaid=total_repaid,
+        outstanding=max(Decimal('0'), to_decimal(loan.get('total_amount')) - total_repaid)
+    )
+
+    return 201, repayment_data
+
+@repayments_router.route('GET', '/repayments')
+def list_repayments(request):
+    user_id = request.user_id
+    limit, start_key = parse_page_params(request.event, user_id=user_id)
+    
+    if USE_USER_REPAYMENT_INDEX:
+        repayments_page, last_key = query_page(
+            repayments_table, limit, start_key,
+            IndexName='user-id-payment-date-index',
+            KeyConditionExpression='user_id = :user_id',
+            ExpressionAttributeValues={':user_id': user_id},
+            ScanIndexForward=False
+        )
+    else:
+        # Loan by loan while the user index is unavailable: most recent first within each loan
+        loan_ids = sorted(loan['id'] for loan in list_user_loans(loans_table, user_id))
+        if start_key is not None:
+            # The cursor names the loan to resume with and, mid-loan, that loan's own start key
+            loan_id, resume = start_key.get('loan_id'), start_key.get('start_key')
+            resumes_loan = resume is None or isinstance(resume, dict) and resume.get('loan_id') == loan_id
+            if loan_id not in loan_ids or not resumes_loan:
+                raise ApiError(400, 'Invalid pagination cursor')
+        repayments_page, last_key = query_loans_repayments_page(loan_ids, limit, start_key)
+        last_key = last_key and {'user_id': user_id, **last_key}
+    
+    return 200, repayments_page, page_headers(CORS_HEADERS, last_key)
+
+@repayments_router.route('GET', '/repayments/summary')
+def repayment_summary(request):
+    summary, etag = get_user_summary(summaries_table, loans_table, repayments_table, request.user_id)
+    return tagged_response(request, etag, summary)
+
+# '/repayments/{loan_id}' is the older spelling; '/summary' above is literal, so it still wins
+@repayments_router.route('GET', '/repayments/loan/{loan_id}')
+@repayments_router.route('GET', '/repayments/{loan_id}')
+def list_loan_repayments(request):
+    loan_id = request.path_params['loan_id']
+    limit, start_key = parse_page_params(request.event, loan_id=loan_id)
+    get_owned_loan(loan_id, request.user_id)
+    
+    loan_repayments, last_key = query_page(
+        repayments_table, limit, start_key,
+        IndexName='loan-id-payment-date-index',
+        KeyConditionExpression='loan_id = :loan_id',
+        ExpressionAttributeValues={':loan_id': loan_id},
+        ScanIndexForward=False
+    )
+    return 200, loan_repayments, page_headers(CORS_HEADERS, last_key)
+
+@report_timing
+def loans_handler(event, context):
+    """Loans handler with full CRUD operations"""
+    return loans_router.dispatch(event)
+
+@report_timing
+def repayments_handler(event, context):
+    """Repayments handler with full CRUD operations"""
+    return repayments_router.dispatch(event)
+
+@report_timing
+def notifications_handler(event, context):
+    """SQS-triggered worker that publishes queued notifications to SNS in batches"""
+    records = event.get('Records', [])
+    notifications = []
+    failures = []
+    for record in records:
+        try:
+            notifications.append((record['messageId'], json.loads(record['body'], parse_float=Decimal)))
+        except ValueError as e:
+            print("Dropping unreadable notification:", str(e))
+
+    failed = publish_notifications([notification for _, notification in notifications])
+    for index in failed:
+        failures.append({'itemIdentifier': notifications[index][0]})
+    # Only the failed messages return to the queue (ReportBatchItemFailures)
+    return {'batchItemFailures': failures}
+
+# Everything above runs once per container; report_timing attaches this to cold starts
+INIT_DURATION_MS = (time.perf_counter() - _INIT_STARTED_AT) * 1000
@@ -0,0 +1,28 @@
+# SQS Queue: Notifications
+# API handlers enqueue notification events here instead of publishing to SNS inside
+# the request; the notifications worker Lambda formats and publishes them in batches.
+resource "aws_sqs_queue" "notifications_dlq" {
+  name                      = "${local.name_prefix}-notifications-dlq"
+  message_retention_seconds = 1209600
+  sqs_managed_sse_enabled   = true
+
+  tags = merge(local.common_tags, {
+    Name = "${local.name_prefix}-notifications-dlq"
+  })
+}
+
+resource "aws_sqs_queue" "notifications" {
+  name                       = "${local.name_prefix}-notifications"
+  visibility_timeout_seconds = var.lambda_timeout * 6
+  message_retention_seconds  = 345600
+  sqs_managed_sse_enabled    = true
+
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.notifications_dlq.arn
+    maxReceiveCount     = 5
+  })
+
+  tags = merge(local.common_tags, {
+    Name = "${local.name_prefix}-notifications"
+  })
+}
@@ -32,6 +32,17 @@ resource "aws_cloudwatch_log_group" "repayments_logs" {
   })
 }
 
+resource "aws_cloudwatch_log_group" "notifications_logs" {
+  name              = "/aws/lambda/${local.name_prefix}-notifications"
+  retention_in_days = var.log_retention_days
+  # kms_key_id        = aws_kms_key.main.arn
+
+  tags = merge(local.common_tags, {
+    Name     = "${local.name_prefix}-notifications-logs"
+    Function = "Notifications"
+  })
+}
+
 resource "aws_sns_topic_subscription" "alerts_email" {
   topic_arn = aws_sns_topic.alerts.arn
   protocol  = "email"
@@ -93,3 +104,63 @@ resource "aws_cloudwatch_metric_alarm" "api_gateway_errors" {
     AlarmType = "APIGatewayErrors"
   })
 }
+
+# Performance: cold vs warm invocation cost, from the invocation_timing lines lambda_function.py logs
+locals {
+  timed_lambda_log_groups = {
+    loans         = aws_cloudwatch_log_group.loans_logs.name
+    repayments    = aws_cloudwatch_log_group.repayments_logs.name
+    notifications = aws_cloudwatch_log_group.notifications_logs.name
+  }
+}
+
+resource "aws_cloudwatch_log_metric_filter" "cold_start_duration" {
+  for_each       = local.timed_lambda_log_groups
+  name           = "${local.name_prefix}-${each.key}-cold-start-duration"
+  log_group_name = each.value
+  pattern        = "{ $.event = \"invocation_timing\" && $.cold_start IS TRUE }"
+
+  metric_transformation {
+    name      = "ColdStartDuration"
+    namespace = "LoanSyncro/Lambda"
+    value     = "$.duration_ms"
+    unit      = "Milliseconds"
+    dimensions = {
+      Handler = "$.handler"
+    }
+  }
+}
+
+resource "aws_cloudwatch_log_metric_filter" "init_duration" {
+  for_each       = local.timed_lambda_log_groups
+  name           = "${local.name_prefix}-${each.key}-init-duration"
+  log_group_name = each.value
+  pattern        = "{ $.event = \"invocation_timing\" && $.cold_start IS TRUE }"
+
+  metric_transformation {
+    name      = "InitDuration"
+    namespace = "LoanSyncro/Lambda"
+    value     = "$.init_ms"
+    unit      = "Milliseconds"
+    dimensions = {
+      Handler = "$.handler"
+    }
+  }
+}
+
+resource "aws_cloudwatch_log_metric_filter" "warm_duration" {
+  for_each       = local.timed_lambda_log_groups
+  name           = "${local.name_prefix}-${each.key}-warm-duration"
+  log_group_name = each.value
+  pattern        = "{ $.event = \"invocation_timing\" && $.cold_start IS FALSE }"
+
+  metric_transformation {
+    name      = "WarmDuration"
+    namespace = "LoanSyncro/Lambda"
+    value     = "$.duration_ms"
+    unit      = "Milliseconds"
+    dimensions = {
+      Handler = "$.handler"
+    }
+  }
+}
@@ -60,6 +60,7 @@ resource "aws_iam_role_policy" "lambda_policy" {
           "dynamodb:PutItem",
           "dynamodb:UpdateItem",
           "dynamodb:DeleteItem",
+          "dynamodb:BatchWriteItem",
           "dynamodb:Query",
           "dynamodb:Scan"
         ]
@@ -67,6 +68,8 @@ resource "aws_iam_role_policy" "lambda_policy" {
           aws_dynamodb_table.users.arn,
           aws_dynamodb_table.loans.arn,
           aws_dynamodb_table.repayments.arn,
+          aws_dynamodb_table.summaries.arn,
+          aws_dynamodb_table.idempotency.arn,
           "${aws_dynamodb_table.users.arn}/index/*",
           "${aws_dynamodb_table.loans.arn}/index/*",
           "${aws_dynamodb_table.repayments.arn}/index/*"
@@ -107,6 +110,16 @@ resource "aws_iam_role_policy" "lambda_policy" {
           "sns:Publish"
         ]
         Resource = aws_sns_topic.alerts.arn
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "sqs:SendMessage",
+          "sqs:ReceiveMessage",
+          "sqs:DeleteMessage",
+          "sqs:GetQueueAttributes"
+        ]
+        Resource = aws_sqs_queue.notifications.arn
       }
     ]
   })
@@ -55,12 +55,37 @@ resource "aws_dynamodb_table" "loans" {
     type = "S"
   }
 
+  attribute {
+    name = "due_bucket"
+    type = "S"
+  }
+
+  attribute {
+    name = "next_due_date"
+    type = "S"
+  }
+
   global_secondary_index {
     name            = "user-id-index"
     hash_key        = "user_id"
     projection_type = "ALL"
   }
 
+  # Sparse due-date indexes: only loans with an installment outstanding carry next_due_date
+  global_secondary_index {
+    name            = "due-bucket-next-due-date-index"
+    hash_key        = "due_bucket"
+    range_key       = "next_due_date"
+    projection_type = "ALL"
+  }
+
+  global_secondary_index {
+    name            = "user-id-next-due-date-index"
+    hash_key        = "user_id"
+    range_key       = "next_due_date"
+    projection_type = "KEYS_ONLY"
+  }
+
   server_side_encryption {
     enabled     = true
     kms_key_arn = aws_kms_key.main.arn
@@ -93,12 +118,38 @@ resource "aws_dynamodb_table" "repayments" {
     type = "S"
   }
 
+  attribute {
+    name = "user_id"
+    type = "S"
+  }
+
+  attribute {
+    name = "payment_date"
+    type = "S"
+  }
+
   global_secondary_index {
     name            = "loan-id-index"
     hash_key        = "loan_id"
     projection_type = "ALL"
   }
 
+  # Performance: page through a loan's repayments newest-first
+  global_secondary_index {
+    name            = "loan-id-payment-date-index"
+    hash_key        = "loan_id"
+    range_key       = "payment_date"
+    projection_type = "ALL"
+  }
+
+  # Performance: list a user's repayments newest-first in one query
+  global_secondary_index {
+    name            = "user-id-payment-date-index"
+    hash_key        = "user_id"
+    range_key       = "payment_date"
+    projection_type = "ALL"
+  }
+
   server_side_encryption {
     enabled     = true
     kms_key_arn = aws_kms_key.main.arn
@@ -115,6 +166,34 @@ resource "aws_dynamodb_table" "repayments" {
   })
 }
 
+# DynamoDB Table: Per-user portfolio summaries
+# Performance: maintained incrementally on loan/repayment writes so the dashboard is one GetItem
+resource "aws_dynamodb_table" "summaries" {
+  name           = "${local.name_prefix}-summaries"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "user_id"
+
+  attribute {
+    name = "user_id"
+    type = "S"
+  }
+
+  server_side_encryption {
+    enabled     = true
+    kms_key_arn = aws_kms_key.main.arn
+  }
+
+  point_in_time_recovery {
+    enabled = true
+  }
+
+  tags = merge(local.common_tags, {
+    Name      = "${local.name_prefix}-summaries"
+    DataType  = "FinancialData"
+    Sensitive = "true"
+  })
+}
+
 # S3 Bucket for file storage
 resource "aws_s3_bucket" "storage" {
   bucket = "${local.name_prefix}-storage-${random_string.suffix.result}"
@@ -176,3 +255,31 @@ resource "aws_s3_bucket_lifecycle_configuration" "storage" {
     }
   }
 }
+
+# Idempotency-Key records for POST /loans and POST /repayments; TTL removes them a day after use
+resource "aws_dynamodb_table" "idempotency" {
+  name           = "${local.name_prefix}-idempotency"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "key"
+
+  attribute {
+    name = "key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  server_side_encryption {
+    enabled     = true
+    kms_key_arn = aws_kms_key.main.arn
+  }
+
+  tags = merge(local.common_tags, {
+    Name      = "${local.name_prefix}-idempotency"
+    DataType  = "FinancialData"
+    Sensitive = "true"
+  })
+}
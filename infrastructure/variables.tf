@@ -64,6 +64,12 @@ variable "lambda_memory_size" {
   default     = 128
 }
 
+variable "lambda_layer_arns" {
+  description = "Optional Lambda layers for the API handlers, e.g. one providing orjson for faster JSON responses"
+  type        = list(string)
+  default     = []
+}
+
 variable "log_retention_days" {
   description = "CloudWatch log retention in days"
   type        = number